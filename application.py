@@ -1,25 +1,262 @@
-from flask import Flask, render_template, session, url_for
+from flask import Flask, Response, g, jsonify, render_template as _render_template, request, session, url_for
+from flask.sessions import SecureCookieSessionInterface
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_wtf import FlaskForm
-from wtforms import FloatField, StringField, SubmitField
+from wtforms import FloatField, HiddenField, StringField, SubmitField
 from wtforms.validators import DataRequired, Optional, NumberRange
 
 app = Flask(__name__, template_folder = "templates")
 app.config["SECRET_KEY"] = "d3b157034a1d5e676a229d3c9653042c"
+# Search results are kept server-side; the session only holds the search ID and index.
+# RESULT_STORE is either "sqlite" (shared between workers) or "memory" (per worker process), which only
+# works when the app runs in a single process, since Next and Prev clicks can reach any worker.
+app.config["RESULT_STORE"] = "sqlite"
+app.config["RESULT_STORE_PATH"] = "instance/results.sqlite3"
+app.config["RESULT_STORE_TTL"] = 3600
+app.config["RESULT_STORE_SIZE"] = 1024
+# Cache of Foursquare explore responses shared by users searching near each other. Like the details
+# cache, either "sqlite" (shared by every worker and by warm_cache.py) or "memory" (per worker process).
+app.config["EXPLORE_CACHE"] = "sqlite"
+app.config["EXPLORE_CACHE_PATH"] = "instance/explore.sqlite3"
+# Cache of Foursquare venue details shared by all users, keyed by venue ID.
+app.config["DETAILS_CACHE"] = "sqlite"
+app.config["DETAILS_CACHE_PATH"] = "instance/details.sqlite3"
+# Local index of venues from earlier responses, used when Foursquare fails or to add results. Each worker
+# process keeps its own index of at most VENUE_INDEX_SIZE venues. VENUE_INDEX_PATH optionally names a JSON
+# file of venues imported at startup and saved every VENUE_INDEX_SAVE_INTERVAL seconds and at exit.
+app.config["VENUE_INDEX"] = False
+app.config["VENUE_INDEX_PATH"] = None
+app.config["VENUE_INDEX_SIZE"] = 20000
+app.config["VENUE_INDEX_SAVE_INTERVAL"] = 300
+app.config["SEARCH_MODE"] = "fallback"
+# Client-side rate limiter for Foursquare calls, either "sqlite" (one quota shared by every worker) or
+# "memory" (per worker process), which only keeps to the quota when the app runs in a single process.
+app.config["RATE_LIMITER"] = "sqlite"
+app.config["RATE_LIMITER_PATH"] = "instance/ratelimit.sqlite3"
+# Add a Server-Timing header listing the time spent in each span of the request.
+app.config["SERVER_TIMING"] = False
+# Use the asyncio backend, which fetches details for the first few suggestions concurrently.
+app.config["ASYNC_BACKEND"] = False
+# A new search for the same query reuses the session's previous results, re-ranking the venues not
+# yet shown, when the user has moved less than this fraction of the previous radius. 0 disables it.
+app.config["RERANK_DRIFT_FRACTION"] = 0.1
+# Append each search to a JSON lines log at SEARCH_LOG_PATH, which warm_cache.py reads to
+# warm the caches with the searches most often made.
+app.config["SEARCH_LOG"] = False
+app.config["SEARCH_LOG_PATH"] = "instance/searches.jsonl"
+# Number of proxies in front of the app, such as Heroku's router, that append the address they received a request from
+# to X-Forwarded-For. Only addresses appended by them are trusted as the client's address, since clients can send any.
+app.config["TRUSTED_PROXIES"] = 1
 
 """
 Accessing Backend Functions
 """
-import sys
-sys.path.insert(0, "./backend")
-from get_current_location import get_location_data
-from search_for_venues import nearby_venues, get_details, distance_weighted_order
-from utils import Venue, venues_to_dicts, dicts_to_venues, miles_to_meters
+import os
+import time
+import uuid
+from backend import search_for_venues
+from backend.batch_suggest import DEFAULT_SUGGESTIONS, suggest_batch
+from backend.cache import create_cache
+from backend.get_current_location import LOCATION_TTL, client_ip, is_valid_location, lookup_location
+from backend.instrumentation import histogram, increment, render_prometheus, request_spans, server_timing_header, span, start_request
+from backend.lazy import lazy_import
+from backend.rate_limiter import create_rate_limiter
+from backend.search_for_venues import nearby_venues, get_details, prefetch_details, distance_weighted_order, details_version,\
+    load_cached_details
+from backend.search_log import SearchLog
+from backend.utils import Venue, miles_to_meters
+from backend.venue_index import VenueIndex
+from backend.venue_stream import FIRST_PAGE_SIZE, VenueStream
+
+# Only imported by the first request that uses it, since it loads httpx.
+async_backend = lazy_import("backend.async_backend")
 
 """
 Constants for Errors 
 """
 API_REQUEST = 0
 NO_VENUES = 1
+NO_LOCATION = 2
+
+# Venues whose details show they are closed are skipped at most this many times for the first suggestion of a search.
+MAX_CLOSED_SKIPS = 3
+
+"""
+Instrumentation
+"""
+class TimedSessionInterface(SecureCookieSessionInterface):
+    # Cookie session that times decoding and encoding the session. Opening the session is the
+    # first step of a request and saving it is the last, so spans are started and reported here.
+    def open_session(self, app, request):
+        start_request()
+        with span("session_decode"):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with span("session_encode"):
+            super().save_session(app, session, response)
+        if app.config["SERVER_TIMING"]:
+            response.headers["Server-Timing"] = server_timing_header(request_spans())
+
+app.session_interface = TimedSessionInterface()
+
+def render_template(template_name, **context):
+    # Renders template, timing it as the render_template span
+    with span("render_template"):
+        return _render_template(template_name, **context)
+
+def render_cached(key, template_name, **context):
+    # Returns template rendered with context from render_cache under key, rendering it on a miss (Markup)
+    html = render_cache.get(key)
+    if html is None:
+        html = render_template(template_name, **context)
+        render_cache.set(key, html)
+    return Markup(html)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    histogram("request_seconds", "Time spent handling requests, by view.").observe(
+        time.perf_counter() - g.request_start, {"endpoint": request.endpoint or "unknown", "method": request.method})
+    return response
+
+"""
+Server-side Store for Search Results
+"""
+# Rendered venue cards and details, shared by every session in this worker process. Cards only
+# depend on the venue, and details renders are keyed by the details' version.
+RENDER_CACHE_SIZE = 2048
+render_cache = create_cache("memory", max_entries = RENDER_CACHE_SIZE, ttl = search_for_venues.DETAILS_CACHE_TTL, name = "render")
+result_store = create_cache(app.config["RESULT_STORE"], path = app.config["RESULT_STORE_PATH"],
+    max_entries = app.config["RESULT_STORE_SIZE"], ttl = app.config["RESULT_STORE_TTL"], name = "results")
+
+search_for_venues.explore_cache = create_cache(app.config["EXPLORE_CACHE"], path = app.config["EXPLORE_CACHE_PATH"],
+    max_entries = search_for_venues.EXPLORE_CACHE_SIZE, ttl = search_for_venues.EXPLORE_CACHE_TTL,
+    stale_ttl = search_for_venues.EXPLORE_CACHE_STALE_TTL, name = "explore")
+search_for_venues.details_cache = create_cache(app.config["DETAILS_CACHE"], path = app.config["DETAILS_CACHE_PATH"],
+    max_entries = search_for_venues.DETAILS_CACHE_SIZE, ttl = search_for_venues.DETAILS_CACHE_TTL, name = "details")
+search_for_venues.rate_limiter = create_rate_limiter(app.config["RATE_LIMITER"], path = app.config["RATE_LIMITER_PATH"],
+    name = "foursquare")
+if app.config["VENUE_INDEX"]:
+    search_for_venues.venue_index = VenueIndex(app.config["VENUE_INDEX_SIZE"])
+    if app.config["VENUE_INDEX_PATH"]:
+        if os.path.exists(app.config["VENUE_INDEX_PATH"]):
+            search_for_venues.venue_index.import_json(app.config["VENUE_INDEX_PATH"])
+        search_for_venues.venue_index.autosave(app.config["VENUE_INDEX_PATH"], app.config["VENUE_INDEX_SAVE_INTERVAL"])
+search_for_venues.SEARCH_MODE = app.config["SEARCH_MODE"]
+search_log = SearchLog(app.config["SEARCH_LOG_PATH"]) if app.config["SEARCH_LOG"] else None
+if app.config["TRUSTED_PROXIES"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for = app.config["TRUSTED_PROXIES"])
+
+def save_search(search):
+    # Stores search under a new opaque ID, which is the only reference kept in the session
+    session["search_id"] = uuid.uuid4().hex
+    result_store.set(session["search_id"], search)
+
+def load_search():
+    # Returns the stored search for this session, or None if there is none or it has expired
+    search_id = session.get("search_id", None)
+    if search_id is None:
+        return None
+    return result_store.get(search_id)
+
+def search_venues(query, radius, limit = FIRST_PAGE_SIZE):
+    # Returns first page of venues near the session's location in suggested order, or the error returned by nearby_venues
+    if app.config["ASYNC_BACKEND"]:
+        return async_backend.run(async_backend.search(session["location_data"], query, radius, session["original_location"], limit = limit))
+    venues = nearby_venues(session["location_data"], query, radius, limit)
+    if venues == "API Usage Exceeded" or len(venues) == 0:
+        return venues
+    return distance_weighted_order(venues, session["original_location"])
+
+def open_suggestion(search, index, attempts = MAX_CLOSED_SKIPS + 1):
+    # Fetches details of the venue at index, dropping it for the venue after it while its details show it is closed now,
+    # at most attempts times. Returns the venue, None if no venues remain, or 'API Usage Exceeded' (Venue / None / string)
+    for _ in range(attempts):
+        if index >= len(search.venues):
+            return None
+        suggested = search.venues[index]
+        if suggested.details == None and get_details(suggested) == "API Usage Exceeded":
+            return "API Usage Exceeded"
+        if not search.drop_closed(index, 1):
+            return suggested
+    return search.venues[index] if index < len(search.venues) else None
+
+def rerank_search(query, radius):
+    # Returns the session's previous search re-ranked for a new search of query from the session's location,
+    # and the index of its first unseen venue, or (None, 0) if new results are needed (tuple)
+    previous = load_search()
+    if previous is None or app.config["RERANK_DRIFT_FRACTION"] <= 0:
+        return None, 0
+    seen = session.get("seen_index", session.get("suggested_index", 0)) + 1
+    search = previous.rerank(query, radius, session["original_location"], seen, app.config["RERANK_DRIFT_FRACTION"])
+    increment("rerank_total", {"result": "reused" if search is not None else "refetched"},
+        description = "Searches that followed an earlier search in the session, by whether its venues were reused.")
+    return search, min(seen, len(previous.venues))
+
+def shown_index(search, form):
+    # Returns the index of the suggestion the Next or Prev form was submitted from, so a form submitted again after
+    # a failed fragment request moves from the same suggestion, or the session's index if it has none (int)
+    try:
+        index = int(form.index.data)
+    except (TypeError, ValueError):
+        return session["suggested_index"]
+    return max(0, min(index, len(search.venues) - 1))
+
+def move_suggestion(search, step, index):
+    # Moves the session's suggestion index back (step -1) or forward (step 1) from index, loading more venues when needed.
+    # Returns whether the Prev and Next buttons are shown for the new suggestion (tuple (bool, bool))
+    if step < 0:
+        session["suggested_index"] = max(index - 1, 0)
+        return session["suggested_index"] > 0, True
+    # Upcoming venues whose prefetched details show they are closed are dropped before more are loaded
+    dropped = search.drop_closed(index + 1)
+    if search.ensure(index + 1) or dropped:
+        # More venues were loaded for this search, or closed ones removed
+        result_store.set(session["search_id"], search)
+    show_next = search.has_next(index + 1)
+    session["suggested_index"] = min(index + 1, len(search.venues) - 1)
+    session["seen_index"] = max(session.get("seen_index", 0), session["suggested_index"])
+    return True, show_next
+
+def venue_details_html(venue):
+    # Returns venue's rendered details from render_cache, keyed by the details' version (Markup)
+    return render_cached("details|{0}|{1}".format(venue.get_id(), details_version(venue)), "_venue_details.html", venue = venue)
+
+def suggestion_buttons(prev_venue, next_venue, show_prev, show_next):
+    # Returns the Prev and Next forms for _suggestion.html, each recording the suggestion it is shown with, or None
+    # where a button is hidden (dictionary)
+    prev_venue.index.data = next_venue.index.data = session["suggested_index"]
+    return {"prev_venue": prev_venue if show_prev else None, "next_venue": next_venue if show_next else None}
+
+def suggestion_context(venue):
+    # Returns context for _suggestion.html: the venue's rendered card, and its details if they have been fetched (dictionary)
+    return {
+        "card_html": render_cached("card|{0}".format(venue.get_id()), "_venue_card.html", venue = venue),
+        "details_html": venue_details_html(venue) if details_version(venue) is not None else None,
+        "details_url": url_for("suggestion_details", venue_id = venue.get_id())
+    }
+
+def ensure_location():
+    # Looks up the client's location unless the session already has a fresh one for the same IP.
+    # Returns whether usable location data is in the session.
+    ip_address = client_ip(request.remote_addr)
+    if session.get("location_ip", None) == ip_address\
+        and time.time() - session.get("location_time", 0) < LOCATION_TTL\
+        and is_valid_location(session.get("location_data", {})):
+        return True
+    location_data = lookup_location(ip_address)
+    if not is_valid_location(location_data):
+        return False
+    session["location_data"] = location_data
+    session["location_ip"] = ip_address
+    session["location_time"] = time.time()
+    session["original_location"] = (location_data["latitude"], location_data["longitude"])
+    return True
 
 """
 Form Class for Main Page
@@ -30,9 +267,11 @@ class TakeQuery(FlaskForm):
     submit = SubmitField("Give me some suggestions!")
 
 class NextVenue(FlaskForm):
+    index = HiddenField()
     next_query = SubmitField("Next Suggestion")
 
 class PrevVenue(FlaskForm):
+    index = HiddenField()
     prev_query = SubmitField("Previous Suggestion")
 
 @app.route("/home")
@@ -50,75 +289,126 @@ def home():
     next_venue = NextVenue()
     prev_venue = PrevVenue()
     
-    # Repeatedly attempt to get IP address until successful 
-    session["location_data"] = {}
-    while "timestamp" not in session["location_data"].keys()\
-        or "latitude" not in session["location_data"].keys()\
-        or "longitude" not in session["location_data"].keys()\
-        or "city" not in session["location_data"].keys():
-        session["location_data"] = get_location_data()
-    session["original_location"] = (session["location_data"]["latitude"], session["location_data"]["longitude"])
+    # Location is only looked up when the session has none or it has gone stale
+    if not ensure_location():
+        return render_template("home.html", form = form, error_status = NO_LOCATION)
     
     if form.validate_on_submit():
         # Case where main button is clicked 
-        session["venues"] = []
-
-        # No venues observed yet, get list of venues
-        while len(session["venues"]) == 0:
-            session["query"] = form.query.data
-            session["radius"] = miles_to_meters(form.radius.data)
-            # nearby_venues returns list of venues, converts to list of dictionaries to store as session variable 
-            session["venues"] = venues_to_dicts(nearby_venues(session["location_data"], session["query"], session["radius"]))
-            if session["venues"] == "API Usage Exceeded":
+        query = form.query.data
+        radius = miles_to_meters(form.radius.data)
+        # Searches near the previous one reuse its venues, continuing after those already seen
+        search, index = rerank_search(query, radius)
+        if search_log is not None:
+            search_log.record(session["location_data"], query, radius, reused = search is not None)
+        if search is None:
+            # search_venues returns the first page of venues in the order they are suggested
+            venues = search_venues(query, radius)
+            if venues == "API Usage Exceeded":
                 # Case that API does not allow new requests, nothing to do 
                 return render_template("home.html", form = form, error_status = API_REQUEST)
-            if session["venues"] == []:
+            if len(venues) == 0:
                 # Case that there are no venues found 
                 return render_template("home.html", form = form, error_status = NO_VENUES)
-            session["venues"] = venues_to_dicts(distance_weighted_order(dicts_to_venues(session["venues"]), session["original_location"]))
+            # Further pages are fetched as the user clicks through suggestions
+            search, index = VenueStream(session["location_data"], query, radius, session["original_location"], venues), 0
 
         # Successfully acquired list of venues at this point 
-        session["suggested_index"] = 0
-        suggested = dicts_to_venues(session["venues"])[session["suggested_index"]]
-        if suggested.details == None:
-            if get_details(suggested) == "API Usage Exceeded":
-                # Case that API does not allow new requests, nothing to do 
-                return render_template("home.html", form = form, error_status = API_REQUEST)
-        suggested.assign_members()
-        if len(session["venues"]) == 1:
-            return render_template("home.html", form = form, suggested = suggested)
-        return render_template("home.html", form = form, next_venue = next_venue, suggested = suggested)
+        suggested = open_suggestion(search, index)
+        if suggested == "API Usage Exceeded":
+            # Case that API does not allow new requests, nothing to do 
+            return render_template("home.html", form = form, error_status = API_REQUEST)
+        if suggested is None:
+            # Case that every venue found is closed 
+            return render_template("home.html", form = form, error_status = NO_VENUES)
+        save_search(search)
+        session["suggested_index"] = session["seen_index"] = index
+        prefetch_details(search.venues, session["suggested_index"] + 1)
+        return render_template("home.html", form = form, suggested = suggested,
+            **suggestion_buttons(prev_venue, next_venue, index > 0, search.has_next(index)), **suggestion_context(suggested))
+
+    search = load_search()
+    if search is None:
+        # Case where there is no search for this session, or it has expired
+        return render_template("home.html", form = form)
 
     if prev_venue.prev_query.data and prev_venue.validate():
         # Case where 'prev venue' button is clicked
-        if session["suggested_index"] <= 1:
-            # Case where there are no prev venues following this query
-            session["suggested_index"] = max(session["suggested_index"] - 1, 0)
-            return render_template("home.html", form = form, next_venue = next_venue, suggested = dicts_to_venues(session["venues"])[session["suggested_index"]])
-        session["suggested_index"] -= 1
-        suggested = dicts_to_venues(session["venues"])[session["suggested_index"]]
-        if suggested.details == None:
-            if get_details(suggested) == "API Usage Exceeded":
-                # Case that API does not allow new requests, nothing to do 
-                return render_template("home.html", form = form, error_status = API_REQUEST)
-        return render_template("home.html", form = form, prev_venue = prev_venue, next_venue = next_venue, suggested = suggested)
-
-    if next_venue.next_query.data and next_venue.validate():
+        step, index = -1, shown_index(search, prev_venue)
+    elif next_venue.next_query.data and next_venue.validate():
         # Case where 'next venue' button is clicked
-        if session["suggested_index"] >= len(session["venues"]) - 2:
-            # Case where there are no next venues following this query
-            session["suggested_index"] = min(session["suggested_index"] + 1, len(session["venues"]) - 1)
-            return render_template("home.html", form = form, prev_venue = prev_venue, suggested = dicts_to_venues(session["venues"])[session["suggested_index"]])
-        session["suggested_index"] += 1
-        suggested = dicts_to_venues(session["venues"])[session["suggested_index"]]
-        if suggested.details == None:
-            if get_details(suggested) == "API Usage Exceeded":
-                # Case that API does not allow new requests, nothing to do 
-                return render_template("home.html", form = form, error_status = API_REQUEST)
-        return render_template("home.html", form = form, prev_venue = prev_venue, next_venue = next_venue, suggested = suggested)
+        step, index = 1, shown_index(search, next_venue)
+    else:
+        # Default case where neither button has been clicked
+        return render_template("home.html", form = form)
+    show_prev, show_next = move_suggestion(search, step, index)
+    suggested = search.venues[session["suggested_index"]]
+    if suggested.details == None:
+        if get_details(suggested) == "API Usage Exceeded":
+            # Case that API does not allow new requests, nothing to do 
+            return render_template("home.html", form = form, error_status = API_REQUEST)
+        result_store.set(session["search_id"], search)
+    if step > 0:
+        prefetch_details(search.venues, session["suggested_index"] + 1)
+    return render_template("home.html", form = form, suggested = suggested,
+        **suggestion_buttons(prev_venue, next_venue, show_prev, show_next), **suggestion_context(suggested))
+
+@app.route("/suggestion", methods = ["POST"])
+def suggestion():
+    # Handles the Next and Prev buttons without reloading the page, returning only the suggestion card.
+    # Details are included if they are already cached, and are otherwise loaded from suggestion_details.
+    next_venue = NextVenue()
+    prev_venue = PrevVenue()
+    search = load_search()
+    if search is None:
+        return "", 404
+    if prev_venue.prev_query.data and prev_venue.validate():
+        step, index = -1, shown_index(search, prev_venue)
+    elif next_venue.next_query.data and next_venue.validate():
+        step, index = 1, shown_index(search, next_venue)
+    else:
+        return "", 400
+    show_prev, show_next = move_suggestion(search, step, index)
+    suggested = search.venues[session["suggested_index"]]
+    load_cached_details(suggested)
+    if step > 0:
+        prefetch_details(search.venues, session["suggested_index"] + 1)
+    return render_template("_suggestion.html", **suggestion_buttons(prev_venue, next_venue, show_prev, show_next),
+        **suggestion_context(suggested))
+
+@app.route("/suggestion/details/<venue_id>")
+def suggestion_details(venue_id):
+    # Details of a venue in this session's search, rendered for the suggestion card
+    search = load_search()
+    if search is None or venue_id not in search.venues.ids:
+        return "", 404
+    venue = search.venues[search.venues.ids.index(venue_id)]
+    if not load_cached_details(venue):
+        if get_details(venue) == "API Usage Exceeded":
+            return '<p class="venue-details">Details for this venue are unavailable right now.</p>', 503
+        result_store.set(session["search_id"], search)
+    return venue_details_html(venue)
+
+@app.route("/metrics")
+def metrics():
+    # Metrics of this worker process in the Prometheus text format
+    return Response(render_prometheus(), content_type = "text/plain; version=0.0.4; charset=utf-8")
 
-    # Default case where neither button has been clicked
-    return render_template("home.html", form = form)
+@app.route("/api/suggest", methods = ["POST"])
+def api_suggest():
+    # Suggestions for a batch of searches, given as JSON {"searches": [{"latitude", "longitude", "query",
+    # "radius" (meters), "city" (optional)}, ...], "limit": suggestions per search (optional)}
+    payload = request.get_json(silent = True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("searches", None), list):
+        return jsonify(error = "Expected a JSON object with a list of 'searches'."), 400
+    limit = payload.get("limit", DEFAULT_SUGGESTIONS)
+    if not isinstance(limit, int) or not 0 < limit <= 50:
+        return jsonify(error = "'limit' must be an integer between 1 and 50."), 400
+    try:
+        results = suggest_batch(payload["searches"], limit)
+    except ValueError as e:
+        return jsonify(error = str(e)), 400
+    return jsonify(results = [{"venues": result["venues"].to_dicts()} if "venues" in result else result for result in results])
 
 @app.route("/about", methods = ["POST", "GET"])
 def about():
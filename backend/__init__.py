@@ -0,0 +1,5 @@
+"""
+Backend of the venue suggester: API clients for Foursquare and ipdata, caches, and the ordering
+of venues. Importing the package, or any of its modules, does not import NumPy; modules that use it
+load it with lazy.lazy_import on first use, so a cold worker starts serving sooner.
+"""
@@ -0,0 +1,263 @@
+"""
+Asynchronous versions of the backend API calls, built on a shared httpx.AsyncClient.
+Coroutines run on one background event loop, so pooled connections are reused across
+requests and sync Flask views can wait on them with run.
+"""
+
+import asyncio
+import threading
+import time
+import httpx
+from . import config
+from . import http_client
+from . import get_current_location
+from .get_current_location import parse_location_response
+from . import search_for_venues
+from .rate_limiter import INTERACTIVE, PREFETCH, QuotaExhausted
+from .search_for_venues import add_local_venues, cached_explore_venues, claim_prefetches, details_request, distance_weighted_order,\
+    explore_cache_key, explore_request, explore_response_venues, local_nearby_venues, merge_keyword_results, release_prefetch,\
+    split_query, store_details_response, PREFETCH_COUNT
+
+# Connections kept open in total and kept alive between requests by the shared client.
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+# Prefetches scheduled on the loop without being awaited, referenced until they finish.
+_background_tasks = set()
+
+def _get_loop():
+    # Returns the background event loop, starting its thread on first use
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target = loop.run_forever, name = "async-backend", daemon = True).start()
+            _loop = loop
+        return _loop
+
+def run(coroutine, timeout = None):
+    """
+    Runs a coroutine on the background event loop and waits for its result.
+
+    Parameters:
+    -----------
+    coroutine (coroutine): Coroutine to run, eg. search(...).
+    timeout (float, optional): Seconds to wait before raising concurrent.futures.TimeoutError.
+        Defaults to None, which waits indefinitely.
+
+    Returns:
+    --------
+    object: The value returned by the coroutine.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result(timeout)
+
+def get_client():
+    # Returns the shared httpx.AsyncClient, creating it on first use. Must be called on the background loop.
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout = httpx.Timeout(http_client.READ_TIMEOUT, connect = http_client.CONNECT_TIMEOUT),
+            limits = httpx.Limits(max_connections = MAX_CONNECTIONS, max_keepalive_connections = MAX_KEEPALIVE_CONNECTIONS)
+        )
+    return _client
+
+async def run_limiter(rate_limiter, method, *args):
+    # Calls a method of rate_limiter, in the default executor if it blocks on I/O so the event loop keeps running.
+    # Returns the method's result
+    if not rate_limiter.blocking:
+        return method(*args)
+    return await asyncio.get_event_loop().run_in_executor(None, method, *args)
+
+async def acquire(rate_limiter, priority = INTERACTIVE):
+    # Async version of rate_limiter.acquire, which waits without blocking the event loop. Returns whether admitted
+    deadline = rate_limiter.deadline(priority)
+    while True:
+        granted, wait = await run_limiter(rate_limiter, rate_limiter.try_acquire, priority)
+        if granted:
+            return True
+        wait = rate_limiter.wait_before_retry(priority, wait, deadline)
+        if wait is None:
+            return False
+        await asyncio.sleep(wait)
+
+async def get(url, params = None, endpoint = None, max_retries = http_client.MAX_RETRIES, rate_limiter = None, priority = INTERACTIVE):
+    """
+    Makes a GET request with the shared async client, using the same timeouts, retry policy,
+    retry budget, rate limiting and latency metrics as http_client.get, whose retry decisions it shares.
+
+    Parameters:
+    -----------
+    url (string): URL to request.
+    params (dictionary, optional): Query string parameters.
+    endpoint (string, optional): Name the request's latency is recorded under. Defaults to url.
+    max_retries (int, optional): Retries allowed after the first attempt.
+    rate_limiter (RateLimiter, optional): Limiter every attempt must be admitted by. Defaults to None.
+    priority (int, optional): Priority of the request for rate_limiter. Defaults to INTERACTIVE.
+
+    Returns:
+    --------
+    httpx.Response: The last response received. Raises the last exception if no response was received,
+        or QuotaExhausted if rate_limiter did not admit the first attempt.
+    """
+    endpoint = endpoint or url
+    http_client.deposit_retry_token()
+    attempt = 0
+    response = None
+    while True:
+        if rate_limiter is not None and not await acquire(rate_limiter, priority):
+            return http_client.refused_result(response, endpoint)
+        start = time.perf_counter()
+        try:
+            response = await get_client().get(url, params = params)
+        except httpx.TransportError:
+            http_client.record_latency(endpoint, time.perf_counter() - start, True)
+            delay = http_client.retry_delay(attempt, max_retries)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        http_client.record_latency(endpoint, time.perf_counter() - start, response.status_code >= 400)
+        if rate_limiter is not None:
+            await run_limiter(rate_limiter, rate_limiter.observe, response.status_code, response.headers)
+        delay = http_client.retry_delay(attempt, max_retries, response)
+        if delay is None:
+            return response
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def get_location_data(ip_address = None):
+    # Async version of get_current_location.get_location_data
+    try:
+        if ip_address is None:
+            ip_address = (await get(get_current_location.IP_ECHO_URL, endpoint = "ip.42.pl")).text.strip()
+        response = await get("".join([get_current_location.IPDATA_API_URL, ip_address]),
+            params = {"api-key": config.ipdata_api_key}, endpoint = "ipdata.lookup")
+        return parse_location_response(response.json())
+    except Exception as e:
+        print("Failed to get location:", e)
+        return {}
+
+async def nearby_venues(location_data, query, radius = 16000, limit = 50, offset = 0):
+    # Async version of search_for_venues.remote_nearby_venues, sharing its explore cache and venue index
+    try:
+        key = explore_cache_key(location_data, query, radius, limit, offset = offset)
+        venues = cached_explore_venues(key)
+        if venues is not None:
+            return venues
+        url, params = explore_request(location_data, query, radius, limit, offset)
+        try:
+            resp_loaded = (await get(url, params = params, endpoint = "foursquare.explore",
+                rate_limiter = search_for_venues.rate_limiter)).json()
+        except QuotaExhausted:
+            resp_loaded = None
+        return explore_response_venues(key, resp_loaded)
+    except Exception as e:
+        print("Explore request failed: {0}".format(e))
+        return []
+
+async def keyword_nearby_venues(location_data, query, radius = 16000, limit = 50, search_mode = None, offset = 0):
+    # Async version of search_for_venues.keyword_nearby_venues, which searches venue_index as SEARCH_MODE says
+    search_mode = search_mode or search_for_venues.SEARCH_MODE
+    if search_mode == "local":
+        return local_nearby_venues(location_data, query, radius, limit, offset)
+    venues = await nearby_venues(location_data, query, radius, limit, offset)
+    return add_local_venues(venues, location_data, query, radius, limit, search_mode, offset)
+
+async def get_details(venue, priority = INTERACTIVE):
+    # Async version of search_for_venues.get_details, sharing its details cache and venue index
+    try:
+        details = search_for_venues.cached_details(venue.get_id())
+        if details is not None:
+            venue.details = details
+            return
+        url, params = details_request(venue)
+        try:
+            resp_loaded = (await get(url, params = params, endpoint = "foursquare.details",
+                rate_limiter = search_for_venues.rate_limiter, priority = priority)).json()
+        except QuotaExhausted:
+            resp_loaded = None
+        return store_details_response(venue, resp_loaded)
+    except Exception as e:
+        print("details request failed: {0}".format(e))
+
+async def get_many_details(venues_data, priority = INTERACTIVE):
+    """
+    Fetches details for several venues concurrently.
+
+    Parameters:
+    -----------
+    venues_data (list): A list of Venue objects. Venues that already have details are skipped.
+    priority (int, optional): Priority of the requests for the rate limiter. Defaults to INTERACTIVE.
+
+    Returns:
+    --------
+    list: The result of get_details for each venue that was fetched, in order.
+    """
+    return await asyncio.gather(*[get_details(venue, priority) for venue in venues_data if venue.details == None])
+
+async def _prefetch_details(venues_data):
+    # Fetches details of venues claimed with claim_prefetches, then marks them as no longer in flight
+    try:
+        await get_many_details(venues_data, PREFETCH)
+    finally:
+        for venue in venues_data:
+            release_prefetch(venue)
+
+def prefetch_details(venues_data, start, count = PREFETCH_COUNT):
+    """
+    Async version of search_for_venues.prefetch_details, which fetches details on the event loop in
+    a task that is not awaited. Must be called on the event loop. Venues being prefetched by either
+    backend are skipped, and the rate limiter drops prefetches while it keeps its reserve.
+
+    Parameters:
+    -----------
+    venues_data (list): A list of Venue objects in the order they are suggested.
+    start (int): Index of the first venue to prefetch.
+    count (int, optional): Number of venues to prefetch. Defaults to PREFETCH_COUNT.
+
+    Returns:
+    --------
+    asyncio.Task: The scheduled prefetches, or None if there was nothing to prefetch.
+    """
+    claimed = claim_prefetches(venues_data, start, count)
+    if not claimed:
+        return None
+    task = asyncio.ensure_future(_prefetch_details(claimed))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def search(location_data, query, radius, original_location, detail_count = 1 + PREFETCH_COUNT, limit = 50):
+    """
+    Searches for venues and orders them like nearby_venues followed by distance_weighted_order,
+    then fetches details for the first suggestion and starts prefetching them for the rest of the
+    first detail_count, without waiting for the prefetches. The keywords of a multi-keyword query
+    are searched concurrently, and venue_index is used as SEARCH_MODE says.
+
+    Parameters:
+    -----------
+    location_data (dictionary): Contains location data from ipdata and timestamp.
+    query (string): A category used to select venues (eg. coffee).
+    radius (int / float): Radius to search within in meters.
+    original_location (tuple): (lat, lng) coordinates that venues are weighted by distance from.
+    detail_count (int, optional): Number of leading suggestions to fetch or prefetch details for.
+    limit (int, optional): Number of venues to request from explore. Defaults to 50.
+
+    Returns:
+    --------
+    VenueList: Venues in suggested order. Returns 'API Usage Exceeded' or an empty list on failure like nearby_venues.
+    """
+    keywords = split_query(query)
+    venues = merge_keyword_results(await asyncio.gather(*[keyword_nearby_venues(location_data, keyword, radius, limit)
+        for keyword in keywords]))
+    if venues == "API Usage Exceeded" or len(venues) == 0:
+        return venues
+    ordered = distance_weighted_order(venues, original_location)
+    # Only the first suggestion is shown right away, so the user only waits for its details
+    await get_many_details(ordered[:min(detail_count, 1)])
+    prefetch_details(ordered, 1, detail_count - 1)
+    return ordered
@@ -0,0 +1,109 @@
+"""
+Suggestions for many (location, query, radius) searches at once, for integrations that need
+more than the one search per request the home page handles. Searches that would make the same
+explore request share one call, calls run on a bounded thread pool, and every search's venues
+are ordered together with batch_distance_weighted_order. A batch returns by BATCH_DEADLINE, with
+an error for each search whose explore call had not finished.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from . import search_for_venues
+from .instrumentation import increment, timed
+from .rate_limiter import BATCH
+from .utils import VenueList
+
+# Largest number of searches accepted in one batch.
+MAX_BATCH_SIZE = 100
+# Venues requested from explore for each distinct search, and venues returned for each search by default.
+EXPLORE_LIMIT = 50
+DEFAULT_SUGGESTIONS = 10
+# Threads making explore calls, shared by all batches so concurrent batches do not multiply API load.
+BATCH_WORKERS = 4
+# Seconds a batch may spend on explore calls, leaving room within gunicorn's default 30 second worker timeout.
+# With BATCH_WORKERS threads and batch calls waiting up to 5 seconds each for the rate limiter, a full batch can take longer.
+BATCH_DEADLINE = 20.0
+
+_batch_executor = ThreadPoolExecutor(max_workers = BATCH_WORKERS)
+
+def parse_search(search):
+    """
+    Validates one search of a batch.
+
+    Parameters:
+    -----------
+    search (dictionary): Has 'latitude', 'longitude', 'query' and 'radius' in meters, and optionally 'city'.
+
+    Returns:
+    --------
+    dictionary: location_data for nearby_venues, under 'location_data', with 'query' and 'radius'.
+        Raises ValueError describing the problem if search is not valid.
+    """
+    if not isinstance(search, dict):
+        raise ValueError("Each search must be an object.")
+    try:
+        latitude = float(search["latitude"])
+        longitude = float(search["longitude"])
+        radius = float(search["radius"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Each search needs numeric 'latitude', 'longitude' and 'radius'.")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("Coordinates out of range: {0}, {1}.".format(latitude, longitude))
+    if not 0 < radius <= 100000:
+        raise ValueError("Radius must be between 0 and 100,000 meters.")
+    query = search.get("query", None)
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("Each search needs a non-empty 'query'.")
+    location_data = {"latitude": latitude, "longitude": longitude, "city": search.get("city", None)}
+    return {"location_data": location_data, "query": query, "radius": radius}
+
+@timed("suggest_batch")
+def suggest_batch(searches, limit = DEFAULT_SUGGESTIONS, rng = None, deadline = BATCH_DEADLINE):
+    """
+    Finds and orders suggestions for every search in a batch.
+
+    Parameters:
+    -----------
+    searches (list of dictionaries): Searches as accepted by parse_search.
+    limit (int, optional): Number of suggestions returned for each search. Defaults to DEFAULT_SUGGESTIONS.
+    rng (None / int / numpy.random.Generator, optional): Source of randomness for the ordering.
+    deadline (float, optional): Seconds to wait for explore calls. Defaults to BATCH_DEADLINE.
+
+    Returns:
+    --------
+    list of dictionaries: For each search in order, {'venues': VenueList} of up to limit venues in
+        suggested order, or {'error': 'API Usage Exceeded'} or {'error': 'Batch deadline exceeded'}.
+        Raises ValueError if the batch is not valid.
+    """
+    if len(searches) > MAX_BATCH_SIZE:
+        raise ValueError("At most {0} searches are accepted in a batch.".format(MAX_BATCH_SIZE))
+    parsed = [parse_search(search) for search in searches]
+    # Searches sharing an explore cache key would make the same request, so each key is fetched once
+    futures = {}
+    for search in parsed:
+        search["key"] = search_for_venues.explore_cache_key(search["location_data"], search["query"], search["radius"], EXPLORE_LIMIT)
+        if search["key"] not in futures:
+            futures[search["key"]] = _batch_executor.submit(search_for_venues.nearby_venues,
+                search["location_data"], search["query"], search["radius"], EXPLORE_LIMIT, priority = BATCH)
+    increment("batch_searches_total", amount = len(parsed), description = "Searches received in suggestion batches.")
+    increment("batch_explore_calls_total", amount = len(futures), description = "Distinct explore searches made for suggestion batches.")
+    done, not_done = wait(futures.values(), timeout = deadline)
+    # Calls still queued are dropped, and calls in progress finish in the background, filling the explore cache
+    for future in not_done:
+        future.cancel()
+    if not_done:
+        increment("batch_explore_timeouts_total", amount = len(not_done), description = "Explore searches of suggestion batches not finished by the deadline.")
+    found = {key: future.result() if future in done else "Batch deadline exceeded" for key, future in futures.items()}
+
+    venue_lists = []
+    for search in parsed:
+        venues = found[search["key"]]
+        venue_lists.append(VenueList() if isinstance(venues, str) else venues)
+    ordered = search_for_venues.batch_distance_weighted_order(venue_lists,
+        [(search["location_data"]["latitude"], search["location_data"]["longitude"]) for search in parsed], rng = rng)
+    results = []
+    for search, venues in zip(parsed, ordered):
+        if isinstance(found[search["key"]], str):
+            results.append({"error": found[search["key"]]})
+        else:
+            results.append({"venues": venues.take(range(min(limit, len(venues))))})
+    return results
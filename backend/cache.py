@@ -0,0 +1,176 @@
+"""
+Server-side key-value caches with TTL expiry and size-bounded eviction.
+Used to keep search results and API responses out of the session cookie.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from .instrumentation import increment
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_ENTRIES = 1024
+
+def _count_lookup(name, result, value):
+    # Counts a cache lookup with result 'hit', 'stale' or 'miss', then returns value
+    increment("cache_lookups_total", {"cache": name, "result": result}, description = "Cache lookups by cache and result.")
+    return value
+
+class MemoryCache:
+    """
+    In-process cache with least recently used eviction.
+    Entries expire ttl seconds after they are set, but are kept for a further stale_ttl seconds
+    so callers can fall back to them when a fresh value cannot be fetched. Safe to share between threads.
+    """
+    def __init__(self, max_entries = DEFAULT_MAX_ENTRIES, ttl = DEFAULT_TTL, stale_ttl = 0, name = "memory"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default = None, allow_stale = False):
+        # Returns value stored under key, or default if missing or expired
+        # If allow_stale is True, values that expired less than stale_ttl seconds ago are also returned
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return _count_lookup(self.name, "miss", default)
+            value, expires = entry
+            if expires + self.stale_ttl <= now:
+                del self._entries[key]
+                return _count_lookup(self.name, "miss", default)
+            if expires <= now and not allow_stale:
+                return _count_lookup(self.name, "miss", default)
+            self._entries.move_to_end(key)
+            return _count_lookup(self.name, "stale" if expires <= now else "hit", value)
+
+    def set(self, key, value, ttl = None):
+        # Stores value under key, evicting least recently used entries past max_entries
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+    def delete(self, key):
+        # Removes key if present
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        # Removes all entries
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteCache:
+    """
+    Cache stored in a local SQLite file, so entries are shared between worker processes and
+    survive restarts. Values are pickled. Least recently used entries are evicted past max_entries,
+    and expired entries are kept for stale_ttl seconds as with MemoryCache.
+    """
+    def __init__(self, path, max_entries = DEFAULT_MAX_ENTRIES, ttl = DEFAULT_TTL, stale_ttl = 0, name = "sqlite"):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok = True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        # Yields a connection that commits on success and is always closed
+        conn = sqlite3.connect(self.path, timeout = 10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key, default = None, allow_stale = False):
+        # Returns value stored under key, or default if missing or expired
+        # If allow_stale is True, values that expired less than stale_ttl seconds ago are also returned
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return _count_lookup(self.name, "miss", default)
+                if row[1] + self.stale_ttl <= now:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    return _count_lookup(self.name, "miss", default)
+                if row[1] <= now and not allow_stale:
+                    return _count_lookup(self.name, "miss", default)
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return _count_lookup(self.name, "stale" if row[1] <= now else "hit", pickle.loads(row[0]))
+        except Exception as e:
+            print("Cache read from {0} failed: {1}".format(self.path, e))
+            return default
+
+    def set(self, key, value, ttl = None):
+        # Stores value under key, evicting expired and least recently used entries past max_entries
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        try:
+            blob = sqlite3.Binary(pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL))
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                             (key, blob, expires, now))
+                conn.execute("DELETE FROM entries WHERE expires <= ?", (now - self.stale_ttl,))
+                conn.execute("DELETE FROM entries WHERE key IN "
+                             "(SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                             (self.max_entries,))
+        except Exception as e:
+            print("Cache write to {0} failed: {1}".format(self.path, e))
+
+    def delete(self, key):
+        # Removes key if present
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        # Removes all entries
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+def create_cache(backend = "memory", path = None, max_entries = DEFAULT_MAX_ENTRIES, ttl = DEFAULT_TTL, stale_ttl = 0, name = None):
+    """
+    Creates a cache for the given backend name.
+
+    Parameters:
+    -----------
+    backend (string): Either 'memory' for an in-process cache or 'sqlite' for a local file cache.
+    path (string): Location of the SQLite file. Only used by the 'sqlite' backend.
+    max_entries (int): Number of entries kept before least recently used entries are evicted.
+    ttl (int / float): Default number of seconds before an entry expires.
+    stale_ttl (int / float): Number of seconds an expired entry can still be read with allow_stale.
+    name (string, optional): Name the cache's hits and misses are counted under. Defaults to backend.
+
+    Returns:
+    --------
+    MemoryCache or SQLiteCache: The created cache.
+    """
+    if backend == "memory":
+        return MemoryCache(max_entries = max_entries, ttl = ttl, stale_ttl = stale_ttl, name = name or backend)
+    if backend == "sqlite":
+        return SQLiteCache(path, max_entries = max_entries, ttl = ttl, stale_ttl = stale_ttl, name = name or backend)
+    raise ValueError("Unknown cache backend: {0}".format(backend))
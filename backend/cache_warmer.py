@@ -0,0 +1,115 @@
+"""
+Fills the explore and details caches ahead of demand with the searches users make most often,
+as recorded in the search log, so the first users making them do not wait on Foursquare.
+Searches are keyed like explore_cache, by geohash cell, keyword and radius, and warming stops
+once it has made as many Foursquare calls as its quota budget allows.
+"""
+
+import time
+from collections import Counter
+from . import search_for_venues
+from .lazy import lazy_import
+from .rate_limiter import BATCH
+from .utils import geohash_decode
+from .venue_stream import FIRST_PAGE_SIZE
+
+np = lazy_import("numpy")
+
+# Foursquare calls made by a warming run by default.
+DEFAULT_BUDGET = 500
+# Venues of each warmed search whose details are fetched, most likely to be suggested first.
+DETAILS_PER_SEARCH = 1 + search_for_venues.PREFETCH_COUNT
+
+def search_keys(entry):
+    # Returns a (cell, city, keyword, radius) key for each keyword of a logged search (list of tuples)
+    return [(entry["cell"], entry.get("city", None), keyword, int(entry["radius"])) for keyword in search_for_venues.split_query(entry["query"])]
+
+def key_location(key):
+    # Returns location_data for the explore request of a key, at the center of its cell (dictionary)
+    latitude, longitude = geohash_decode(key[0])
+    return {"latitude": latitude, "longitude": longitude, "city": key[1]}
+
+def explore_key(key):
+    # Returns the explore_cache key of the first page the app requests for a key (string)
+    return search_for_venues.explore_cache_key(key_location(key), key[2], key[3], FIRST_PAGE_SIZE)
+
+def is_upcoming(entry, now, ahead):
+    # Returns whether a logged search was made at a local hour of day within ahead hours from now in its
+    # time zone, which is found from its local and UTC hours (bool)
+    offset = entry["local_hour"] - time.gmtime(entry["time"]).tm_hour
+    local_now = (time.gmtime(now).tm_hour + offset) % 24
+    return (entry["local_hour"] - local_now) % 24 < ahead
+
+def rank_searches(entries, ahead = None, now = None):
+    """
+    Counts how often each search was made.
+
+    Parameters:
+    -----------
+    entries (list of dictionaries): Logged searches, from search_log.read_searches.
+    ahead (int, optional): Only count searches made at a local hour of day within this many hours from now,
+        eg. 3 to warm for the next three hours. Defaults to None, which counts every search.
+    now (float, optional): Time as seconds since the epoch. Defaults to the current time.
+
+    Returns:
+    --------
+    list of tuples: (key, count) for each (cell, city, keyword, radius) key, most frequent first.
+    """
+    now = time.time() if now is None else now
+    counts = Counter()
+    for entry in entries:
+        if ahead is None or "local_hour" not in entry or is_upcoming(entry, now, ahead):
+            counts.update(search_keys(entry))
+    return counts.most_common()
+
+def hit_ratio(entries):
+    # Returns fraction of logged searches whose explore requests are all in explore_cache, or None without searches (float / None)
+    if not entries:
+        return None
+    hits = sum(1 for entry in entries if all(search_for_venues.explore_cache.get(explore_key(key)) is not None for key in search_keys(entry)))
+    return hits / len(entries)
+
+def warm(ranked, budget = DEFAULT_BUDGET, details_per_search = DETAILS_PER_SEARCH):
+    """
+    Fills explore_cache with the first page of each search in ranked, and details_cache with the details
+    of the venues most likely to be suggested first for it, nearest to the center of its cell. Requests
+    are made at BATCH priority, so the rate limiter keeps its reserve for users.
+
+    Parameters:
+    -----------
+    ranked (list of tuples): (key, count) of searches in the order they are warmed, from rank_searches.
+    budget (int, optional): Most Foursquare calls to make. Cached responses cost nothing. Defaults to DEFAULT_BUDGET.
+    details_per_search (int, optional): Venues of each search whose details are fetched. Defaults to DETAILS_PER_SEARCH.
+
+    Returns:
+    --------
+    dictionary: Number of 'searches' warmed, 'explore_calls' and 'details_calls' made, and whether warming
+        'stopped' early because Foursquare or the rate limiter refused a call.
+    """
+    stats = {"searches": 0, "explore_calls": 0, "details_calls": 0, "stopped": False}
+    for key, _ in ranked:
+        calls = stats["explore_calls"] + stats["details_calls"]
+        cached = search_for_venues.explore_cache.get(explore_key(key)) is not None
+        if calls + (0 if cached else 1) > budget:
+            break
+        location_data = key_location(key)
+        venues = search_for_venues.remote_nearby_venues(location_data, key[2], key[3], FIRST_PAGE_SIZE, priority = BATCH)
+        stats["explore_calls"] += 0 if cached else 1
+        if venues == "API Usage Exceeded":
+            stats["stopped"] = True
+            break
+        stats["searches"] += 1
+        if len(venues) == 0:
+            continue
+        p = search_for_venues.latlng_distribution(venues, (location_data["latitude"], location_data["longitude"]))
+        for i in np.argsort(-p, kind = "stable")[:details_per_search]:
+            venue = venues[int(i)]
+            if search_for_venues.load_cached_details(venue):
+                continue
+            if stats["explore_calls"] + stats["details_calls"] >= budget:
+                return stats
+            stats["details_calls"] += 1
+            if search_for_venues.get_details(venue, priority = BATCH) == "API Usage Exceeded":
+                stats["stopped"] = True
+                return stats
+    return stats
@@ -0,0 +1,132 @@
+"""
+Vectorized great-circle distances between (lat, lng) coordinates in degrees.
+"""
+
+import math
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+EARTH_RADIUS_METERS = 6371008.8
+# Distances are floored at this many meters before being inverted, so a venue at the
+# user's exact coordinates gets a large but finite weight.
+MIN_DISTANCE_METERS = 1.0
+
+def _as_coords(coords):
+    # Returns coords as a float array of shape (N, 2)
+    return np.asarray(coords, dtype = float).reshape(-1, 2)
+
+def haversine(origin, points):
+    """
+    Computes great-circle distances from one origin to many points with the haversine formula.
+
+    Parameters:
+    -----------
+    origin (tuple): (lat, lng) coordinates in degrees.
+    points (array-like): Array of shape (N, 2) holding (lat, lng) coordinates in degrees.
+
+    Returns:
+    --------
+    numpy.ndarray: Array of shape (N,) with the distance to each point in meters.
+    """
+    return pairwise_haversine(origin, points)[0]
+
+def scalar_haversine(origin, points):
+    """
+    Computes great-circle distances from one origin to a few points in pure Python, which is faster
+    than haversine for a page of venues and does not need NumPy to be imported.
+
+    Parameters:
+    -----------
+    origin (tuple): (lat, lng) coordinates in degrees.
+    points (iterable): (lat, lng) coordinates in degrees.
+
+    Returns:
+    --------
+    list: The distance to each point in meters.
+    """
+    lat1, lng1 = math.radians(origin[0]), math.radians(origin[1])
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat, lng in points:
+        lat2, lng2 = math.radians(lat), math.radians(lng)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(max(a, 0.0), 1.0))))
+    return distances
+
+def pairwise_haversine(origins, points):
+    """
+    Computes great-circle distances from many origins to many points with the haversine formula.
+
+    Parameters:
+    -----------
+    origins (array-like): Array of shape (M, 2) holding (lat, lng) coordinates in degrees.
+        A single (lat, lng) tuple is treated as M = 1.
+    points (array-like): Array of shape (N, 2) holding (lat, lng) coordinates in degrees.
+
+    Returns:
+    --------
+    numpy.ndarray: Array of shape (M, N) where entry [i, j] is the distance from origins[i] to points[j] in meters.
+    """
+    origins = np.radians(_as_coords(origins))
+    points = np.radians(_as_coords(points))
+    return _haversine_radians(origins[:, 0:1], origins[:, 1:2], points[:, 0], points[:, 1])
+
+def paired_haversine(origins, points):
+    """
+    Computes great-circle distances from each origin to the point at the same index, for scoring
+    venues of many searches at once.
+
+    Parameters:
+    -----------
+    origins (array-like): Array of shape (N, 2) holding (lat, lng) coordinates in degrees.
+    points (array-like): Array of shape (N, 2) holding (lat, lng) coordinates in degrees.
+
+    Returns:
+    --------
+    numpy.ndarray: Array of shape (N,) where entry i is the distance from origins[i] to points[i] in meters.
+    """
+    origins = np.radians(_as_coords(origins))
+    points = np.radians(_as_coords(points))
+    return _haversine_radians(origins[:, 0], origins[:, 1], points[:, 0], points[:, 1])
+
+def _haversine_radians(lat1, lng1, lat2, lng2):
+    # Returns haversine distances in meters between broadcastable arrays of coordinates in radians
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def equirectangular(origin, points):
+    """
+    Approximates distances from one origin to many points by projecting onto a plane, scaling
+    longitude by the cosine of latitude. Cheaper than haversine and accurate within a fraction of
+    a percent over the radii venues are searched within.
+
+    Parameters:
+    -----------
+    origin (tuple): (lat, lng) coordinates in degrees.
+    points (array-like): Array of shape (N, 2) holding (lat, lng) coordinates in degrees.
+
+    Returns:
+    --------
+    numpy.ndarray: Array of shape (N,) with the approximate distance to each point in meters.
+    """
+    origin = np.radians(_as_coords(origin))[0]
+    points = np.radians(_as_coords(points))
+    x = (points[:, 1] - origin[1]) * np.cos((points[:, 0] + origin[0]) / 2)
+    y = points[:, 0] - origin[0]
+    return EARTH_RADIUS_METERS * np.hypot(x, y)
+
+def inverse_distances(distances, min_distance = MIN_DISTANCE_METERS):
+    """
+    Inverts distances, flooring them at min_distance so that zero distances do not divide by zero.
+
+    Parameters:
+    -----------
+    distances (array-like): Distances in meters, of any shape.
+    min_distance (float, optional): Smallest distance used. Defaults to MIN_DISTANCE_METERS.
+
+    Returns:
+    --------
+    numpy.ndarray: Array of the same shape holding 1 / max(distance, min_distance).
+    """
+    return 1 / np.maximum(np.asarray(distances, dtype = float), min_distance)
@@ -3,17 +3,38 @@ Gets current location of device using ipdata.
 Source: ipdata.co
 """
 
-import config
-from ipdata import ipdata
-import requests
+import ipaddress
+import random
+import threading
+import time
+from . import config
+from . import http_client
+from .cache import MemoryCache
+from .instrumentation import timed
 
-def get_location_data():
+IP_ECHO_URL = "http://ip.42.pl/raw"
+IPDATA_API_URL = "https://api.ipdata.co/"
+# Seconds a looked up location is reused for the same IP address.
+LOCATION_TTL = 1800
+# Number of lookups attempted before giving up, and base delay between attempts in seconds.
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 0.5
+# Keys that must be present for location data to be usable.
+REQUIRED_KEYS = ["timestamp", "latitude", "longitude", "city"]
+
+_location_cache = MemoryCache(max_entries = 4096, ttl = LOCATION_TTL, name = "location")
+_pending_lookups = {}
+_pending_lock = threading.Lock()
+
+@timed("get_location_data")
+def get_location_data(ip_address = None):
     """
-    Gets location data using current IP address from ipdata.
+    Gets location data for an IP address from ipdata.
 
     Parameters:
     -----------
-    None
+    ip_address (string, optional): IP address to look up. Defaults to None, in which case the
+        public IP address of this machine is used.
 
     Returns:
     --------
@@ -22,19 +43,105 @@ def get_location_data():
         Any entry that was not included is replaced with an empty string.
     """
     try:
-        public_ip = requests.get("http://ip.42.pl/raw").text
-        ipd = ipdata.IPData(config.ipdata_api_key)
-        response = ipd.lookup(public_ip)
-        keys = ["city", "country_name", "latitude", "longitude", "postal", "region"]
-        location_data = {}
-        for key in keys:
-            location_data[key] = response.get(key, "")
-        location_data["time zone"] = response["time_zone"]["name"]
-        location_data["timestamp"] = response["time_zone"]["current_time"]
-        return location_data
+        if ip_address is None:
+            ip_address = http_client.get(IP_ECHO_URL, endpoint = "ip.42.pl").text.strip()
+        response = http_client.get_json("".join([IPDATA_API_URL, ip_address]),
+            params = {"api-key": config.ipdata_api_key}, endpoint = "ipdata.lookup")
+        return parse_location_response(response)
     except Exception as e:
         print("Failed to get location:", e)
         return {}
 
+def parse_location_response(response):
+    # Returns location data (dictionary) with the keys we use from an ipdata lookup response
+    keys = ["city", "country_name", "latitude", "longitude", "postal", "region"]
+    location_data = {}
+    for key in keys:
+        location_data[key] = response.get(key, "")
+    location_data["time zone"] = response["time_zone"]["name"]
+    location_data["timestamp"] = response["time_zone"]["current_time"]
+    return location_data
+
+def is_valid_location(location_data):
+    # Returns whether location_data contains every key needed to search for venues
+    return all(location_data.get(key, "") not in ("", None) for key in REQUIRED_KEYS)
+
+def client_ip(remote_addr):
+    """
+    Finds the IP address of the client that made a request. Behind a proxy such as Heroku's router,
+    remote_addr should be the address the proxy appended to X-Forwarded-For, eg. as set by werkzeug's
+    ProxyFix, rather than an address the client sent, which it could change on every request.
+
+    Parameters:
+    -----------
+    remote_addr (string): Address of the client, or of the peer that connected to the server.
+
+    Returns:
+    --------
+    string: Public IP address of the client, or None if it is a private or loopback address
+        (eg. during local development), in which case the server's own public IP address is used.
+    """
+    try:
+        if ipaddress.ip_address(remote_addr or "").is_global:
+            return remote_addr
+    except ValueError:
+        pass
+    return None
+
+class _PendingLookup:
+    # Result of a lookup in progress, shared with every request waiting on the same IP address
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = {}
+
+def _lookup_with_retries(ip_address):
+    # Calls get_location_data up to MAX_ATTEMPTS times, backing off exponentially with jitter
+    location_data = {}
+    for attempt in range(MAX_ATTEMPTS):
+        location_data = get_location_data(ip_address)
+        if is_valid_location(location_data):
+            return location_data
+        if attempt < MAX_ATTEMPTS - 1:
+            time.sleep(BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+    return location_data
+
+def lookup_location(ip_address = None):
+    """
+    Gets location data for an IP address, reusing results looked up within the last LOCATION_TTL
+    seconds. Concurrent lookups of the same address share a single request to ipdata, and failed
+    requests are retried at most MAX_ATTEMPTS times.
+
+    Parameters:
+    -----------
+    ip_address (string, optional): IP address to look up. Defaults to None, which looks up the
+        public IP address of this machine.
+
+    Returns:
+    --------
+    dictionary: Location data as returned by get_location_data. Empty or incomplete if every attempt failed.
+    """
+    key = ip_address or "self"
+    location_data = _location_cache.get(key)
+    if location_data is not None:
+        return location_data
+    with _pending_lock:
+        pending = _pending_lookups.get(key, None)
+        is_leader = pending is None
+        if is_leader:
+            pending = _PendingLookup()
+            _pending_lookups[key] = pending
+    if not is_leader:
+        pending.done.wait()
+        return pending.result
+    try:
+        pending.result = _lookup_with_retries(ip_address)
+        if is_valid_location(pending.result):
+            _location_cache.set(key, pending.result)
+    finally:
+        with _pending_lock:
+            _pending_lookups.pop(key, None)
+        pending.done.set()
+    return pending.result
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,194 @@
+"""
+Shared HTTP client used for every outbound API request.
+Keeps pooled keep-alive connections per host, applies timeouts, retries failed requests
+with jittered backoff, and records latency per endpoint.
+"""
+
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .instrumentation import histogram, increment
+from .rate_limiter import INTERACTIVE, QuotaExhausted
+
+# Seconds to wait for a connection to be established, and for the server to send a response.
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+# Number of hosts with pooled connections, and connections kept open per host.
+POOL_HOSTS = 10
+POOL_SIZE = 20
+# Retries after the first attempt, base delay between attempts in seconds, and the longest
+# Retry-After delay that is waited out instead of returning the 429 response to the caller.
+MAX_RETRIES = 2
+BACKOFF_SECONDS = 0.25
+MAX_RETRY_AFTER = 5
+# Each request adds RETRY_BUDGET_RATIO retry tokens, up to RETRY_BUDGET_MAX, and each retry
+# spends one, so retries stay a bounded fraction of traffic when an API is down.
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MAX = 10
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_retry_tokens = RETRY_BUDGET_MAX
+_retry_lock = threading.Lock()
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+def get_session():
+    # Returns the shared requests.Session, creating it on first use
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections = POOL_HOSTS, pool_maxsize = POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def deposit_retry_token():
+    # Adds to the retry budget for each request made
+    global _retry_tokens
+    with _retry_lock:
+        _retry_tokens = min(_retry_tokens + RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+
+def withdraw_retry_token():
+    # Returns whether the retry budget allows another retry
+    global _retry_tokens
+    with _retry_lock:
+        if _retry_tokens < 1:
+            return False
+        _retry_tokens -= 1
+        return True
+
+def record_latency(endpoint, seconds, failed):
+    # Adds a request that took seconds to the metrics for endpoint
+    histogram("http_request_seconds", "Latency of outbound API requests.").observe(seconds, {"endpoint": endpoint})
+    if failed:
+        increment("http_request_errors_total", {"endpoint": endpoint}, description = "Outbound API requests that failed.")
+    with _metrics_lock:
+        metric = _metrics.setdefault(endpoint, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        metric["count"] += 1
+        metric["errors"] += int(failed)
+        metric["total_seconds"] += seconds
+        metric["max_seconds"] = max(metric["max_seconds"], seconds)
+
+def latency_metrics():
+    """
+    Returns a snapshot of request counts and latencies for each endpoint.
+
+    Returns:
+    --------
+    dictionary: Maps endpoint name to a dictionary with keys 'count', 'errors', 'total_seconds',
+        'max_seconds' and 'mean_seconds'.
+    """
+    with _metrics_lock:
+        snapshot = {endpoint: dict(metric) for endpoint, metric in _metrics.items()}
+    for metric in snapshot.values():
+        metric["mean_seconds"] = metric["total_seconds"] / metric["count"] if metric["count"] else 0.0
+    return snapshot
+
+def retry_after_seconds(response):
+    # Returns the delay requested by a Retry-After header in seconds (float), or None if absent or an HTTP date
+    try:
+        return max(float(response.headers.get("Retry-After", "")), 0.0)
+    except ValueError:
+        return None
+
+def backoff_seconds(attempt):
+    # Returns exponential backoff delay for the given retry attempt with full jitter (float)
+    return random.uniform(0, BACKOFF_SECONDS * (2 ** attempt))
+
+def retry_delay(attempt, max_retries, response = None):
+    """
+    Decides whether a failed attempt of a request is retried, spending a token of the retry budget if it is.
+    Shared by get and the async backend, which only differ in how they send requests and wait.
+
+    Parameters:
+    -----------
+    attempt (int): Number of the attempt that failed, starting at 0.
+    max_retries (int): Retries allowed after the first attempt.
+    response (requests.Response / httpx.Response, optional): Response of the attempt. Defaults to None,
+        for an attempt that failed with a connection error or timeout.
+
+    Returns:
+    --------
+    float: Seconds to wait before retrying, or None if the request is not retried, eg. the response
+        was not a retryable status code, or asked to retry after more than MAX_RETRY_AFTER seconds.
+    """
+    if response is not None and response.status_code not in RETRY_STATUS_CODES:
+        return None
+    if attempt >= max_retries:
+        return None
+    delay = backoff_seconds(attempt)
+    if response is not None and response.status_code == 429:
+        retry_after = retry_after_seconds(response)
+        if retry_after is None or retry_after > MAX_RETRY_AFTER:
+            return None
+        delay = retry_after + delay / 2
+    if not withdraw_retry_token():
+        return None
+    return delay
+
+def refused_result(response, endpoint):
+    # Returns the last response of a request whose next attempt the rate limiter did not admit, or raises
+    # QuotaExhausted if it admitted none
+    if response is None:
+        raise QuotaExhausted("Rate limiter did not admit a request to {0}".format(endpoint))
+    return response
+
+def get(url, params = None, endpoint = None, timeout = None, max_retries = MAX_RETRIES, rate_limiter = None, priority = INTERACTIVE):
+    """
+    Makes a GET request through the shared connection pool. Connection errors, timeouts and
+    retryable status codes are retried up to max_retries times while the retry budget allows.
+    A 429 response is retried after its Retry-After delay when that is at most MAX_RETRY_AFTER seconds.
+
+    Parameters:
+    -----------
+    url (string): URL to request.
+    params (dictionary, optional): Query string parameters.
+    endpoint (string, optional): Name the request's latency is recorded under. Defaults to url.
+    timeout (tuple, optional): (connect, read) timeouts in seconds. Defaults to (CONNECT_TIMEOUT, READ_TIMEOUT).
+    max_retries (int, optional): Retries allowed after the first attempt. Defaults to MAX_RETRIES.
+    rate_limiter (RateLimiter, optional): Limiter every attempt must be admitted by, and which is
+        updated from every response. Defaults to None, which makes requests unlimited.
+    priority (int, optional): Priority of the request for rate_limiter. Defaults to INTERACTIVE.
+
+    Returns:
+    --------
+    requests.Response: The last response received. Raises the last exception if no response was received,
+        or QuotaExhausted if rate_limiter did not admit the first attempt.
+    """
+    endpoint = endpoint or url
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    deposit_retry_token()
+    attempt = 0
+    response = None
+    while True:
+        if rate_limiter is not None and not rate_limiter.acquire(priority):
+            return refused_result(response, endpoint)
+        start = time.perf_counter()
+        try:
+            response = get_session().get(url, params = params, timeout = timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            record_latency(endpoint, time.perf_counter() - start, True)
+            delay = retry_delay(attempt, max_retries)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        record_latency(endpoint, time.perf_counter() - start, response.status_code >= 400)
+        if rate_limiter is not None:
+            rate_limiter.observe(response.status_code, response.headers)
+        delay = retry_delay(attempt, max_retries, response)
+        if delay is None:
+            return response
+        time.sleep(delay)
+        attempt += 1
+
+def get_json(url, params = None, endpoint = None, timeout = None, max_retries = MAX_RETRIES, rate_limiter = None, priority = INTERACTIVE):
+    # Makes a GET request with get and returns the decoded JSON body (dictionary)
+    return get(url, params, endpoint, timeout, max_retries, rate_limiter, priority).json()
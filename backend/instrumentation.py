@@ -0,0 +1,172 @@
+"""
+Timing spans, histograms and counters for the app and backend calls, rendered in the
+Prometheus text format. Metrics are kept per process, so each gunicorn worker reports its own.
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = "venue_suggester_"
+
+_request_state = threading.local()
+
+def _label_key(labels):
+    # Returns labels as a hashable, consistently ordered tuple
+    return tuple(sorted((labels or {}).items()))
+
+def _format_labels(label_key, extra = ()):
+    # Returns labels in Prometheus syntax, eg. {span="explore",le="0.5"} (string)
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = ['{0}="{1}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in pairs]
+    return "".join(["{", ",".join(escaped), "}"])
+
+class Counter:
+    """
+    Monotonically increasing count, kept separately for each set of labels.
+    """
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def increment(self, labels = None, amount = 1):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, labels = None):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = ["# HELP {0} {1}".format(self.name, self.description), "# TYPE {0} counter".format(self.name)]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append("{0}{1} {2}".format(self.name, _format_labels(key), value))
+        return lines
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, kept separately for each set of labels.
+    """
+    def __init__(self, name, description, buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels = None):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = ["# HELP {0} {1}".format(self.name, self.description), "# TYPE {0} histogram".format(self.name)]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append("{0}_bucket{1} {2}".format(self.name, _format_labels(key, [("le", bound)]), count))
+                lines.append("{0}_bucket{1} {2}".format(self.name, _format_labels(key, [("le", "+Inf")]), counts[-1]))
+                lines.append("{0}_sum{1} {2}".format(self.name, _format_labels(key), total))
+                lines.append("{0}_count{1} {2}".format(self.name, _format_labels(key), counts[-1]))
+        return lines
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+def _registered(name, create):
+    # Returns the metric registered under name, registering create() on first use. Registered metrics are
+    # looked up without taking the lock, and a new metric is only built on a miss.
+    metric = _metrics.get(name)
+    if metric is None:
+        with _metrics_lock:
+            metric = _metrics.get(name)
+            if metric is None:
+                metric = _metrics[name] = create()
+    return metric
+
+def counter(name, description = ""):
+    # Returns the registered Counter named name, creating it on first use
+    name = METRIC_PREFIX + name
+    return _registered(name, lambda: Counter(name, description))
+
+def histogram(name, description = "", buckets = DEFAULT_BUCKETS):
+    # Returns the registered Histogram named name, creating it on first use
+    name = METRIC_PREFIX + name
+    return _registered(name, lambda: Histogram(name, description, buckets))
+
+def increment(name, labels = None, amount = 1, description = ""):
+    # Adds amount to the counter named name
+    counter(name, description).increment(labels, amount)
+
+def render_prometheus():
+    """
+    Renders every registered metric in the Prometheus text exposition format.
+
+    Returns:
+    --------
+    string: Metrics text, served with content type 'text/plain; version=0.0.4'.
+    """
+    with _metrics_lock:
+        metrics = [_metrics[name] for name in sorted(_metrics)]
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def start_request():
+    # Starts collecting spans for the request handled by this thread
+    _request_state.spans = []
+
+def request_spans():
+    # Returns list of (name, seconds) spans recorded during this thread's current request
+    return list(getattr(_request_state, "spans", None) or [])
+
+def server_timing_header(spans):
+    # Returns Server-Timing header value for spans, summing repeated names (string)
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join("{0};dur={1:.1f}".format(name, 1000 * seconds) for name, seconds in totals.items())
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block. The duration is observed in the span_seconds histogram under
+    the given name, and added to the current request's spans for the Server-Timing header.
+
+    Parameters:
+    -----------
+    name (string): Name of the span, eg. 'nearby_venues'.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        histogram("span_seconds", "Time spent in instrumented sections of the app.").observe(seconds, {"span": name})
+        spans = getattr(_request_state, "spans", None)
+        if spans is not None:
+            spans.append((name, seconds))
+
+def timed(name):
+    # Decorator that runs the decorated function inside span(name)
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,43 @@
+"""
+Deferred imports of heavy modules, so importing the backend stays cheap and a module such as
+NumPy is only loaded by the first call that uses it.
+"""
+
+import importlib
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is first read, which imports it.
+    Safe to share between threads, since the import itself holds the module's import lock.
+    """
+    def __init__(self, name, package = None):
+        self._name = name
+        self._package = package
+        self._module = None
+
+    def _load(self):
+        # Returns the module, importing it on first use
+        if self._module is None:
+            self._module = importlib.import_module(self._name, self._package)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        return "LazyModule({0}, loaded = {1})".format(self._name, self._module is not None)
+
+def lazy_import(name, package = None):
+    """
+    Returns a module that is imported when one of its attributes is first read.
+
+    Parameters:
+    -----------
+    name (string): Module name, eg. 'numpy', or a relative name such as '.async_backend'.
+    package (string, optional): Package that relative names are resolved against, eg. __package__.
+
+    Returns:
+    --------
+    LazyModule: Proxy of the module.
+    """
+    return LazyModule(name, package)
@@ -0,0 +1,160 @@
+"""
+Opening hours of venues, evaluated locally instead of asking the explore endpoint for venues
+open now, so explore responses do not depend on the time they were made. The timeframes of a
+details response are parsed once into a bitmap of the quarter hours of the week a venue is open,
+and many venues are checked against the user's local time at once.
+"""
+
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Length of each slot of the week in minutes, and the number of slots and bytes in a week bitmap.
+# Slot 0 starts at midnight on Monday.
+SLOT_MINUTES = 15
+WEEK_SLOTS = 7 * 24 * 60 // SLOT_MINUTES
+WEEK_BYTES = WEEK_SLOTS // 8
+# Largest number of venues checked at once in pure Python rather than with NumPy.
+SMALL_MASK_SIZE = 64
+
+DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+DAY_RANGE = re.compile(r"^(mon|tue|wed|thu|fri|sat|sun)\w*(?:\s*[–—-]\s*(mon|tue|wed|thu|fri|sat|sun)\w*)?$")
+TIME_OF_DAY = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*(am|pm)$")
+UTC_OFFSET = re.compile(r"([+-])(\d{2}):?(\d{2})$")
+
+def parse_days(days):
+    # Returns the weekday numbers (Monday is 0) in a timeframe's days, eg. "Mon–Fri, Sun" or "Daily",
+    # or None if any part is not a day or range of days (list of ints / None)
+    weekdays = []
+    for part in days.lower().split(","):
+        if part.strip() in ("daily", "every day"):
+            weekdays.extend(range(7))
+            continue
+        match = DAY_RANGE.match(part.strip())
+        if match is None:
+            return None
+        first = DAY_NAMES.index(match.group(1))
+        last = DAY_NAMES.index(match.group(2)) if match.group(2) else first
+        weekdays.extend((first + i) % 7 for i in range((last - first) % 7 + 1))
+    return weekdays
+
+def parse_time_of_day(text, end = False):
+    # Returns minutes after midnight of a rendered time, eg. "6:30 AM", "Noon" or "Midnight",
+    # with Midnight as 24:00 when it ends an interval, or None if it cannot be read (int / None)
+    text = text.strip().lower()
+    if text == "noon":
+        return 12 * 60
+    if text == "midnight":
+        return 24 * 60 if end else 0
+    match = TIME_OF_DAY.match(text)
+    if match is None:
+        return None
+    hour, minute = int(match.group(1)) % 12, int(match.group(2) or 0)
+    if match.group(3) == "pm":
+        hour += 12
+    return hour * 60 + minute
+
+def parse_rendered_time(rendered_time):
+    # Returns (start, end) minutes after midnight of an interval, eg. "6:30 AM–6:00 PM" or "24 Hours".
+    # End is past 24:00 for intervals ending after midnight. Returns None if it cannot be read (tuple / None)
+    if rendered_time.strip().lower() == "24 hours":
+        return 0, 24 * 60
+    parts = re.split(r"\s*[–—-]\s*", rendered_time.strip())
+    if len(parts) != 2:
+        return None
+    start, end = parse_time_of_day(parts[0]), parse_time_of_day(parts[1], end = True)
+    if start is None or end is None:
+        return None
+    if end <= start:
+        end += 24 * 60
+    return start, end
+
+def parse_open_slots(hours):
+    """
+    Parses the hours of a details response into a bitmap of the slots of the week the venue is open.
+
+    Parameters:
+    -----------
+    hours (dictionary): The 'hours' object of a details response, with 'timeframes' each holding 'days',
+        eg. "Mon–Fri", and 'open' intervals with a 'renderedTime', eg. "6:30 AM–6:00 PM".
+
+    Returns:
+    --------
+    bytes: WEEK_BYTES bytes, where bit (slot % 8) of byte (slot // 8) is set if the venue is open during slot.
+        Returns None if no hours are listed or any timeframe cannot be read, eg. days given as "Today",
+        so the venue's hours are treated as unknown rather than closed.
+    """
+    try:
+        timeframes = hours["timeframes"]
+    except (KeyError, TypeError):
+        return None
+    if not timeframes:
+        return None
+    bitmap = bytearray(WEEK_BYTES)
+    for timeframe in timeframes:
+        try:
+            weekdays = parse_days(timeframe.get("days", ""))
+            intervals = [parse_rendered_time(interval.get("renderedTime", "")) for interval in timeframe.get("open", [])]
+        except (AttributeError, TypeError):
+            return None
+        if not weekdays or not intervals or None in intervals:
+            return None
+        for weekday in weekdays:
+            for start, end in intervals:
+                first = (weekday * 24 * 60 + start) // SLOT_MINUTES
+                last = (weekday * 24 * 60 + end + SLOT_MINUTES - 1) // SLOT_MINUTES
+                for slot in range(first, last):
+                    slot %= WEEK_SLOTS
+                    bitmap[slot // 8] |= 1 << (slot % 8)
+    return bytes(bitmap)
+
+def local_time_zone(location_data):
+    # Returns the fixed UTC offset of the timestamp in location_data, or UTC if it has none (datetime.timezone)
+    match = UTC_OFFSET.search(str(location_data.get("timestamp", "")))
+    if match is None:
+        return timezone.utc
+    offset = timedelta(hours = int(match.group(2)), minutes = int(match.group(3)))
+    return timezone(-offset if match.group(1) == "-" else offset)
+
+def week_slot(location_data, now = None):
+    """
+    Finds the slot of the week it currently is where the user is.
+
+    Parameters:
+    -----------
+    location_data (dictionary): Contains the 'timestamp' of the location lookup, whose UTC offset gives
+        the user's time zone.
+    now (float, optional): Time as seconds since the epoch. Defaults to the current time.
+
+    Returns:
+    --------
+    int: Slot of the week, between 0 and WEEK_SLOTS - 1.
+    """
+    local = datetime.fromtimestamp(time.time() if now is None else now, local_time_zone(location_data))
+    return (local.weekday() * 24 * 60 + local.hour * 60 + local.minute) // SLOT_MINUTES
+
+def open_mask(bitmaps, slot):
+    """
+    Checks many venues' opening hours at once.
+
+    Parameters:
+    -----------
+    bitmaps (list): Bitmap from parse_open_slots of each venue, or None where its hours are unknown.
+    slot (int): Slot of the week to check, from week_slot.
+
+    Returns:
+    --------
+    list / numpy.ndarray: True for each venue open during slot or whose hours are unknown. Lists of at most
+        SMALL_MASK_SIZE bitmaps are checked in pure Python and give a list, longer ones an array.
+    """
+    if len(bitmaps) <= SMALL_MASK_SIZE:
+        return [bitmap is None or bool(bitmap[slot // 8] >> (slot % 8) & 1) for bitmap in bitmaps]
+    mask = np.ones(len(bitmaps), dtype = bool)
+    known = [i for i, bitmap in enumerate(bitmaps) if bitmap is not None]
+    if known:
+        bits = np.frombuffer(b"".join([bitmaps[i] for i in known]), dtype = np.uint8).reshape(-1, WEEK_BYTES)
+        mask[known] = (bits[:, slot // 8] >> (slot % 8)) & 1 == 1
+    return mask
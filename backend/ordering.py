@@ -0,0 +1,119 @@
+"""
+Weighted random ordering of venues without replacement.
+"""
+
+import math
+import random
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+def make_rng(seed = None):
+    """
+    Returns a NumPy random Generator for use by the ordering functions.
+
+    Parameters:
+    -----------
+    seed (None / int / random.Random / numpy.random.Generator, optional): An existing Generator is returned
+        as is, and a Random draws the seed of a new Generator. Any other value is used to seed a new Generator.
+        Defaults to None, which seeds from the OS.
+
+    Returns:
+    --------
+    numpy.random.Generator: Generator used to draw random keys.
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if isinstance(seed, random.Random):
+        seed = seed.getrandbits(64)
+    return np.random.default_rng(seed)
+
+def weighted_order_indices(p, rng = None):
+    """
+    Draws an ordering of indices without replacement, where at each step the next index is selected
+    with probability proportional to its weight among the indices that remain. Rather than drawing one
+    index at a time and renormalizing, each index gets an exponential key E / p and the keys are sorted
+    once, which produces the same distribution over orderings in O(n log n).
+
+    Parameters:
+    -----------
+    p (array-like): Non-negative weights for each index. Weights do not need to sum to 1.
+        Indices with a weight of 0 are placed last in random order.
+    rng (None / int / numpy.random.Generator, optional): Source of randomness. Pass a seeded
+        Generator or an int for reproducible orderings.
+
+    Returns:
+    --------
+    numpy.ndarray: Array of indices in selection order.
+    """
+    rng = make_rng(rng)
+    p = np.asarray(p, dtype = float)
+    keys = rng.standard_exponential(p.shape[0])
+    with np.errstate(divide = "ignore"):
+        keys /= p
+    # Zero-weight indices all get an infinite key, so ties are broken by a second uniform draw.
+    return np.lexsort((rng.random(p.shape[0]), keys))
+
+def is_python_rng(rng):
+    # Returns whether rng can seed small_weighted_order_indices, ie. it is None, an int or a random.Random (bool)
+    return rng is None or isinstance(rng, (int, random.Random))
+
+def small_weighted_order_indices(p, rng = None):
+    """
+    Draws an ordering like weighted_order_indices in pure Python, which is faster for short lists
+    and does not need NumPy to be imported. Orderings drawn from the same int seed differ from
+    those of weighted_order_indices, but follow the same distribution.
+
+    Parameters:
+    -----------
+    p (iterable): Non-negative weights for each index. Indices with a weight of 0 are placed last in random order.
+    rng (None / int / random.Random, optional): Source of randomness. Pass a seeded Random or an int
+        for reproducible orderings.
+
+    Returns:
+    --------
+    list: Indices in selection order.
+    """
+    rng = rng if isinstance(rng, random.Random) else random.Random(rng)
+    keys = [(rng.expovariate(1.0) / weight if weight > 0 else math.inf, rng.random(), i) for i, weight in enumerate(p)]
+    return [key[2] for key in sorted(keys)]
+
+def segmented_weighted_order_indices(p, offsets, rng = None):
+    """
+    Draws an independent weighted ordering for each segment of a concatenated weight array, as
+    weighted_order_indices would for each segment separately, with one key draw and one sort.
+
+    Parameters:
+    -----------
+    p (array-like): Non-negative weights of every segment, concatenated.
+    offsets (array-like): Start index of each segment in p, followed by len(p).
+    rng (None / int / numpy.random.Generator, optional): Source of randomness.
+
+    Returns:
+    --------
+    numpy.ndarray: Indices into p. Positions offsets[i] to offsets[i + 1] hold the ordering of segment i.
+    """
+    rng = make_rng(rng)
+    p = np.asarray(p, dtype = float)
+    segments = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    keys = rng.standard_exponential(p.shape[0])
+    with np.errstate(divide = "ignore"):
+        keys /= p
+    # Sorting by segment first keeps each segment's indices together, in segment order.
+    return np.lexsort((rng.random(p.shape[0]), keys, segments))
+
+def weighted_order(items, p, rng = None):
+    """
+    Reorders items randomly without replacement using p as selection weights.
+
+    Parameters:
+    -----------
+    items (list): Items to reorder.
+    p (array-like): Non-negative selection weight for each item.
+    rng (None / int / numpy.random.Generator, optional): Source of randomness.
+
+    Returns:
+    --------
+    list: A new list containing the items in their drawn order.
+    """
+    return [items[i] for i in weighted_order_indices(p, rng)]
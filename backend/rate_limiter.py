@@ -0,0 +1,287 @@
+"""
+Client-side rate limiter for Foursquare calls, shared by every thread and, with the SQLite
+backend, every worker process. The hard limit is the daily quota, counted per UTC day and
+checked against the quota Foursquare reports in response headers: calls a user is waiting on
+are admitted while either still has room. Batch and speculative prefetch calls are also paced
+by a token bucket, leave a reserve of the quota for users, and are the first to be held back
+when it runs low.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from .instrumentation import increment
+
+# Call priorities, most urgent first.
+INTERACTIVE = 0
+BATCH = 1
+PREFETCH = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch", PREFETCH: "prefetch"}
+# Fraction of the bucket, of the daily quota and of the quota reported in response headers that
+# each priority must leave unused for more urgent calls. Interactive calls are not paced by the
+# bucket at all.
+PRIORITY_RESERVE = {INTERACTIVE: 0.0, BATCH: 0.1, PREFETCH: 0.25}
+# Longest time in seconds a call of each priority waits for a token before giving up.
+PRIORITY_MAX_WAIT = {INTERACTIVE: 2.0, BATCH: 5.0, PREFETCH: 0.0}
+
+# Foursquare's daily limit of regular calls for a personal account. Batch and prefetch calls are
+# paced at the quota spread evenly over the day, with bursts of up to BURST calls.
+DAILY_QUOTA = 99500
+BURST = 500
+SECONDS_PER_DAY = 86400
+# Longest time calls are held back after a 429, whatever its Retry-After says, before trying again.
+DEFAULT_BLOCK_SECONDS = 60
+MAX_BLOCK_SECONDS = 300
+# Seconds the quota reported in response headers is trusted when they give no reset time.
+QUOTA_HEADER_TTL = 60
+
+class QuotaExhausted(Exception):
+    """
+    Raised when the rate limiter does not admit a call, so the caller can treat it like a 429
+    without spending quota on it.
+    """
+
+def _header_number(headers, name):
+    # Returns the numeric value of header name, or None if it is absent or not a number (float / None)
+    try:
+        return float(headers.get(name, ""))
+    except (TypeError, ValueError):
+        return None
+
+def _refill(state, now, rate, capacity):
+    # Adds tokens accrued since the state was last updated, starts a new count of calls each UTC day,
+    # and forgets quota headers past their reset time
+    state["tokens"] = min(capacity, state["tokens"] + max(now - state["updated"], 0.0) * rate)
+    state["updated"] = now
+    day = int(now // SECONDS_PER_DAY)
+    if state["day"] != day:
+        state["day"] = day
+        state["used"] = 0.0
+    if state["reset"] is not None and state["reset"] <= now:
+        state["remaining"] = state["limit"] = state["reset"] = None
+
+class RateLimiter:
+    """
+    Daily quota of calls, with a token bucket refilled at rate tokens per second up to capacity that
+    paces batch and prefetch calls. Subclasses keep the limiter's state and provide _transact, which
+    applies an update to it atomically, and set blocking if it waits on I/O.
+    """
+    blocking = False
+    def __init__(self, daily_quota = DAILY_QUOTA, rate = None, capacity = BURST, name = "foursquare"):
+        self.daily_quota = daily_quota
+        self.rate = daily_quota / float(SECONDS_PER_DAY) if rate is None else rate
+        self.capacity = capacity
+        self.name = name
+
+    def _initial_state(self):
+        now = time.time()
+        return {"tokens": float(self.capacity), "updated": now, "day": int(now // SECONDS_PER_DAY), "used": 0.0,
+            "remaining": None, "limit": None, "reset": None, "blocked_until": 0.0}
+
+    def _transact(self, update):
+        # Calls update(state, now) with exclusive access to the state, saves it, and returns update's result
+        raise NotImplementedError
+
+    def _admits(self, state, now, priority):
+        # Returns whether state has room for a call of the given priority above its reserve, and if not,
+        # seconds until it might, or None if the call should not wait (tuple (bool, float / None)).
+        # Interactive calls are admitted whenever the daily and reported quotas have room.
+        reserve = PRIORITY_RESERVE.get(priority, PRIORITY_RESERVE[PREFETCH])
+        if state["blocked_until"] > now:
+            return False, None
+        if state["used"] >= self.daily_quota * (1.0 - reserve):
+            return False, None
+        if state["remaining"] is not None and state["remaining"] <= reserve * (state["limit"] or 0.0):
+            return False, None
+        if priority == INTERACTIVE:
+            return True, 0.0
+        floor = reserve * self.capacity
+        if state["tokens"] - 1 < floor:
+            return False, (floor + 1 - state["tokens"]) / self.rate
+        return True, 0.0
+
+    def try_acquire(self, priority = INTERACTIVE):
+        """
+        Counts a call of the given priority against the quota if it has room above the priority's reserve.
+        Interactive calls also take a token when one is left, so batch and prefetch calls yield to them.
+
+        Returns:
+        --------
+        tuple (bool, float / None): Whether the call may proceed, and if not, seconds until it might,
+            or None if it should not wait (the API is blocking calls, or the daily or reported quota is too low).
+        """
+        def update(state, now):
+            _refill(state, now, self.rate, self.capacity)
+            admitted, wait = self._admits(state, now, priority)
+            if admitted:
+                state["tokens"] = max(state["tokens"] - 1, 0.0)
+                state["used"] += 1
+                if state["remaining"] is not None:
+                    state["remaining"] -= 1
+            return admitted, wait
+        return self._transact(update)
+
+    def acquire(self, priority = INTERACTIVE, max_wait = None):
+        """
+        Waits for a token for a call of the given priority.
+
+        Parameters:
+        -----------
+        priority (int, optional): INTERACTIVE, BATCH or PREFETCH. Defaults to INTERACTIVE.
+        max_wait (float, optional): Longest time to wait in seconds. Defaults to PRIORITY_MAX_WAIT for priority.
+            Interactive calls never wait, since they are only refused when there is no quota left.
+
+        Returns:
+        --------
+        bool: Whether the call may proceed. Refused calls are counted in rate_limiter_denied_total.
+        """
+        deadline = self.deadline(priority, max_wait)
+        while True:
+            granted, wait = self.try_acquire(priority)
+            if granted:
+                return True
+            wait = self.wait_before_retry(priority, wait, deadline)
+            if wait is None:
+                return False
+            time.sleep(wait)
+
+    def deadline(self, priority, max_wait = None):
+        # Returns the time.monotonic() time after which a call of the given priority stops waiting to be admitted (float)
+        return time.monotonic() + (PRIORITY_MAX_WAIT.get(priority, 0.0) if max_wait is None else max_wait)
+
+    def wait_before_retry(self, priority, wait, deadline):
+        # Returns the seconds to wait before trying again to admit a call that try_acquire refused, with the wait it
+        # returned, or None after counting the call as denied if it cannot be admitted before deadline (float / None)
+        if wait is None or time.monotonic() + wait > deadline:
+            self.count_denied(priority)
+            return None
+        return wait
+
+    def allows(self, priority):
+        # Returns whether a call of the given priority would currently be admitted, without taking a token (bool)
+        def update(state, now):
+            _refill(state, now, self.rate, self.capacity)
+            return self._admits(state, now, priority)[0]
+        return self._transact(update)
+
+    def count_denied(self, priority):
+        # Counts a call that was not admitted
+        increment("rate_limiter_denied_total", {"limiter": self.name, "priority": PRIORITY_NAMES.get(priority, str(priority))},
+            description = "API calls held back by the client-side rate limiter.")
+
+    def observe(self, status_code, headers):
+        """
+        Updates the limiter from an API response. X-RateLimit-Remaining, X-RateLimit-Limit and
+        X-RateLimit-Reset (epoch seconds, or QUOTA_HEADER_TTL from now if absent) record the quota
+        Foursquare reports until it resets, and a 429 holds back every call for its Retry-After
+        delay, at most MAX_BLOCK_SECONDS.
+
+        Parameters:
+        -----------
+        status_code (int): HTTP status of the response.
+        headers (mapping): Response headers.
+        """
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+        limit = _header_number(headers, "X-RateLimit-Limit")
+        reset = _header_number(headers, "X-RateLimit-Reset")
+        retry_after = _header_number(headers, "Retry-After")
+        if remaining is None and status_code != 429:
+            return
+        def update(state, now):
+            _refill(state, now, self.rate, self.capacity)
+            if remaining is not None:
+                state["remaining"] = remaining
+                state["limit"] = limit if limit is not None else state["limit"]
+                state["reset"] = reset if reset is not None and reset > now else now + QUOTA_HEADER_TTL
+            if status_code == 429:
+                block = DEFAULT_BLOCK_SECONDS if retry_after is None else retry_after
+                state["blocked_until"] = max(state["blocked_until"], now + min(max(block, 0.0), MAX_BLOCK_SECONDS))
+        self._transact(update)
+
+    def status(self):
+        # Returns a snapshot of the limiter's state, with tokens refilled to now (dictionary)
+        def update(state, now):
+            _refill(state, now, self.rate, self.capacity)
+            return dict(state)
+        return self._transact(update)
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Rate limiter kept in this process. Safe to share between threads.
+    """
+    def __init__(self, daily_quota = DAILY_QUOTA, rate = None, capacity = BURST, name = "foursquare"):
+        super().__init__(daily_quota, rate, capacity, name)
+        self._state = self._initial_state()
+        self._lock = threading.Lock()
+
+    def _transact(self, update):
+        with self._lock:
+            return update(self._state, time.time())
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    Rate limiter kept in a local SQLite file, so every worker process draws from the same bucket.
+    Each update runs in an immediate transaction, which serializes updates between processes.
+    """
+    blocking = True
+    def __init__(self, path, daily_quota = DAILY_QUOTA, rate = None, capacity = BURST, name = "foursquare"):
+        super().__init__(daily_quota, rate, capacity, name)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS limiters (name TEXT PRIMARY KEY, tokens REAL, updated REAL, day INTEGER, "
+                         "used REAL, remaining REAL, quota_limit REAL, reset REAL, blocked_until REAL)")
+
+    @contextmanager
+    def _connect(self):
+        # Yields a connection in an immediate transaction that commits on success and is always closed
+        conn = sqlite3.connect(self.path, timeout = 10, isolation_level = None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _transact(self, update):
+        with self._connect() as conn:
+            row = conn.execute("SELECT tokens, updated, day, used, remaining, quota_limit, reset, blocked_until FROM limiters "
+                               "WHERE name = ?", (self.name,)).fetchone()
+            if row is None:
+                state = self._initial_state()
+            else:
+                state = dict(zip(("tokens", "updated", "day", "used", "remaining", "limit", "reset", "blocked_until"), row))
+            result = update(state, time.time())
+            conn.execute("INSERT OR REPLACE INTO limiters (name, tokens, updated, day, used, remaining, quota_limit, reset, "
+                         "blocked_until) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (self.name, state["tokens"], state["updated"],
+                         state["day"], state["used"], state["remaining"], state["limit"], state["reset"], state["blocked_until"]))
+            return result
+
+def create_rate_limiter(backend = "memory", path = None, daily_quota = DAILY_QUOTA, rate = None, capacity = BURST, name = "foursquare"):
+    """
+    Creates a rate limiter for the given backend name.
+
+    Parameters:
+    -----------
+    backend (string): Either 'memory' for a per-process limiter or 'sqlite' for one shared through a local file.
+    path (string): Location of the SQLite file. Only used by the 'sqlite' backend.
+    daily_quota (int): Calls allowed per UTC day. Defaults to DAILY_QUOTA.
+    rate (float): Tokens added per second for batch and prefetch calls. Defaults to daily_quota spread over a day.
+    capacity (int): Largest number of tokens held. Defaults to BURST.
+    name (string, optional): Name of the bucket, used in metrics and as its key in the SQLite file.
+
+    Returns:
+    --------
+    MemoryRateLimiter or SQLiteRateLimiter: The created rate limiter.
+    """
+    if backend == "memory":
+        return MemoryRateLimiter(daily_quota, rate, capacity, name)
+    if backend == "sqlite":
+        return SQLiteRateLimiter(path, daily_quota, rate, capacity, name)
+    raise ValueError("Unknown rate limiter backend: {0}".format(backend))
@@ -2,15 +2,144 @@
 Uses Foursquare's Places API to search for nearby venues given location data and other parameters.
 """
 
-import config
-import numpy as np
-import json
-import requests
-from utils import Venue, venues_to_dicts, dicts_to_venues
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+from . import http_client
+from .cache import create_cache
+from .distance import MIN_DISTANCE_METERS, haversine, inverse_distances, paired_haversine, pairwise_haversine, scalar_haversine
+from .instrumentation import increment, timed
+from .lazy import lazy_import
+from .open_hours import open_mask, week_slot
+from .ordering import is_python_rng, segmented_weighted_order_indices, small_weighted_order_indices, weighted_order,\
+    weighted_order_indices
+from .rate_limiter import INTERACTIVE, PREFETCH, QuotaExhausted, create_rate_limiter
+from .utils import Venue, VenueDetails, VenueList, as_venue_details, geohash_encode, geohash_decode
+
+np = lazy_import("numpy")
 
 fs_versioning_date = "20200316"
+FOURSQUARE_API_URL = "https://api.foursquare.com/v2/venues/"
+
+# Explore responses are cached per geohash cell of this precision, so nearby users share results.
+EXPLORE_GEOHASH_PRECISION = 6
+# Seconds an explore response is served from cache, and further seconds it may be served
+# stale when Foursquare rejects the request for exceeding usage. Responses include closed venues,
+# which are filtered by open_venues at the time of each search, so they stay valid for hours.
+EXPLORE_CACHE_TTL = 21600
+EXPLORE_CACHE_STALE_TTL = 86400
+EXPLORE_CACHE_SIZE = 512
+
+# Replaced by the app with a cache built from its EXPLORE_CACHE settings.
+explore_cache = create_cache("memory", max_entries = EXPLORE_CACHE_SIZE, ttl = EXPLORE_CACHE_TTL,
+    stale_ttl = EXPLORE_CACHE_STALE_TTL, name = "explore")
+
+# Venue details change rarely, so they are cached by venue ID for a day and shared by all users.
+DETAILS_CACHE_TTL = 86400
+DETAILS_CACHE_SIZE = 4096
+# Number of upcoming venues whose details are fetched in the background, and threads used to do so.
+PREFETCH_COUNT = 3
+PREFETCH_WORKERS = 4
+
+# How nearby_venues uses venue_index: "remote" only calls Foursquare, "local" only searches the index,
+# "fallback" searches the index when Foursquare fails, and "merge" combines both.
+SEARCH_MODE = "fallback"
+# Lists of at most this many venues are ordered in pure Python, which is faster than NumPy for a first
+# page of results and within a few microseconds of it up to this size, and leaves NumPy unimported
+# until a longer list is ordered.
+SMALL_ORDER_SIZE = 64
+
+# Set by the app to a VenueIndex to record venues from responses and answer local searches.
+venue_index = None
+
+# Queries are split into keywords at commas, semicolons, slashes, bars and the word "or", eg. "tacos, boba",
+# and each keyword is searched separately, at most MAX_QUERY_KEYWORDS of them, on QUERY_WORKERS threads
+# shared by all searches.
+QUERY_SEPARATOR = re.compile(r"\s*(?:[,;/|]|\bor\b)\s*")
+MAX_QUERY_KEYWORDS = 5
+QUERY_WORKERS = 8
+
+# Replaced by the app with a cache built from its DETAILS_CACHE settings.
+details_cache = create_cache("memory", max_entries = DETAILS_CACHE_SIZE, ttl = DETAILS_CACHE_TTL, name = "details")
+
+# Replaced by the app with a rate limiter built from its RATE_LIMITER settings.
+rate_limiter = create_rate_limiter("memory", name = "foursquare")
+
+_prefetch_executor = ThreadPoolExecutor(max_workers = PREFETCH_WORKERS)
+_query_executor = ThreadPoolExecutor(max_workers = QUERY_WORKERS)
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+def count_rate_limited(endpoint):
+    # Counts a response from endpoint that reported usage exceeded
+    increment("rate_limited_total", {"endpoint": endpoint}, description = "API responses with code 429.")
+
+def normalize_query(query):
+    # Returns query lowercased with surrounding and repeated whitespace removed (string)
+    return " ".join(query.lower().split())
+
+def split_query(query):
+    # Returns the distinct normalized keywords of query, in order, at most MAX_QUERY_KEYWORDS of them.
+    # A query without separators is a single keyword (list of strings)
+    keywords = []
+    for keyword in QUERY_SEPARATOR.split(normalize_query(query)):
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords[:MAX_QUERY_KEYWORDS] or [normalize_query(query)]
+
+def explore_cache_key(location_data, query, radius, limit, offset = 0):
+    """
+    Builds the key that an explore request is cached under. Locations in the same geohash cell,
+    and queries that only differ in case or whitespace, share a key.
+
+    Parameters:
+    -----------
+    location_data (dictionary): Contains 'latitude' and 'longitude' of the search.
+    query (string): Search query.
+    radius (int / float): Radius to search within in meters.
+    limit (int): Number of results requested.
+    offset (int, optional): Number of results skipped before this page. Defaults to 0.
+
+    Returns:
+    --------
+    string: The cache key.
+    """
+    cell = geohash_encode(float(location_data["latitude"]), float(location_data["longitude"]), EXPLORE_GEOHASH_PRECISION)
+    return "|".join(["explore", cell, normalize_query(query), str(int(radius)), str(limit), str(offset)])
+
+def explore_request(location_data, query, radius, limit, offset = 0):
+    # Returns url and params (string, dictionary) of the explore request for a search
+    cell = geohash_encode(float(location_data["latitude"]), float(location_data["longitude"]), EXPLORE_GEOHASH_PRECISION)
+    params = dict(
+        client_id = config.foursquare_client_id,
+        client_secret = config.foursquare_client_secret,
+        ll = ",".join([str(coord) for coord in geohash_decode(cell)]),
+        near = location_data["city"],
+        v = fs_versioning_date,
+        radius = radius,
+        query = normalize_query(query),
+        limit = limit,
+        offset = offset
+    )
+    return "".join([FOURSQUARE_API_URL, "explore"]), params
+
+def details_request(venue):
+    # Returns url and params (string, dictionary) of the details request for a venue
+    params = dict(
+        VENUE_ID = venue.get_id(), 
+        client_id = config.foursquare_client_id,
+        client_secret = config.foursquare_client_secret,
+        v = fs_versioning_date
+    )
+    return "".join([FOURSQUARE_API_URL, venue.get_id()]), params
+
+def explore_items_to_venues(items):
+    # Returns VenueList of the venues in the items of an explore response
+    return VenueList.from_dicts([item["venue"] for item in items])
 
-def nearby_venues(location_data, query, radius = 16000, limit = 50):
+def remote_nearby_venues(location_data, query, radius = 16000, limit = 50, offset = 0, priority = INTERACTIVE):
     """
     Makes request to 'explore' endpoint of Foursquare places API and returns the results.
 
@@ -21,125 +150,441 @@ def nearby_venues(location_data, query, radius = 16000, limit = 50):
     radius (int / float): Radius to search within in meters. Defaults to 16,000 meters, or about 10 miles.
         The maximum valid value of radius is 100,000 meters.
     limit (int): Number of results to return. Default value is 50, which is also the maximum number.
+    offset (int): Number of results to skip, for fetching later pages. Default value is 0.
+    priority (int): Priority of the request for rate_limiter. Default value is INTERACTIVE.
+
+    Responses are cached in explore_cache for nearby locations searching the same query and radius.
+    The search is centered on the geohash cell of location_data, so every location sharing a cache key
+    gets the same results. If usage is exceeded, a recently expired cached response is returned instead.
 
     Returns:
     --------
-    list: List of Venue objects with data from GET request. Upon failure, returns empty list.
+    VenueList: Venues with data from GET request. Upon failure, returns empty list.
     """
     try:
-        url = "https://api.foursquare.com/v2/venues/explore"
-        params = dict(
-            client_id = config.foursquare_client_id,
-            client_secret = config.foursquare_client_secret,
-            ll = ",".join([str(location_data["latitude"]), str(location_data["longitude"])]),
-            near = location_data["city"],
-            v = fs_versioning_date,
-            radius = radius,
-            query = query,
-            limit = limit,
-            openNow = 1
-        )
-        resp = requests.get(url = url, params = params)
-        resp_loaded = json.loads(resp.text)
-        if resp_loaded["meta"]["code"] == 429:
-            return "API Usage Exceeded"
-        data = dicts_to_venues(resp_loaded["response"]["groups"][0]["items"])
-        return data
+        key = explore_cache_key(location_data, query, radius, limit, offset = offset)
+        venues = cached_explore_venues(key)
+        if venues is not None:
+            return venues
+        url, params = explore_request(location_data, query, radius, limit, offset)
+        try:
+            resp_loaded = http_client.get_json(url, params = params, endpoint = "foursquare.explore",
+                rate_limiter = rate_limiter, priority = priority)
+        except QuotaExhausted:
+            # Held back by the rate limiter, handled like a 429 without spending quota
+            resp_loaded = None
+        return explore_response_venues(key, resp_loaded)
     except Exception as e:
         print("Explore request failed: {0}".format(e))
         return []
 
-def get_details(venue):
+def cached_explore_venues(key):
+    # Returns VenueList of the explore response cached under key, or None if there is none
+    items = explore_cache.get(key)
+    return explore_items_to_venues(items) if items is not None else None
+
+def explore_response_venues(key, resp_loaded):
+    # Returns VenueList of the venues in a decoded explore response, which is cached under key and added to
+    # venue_index. For a 429, or None when the rate limiter held the request back, returns the recently
+    # expired response cached under key, or 'API Usage Exceeded' (VenueList / string)
+    if resp_loaded is None or resp_loaded["meta"]["code"] == 429:
+        if resp_loaded is not None:
+            count_rate_limited("foursquare.explore")
+        items = explore_cache.get(key, allow_stale = True)
+        if items is not None:
+            return explore_items_to_venues(items)
+        return "API Usage Exceeded"
+    items = resp_loaded["response"]["groups"][0]["items"]
+    explore_cache.set(key, items)
+    if venue_index is not None:
+        venue_index.add_explore_items(items)
+    return explore_items_to_venues(items)
+
+def local_nearby_venues(location_data, query, radius = 16000, limit = 50, offset = 0):
+    # Returns VenueList of venues matching query from venue_index, or an empty list if there is no index
+    if venue_index is None:
+        return []
+    try:
+        venues = venue_index.search(float(location_data["latitude"]), float(location_data["longitude"]), query, radius, offset + limit)
+        return venues.take(range(offset, len(venues)))
+    except Exception as e:
+        print("Local search failed: {0}".format(e))
+        return []
+
+def merge_venues(first, second, limit = None):
+    # Returns VenueList of venues in first followed by venues in second that are not in first
+    merged = VenueList.from_dicts([first.record(i) for i in range(len(first))])
+    seen = set(first.ids)
+    for i in range(len(second)):
+        if second.ids[i] not in seen and (limit is None or len(merged) < limit):
+            seen.add(second.ids[i])
+            merged.append(second.record(i))
+    return merged
+
+def merge_keyword_results(results):
+    """
+    Combines the results of searching each keyword of a query into one set of candidates.
+
+    Parameters:
+    -----------
+    results (list): Result of nearby_venues for each keyword, in keyword order.
+
+    Returns:
+    --------
+    VenueList: Venues found for any keyword, each once, in the order first found. Returns 'API Usage Exceeded'
+        if no keyword found venues and any keyword exceeded usage, and otherwise an empty list if none were found.
+    """
+    found = [venues for venues in results if isinstance(venues, VenueList) and len(venues) > 0]
+    if not found:
+        return "API Usage Exceeded" if any(isinstance(venues, str) for venues in results) else []
+    merged = found[0]
+    for venues in found[1:]:
+        merged = merge_venues(merged, venues)
+    return merged
+
+def keyword_nearby_venues(location_data, query, radius = 16000, limit = 50, search_mode = None, offset = 0, priority = INTERACTIVE):
+    # Returns venues matching a single keyword like nearby_venues, from Foursquare, venue_index or both
+    search_mode = search_mode or SEARCH_MODE
+    if search_mode == "local":
+        return local_nearby_venues(location_data, query, radius, limit, offset)
+    venues = remote_nearby_venues(location_data, query, radius, limit, offset, priority)
+    return add_local_venues(venues, location_data, query, radius, limit, search_mode, offset)
+
+def add_local_venues(venues, location_data, query, radius = 16000, limit = 50, search_mode = None, offset = 0):
+    # Returns venues found by remote_nearby_venues for a single keyword combined with those of venue_index as
+    # search_mode describes: used in their place when Foursquare failed, or merged with them in "merge" mode
+    search_mode = search_mode or SEARCH_MODE
+    if venue_index is None or search_mode == "remote":
+        return venues
+    remote_failed = venues == "API Usage Exceeded" or len(venues) == 0
+    if search_mode == "fallback" and not remote_failed:
+        return venues
+    local = local_nearby_venues(location_data, query, radius, limit, offset)
+    if len(local) == 0:
+        return venues
+    if remote_failed:
+        return local
+    return merge_venues(venues, local, limit)
+
+@timed("nearby_venues")
+def nearby_venues(location_data, query, radius = 16000, limit = 50, search_mode = None, offset = 0, priority = INTERACTIVE):
+    """
+    Finds venues matching query near location_data, from the Foursquare explore endpoint,
+    the local venue_index, or both. A query of several keywords, eg. "tacos, boba", is searched
+    one keyword at a time, concurrently and each through explore_cache, and the venues found are
+    merged by ID, so it takes about as long as its slowest keyword.
+
+    Parameters:
+    -----------
+    location_data (dictionary): Contains location data from ipinfo and timestamp.
+    query (string): One or more categories used to select venues (eg. coffee), separated as split_query describes.
+    radius (int / float): Radius to search within in meters. Defaults to 16,000 meters, or about 10 miles.
+    limit (int): Number of results to return for each keyword. Default value is 50.
+    search_mode (string, optional): One of "remote", "local", "fallback" or "merge". Defaults to SEARCH_MODE.
+    offset (int, optional): Number of results to skip for each keyword, for fetching later pages. Defaults to 0.
+    priority (int, optional): Priority of explore requests for rate_limiter. Defaults to INTERACTIVE.
+
+    Returns:
+    --------
+    VenueList: Venues found. Returns 'API Usage Exceeded' or an empty list on failure like remote_nearby_venues.
+    """
+    keywords = split_query(query)
+    if len(keywords) == 1:
+        return keyword_nearby_venues(location_data, keywords[0], radius, limit, search_mode, offset, priority)
+    increment("query_keywords_total", amount = len(keywords), description = "Keywords searched separately for multi-keyword queries.")
+    futures = [_query_executor.submit(keyword_nearby_venues, location_data, keyword, radius, limit, search_mode, offset, priority)
+        for keyword in keywords]
+    return merge_keyword_results([future.result() for future in futures])
+
+@timed("get_details")
+def get_details(venue, priority = INTERACTIVE):
     """
     Given Venue object to get more information about, makes request to 'details' endpoint of 
-    Foursquare places API using the object's 'id' attribute and places the output of the request 
-    in the Venue object's 'details' attribute.
+    Foursquare places API using the object's 'id' attribute and places the output of the request, 
+    parsed into a VenueDetails, in the Venue object's 'details' attribute.
 
     Parameters:
     -----------
     venue (Venue object): Venue to get the details of. Puts the returned results into the 
         'details' attribute of the object. 
+    priority (int, optional): Priority of the request for rate_limiter. Defaults to INTERACTIVE.
+
+    Details are read from details_cache when another request has already fetched them.
 
     Returns:
     --------
     None (if API usage is exceeded, return 'API Usage Exceeded' as string). 
     """
     try: 
-        url = "".join(["https://api.foursquare.com/v2/venues/", venue.get_id()])
-        params = dict(
-            VENUE_ID = venue.get_id(), 
-            client_id = config.foursquare_client_id,
-            client_secret = config.foursquare_client_secret,
-            v = fs_versioning_date
-        )
-        resp = requests.get(url = url, params = params)
-        resp_loaded = json.loads(resp.text)
-        if resp_loaded["meta"]["code"] == 429:
-            return "API Usage Exceeded"
-        venue.details = resp_loaded["response"]["venue"]
+        details = cached_details(venue.get_id())
+        if details is not None:
+            venue.details = details
+            return
+        url, params = details_request(venue)
+        try:
+            resp_loaded = http_client.get_json(url, params = params, endpoint = "foursquare.details",
+                rate_limiter = rate_limiter, priority = priority)
+        except QuotaExhausted:
+            resp_loaded = None
+        return store_details_response(venue, resp_loaded)
     except Exception as e:
         print("details request failed: {0}".format(e))
 
+def cached_details(venue_id):
+    # Returns VenueDetails of venue_id from details_cache, or None if they have not been fetched.
+    # Raw details dictionaries cached before details were parsed into VenueDetails are parsed.
+    return as_venue_details(details_cache.get(venue_id))
+
+def store_details(venue, details_dictionary):
+    # Parses the venue object of a details response into venue's details, versioned by the time
+    # they were fetched, caches them, and adds the venue to venue_index
+    venue.details = VenueDetails.from_response(details_dictionary, version = time.time())
+    details_cache.set(venue.get_id(), venue.details)
+    if venue_index is not None:
+        venue_index.add(details_dictionary)
+
+def store_details_response(venue, resp_loaded):
+    # Stores the venue of a decoded details response as venue's details with store_details. Returns None, or
+    # 'API Usage Exceeded' for a 429, or None when the rate limiter held the request back (None / string)
+    if resp_loaded is None or resp_loaded["meta"]["code"] == 429:
+        if resp_loaded is not None:
+            count_rate_limited("foursquare.details")
+        return "API Usage Exceeded"
+    store_details(venue, resp_loaded["response"]["venue"])
+
+def open_venues(venues_data, location_data, now = None):
+    """
+    Removes venues that are closed at the user's local time, according to the hours in their details.
+    Explore requests do not ask for open venues only, so that responses can be cached regardless of
+    the time, and this filter is applied to the venues instead. Venues whose details have not been
+    fetched, or whose hours are unknown, are kept.
+
+    Parameters:
+    -----------
+    venues_data (list / VenueList): Venue objects to filter. Details found in details_cache are loaded into them.
+    location_data (dictionary): Contains the 'timestamp' of the location lookup, which gives the user's time zone.
+    now (float, optional): Time as seconds since the epoch. Defaults to the current time.
+
+    Returns:
+    --------
+    list / VenueList: The venues not known to be closed, in order, in the same type of container as venues_data.
+    """
+    if len(venues_data) == 0:
+        return venues_data
+    for venue in venues_data:
+        load_cached_details(venue)
+    mask = open_mask([venue.get_open_slots() for venue in venues_data], week_slot(location_data, now))
+    kept = [i for i, is_open in enumerate(mask) if is_open]
+    if len(kept) == len(venues_data):
+        return venues_data
+    increment("closed_venues_total", amount = len(venues_data) - len(kept), description = "Venues left out of suggestions for being closed.")
+    if isinstance(venues_data, VenueList):
+        return venues_data.take(kept)
+    return [venues_data[i] for i in kept]
+
+def load_cached_details(venue):
+    # Sets venue's details from details_cache if another request has fetched them, without making a request.
+    # Returns whether the venue has details (bool)
+    if venue.details == None:
+        venue.details = cached_details(venue.get_id())
+    return venue.details != None
+
+def details_version(venue):
+    # Returns version of venue's details, which changes whenever they are fetched again, or None without details
+    if venue.details == None:
+        return None
+    return venue.details.version
+
+def claim_prefetches(venues_data, start, count = PREFETCH_COUNT):
+    # Returns the venues of venues_data[start:start + count] that need their details prefetched, marking them as
+    # in flight so other requests skip them until release_prefetch. Skips venues that have details, whose details
+    # are cached, or that are already being fetched (list of Venue)
+    claimed = []
+    for venue in venues_data[max(start, 0):max(start, 0) + count]:
+        if venue.details != None or details_cache.get(venue.get_id()) is not None:
+            continue
+        with _prefetch_lock:
+            if venue.get_id() in _prefetching:
+                continue
+            _prefetching.add(venue.get_id())
+        claimed.append(venue)
+    return claimed
+
+def release_prefetch(venue):
+    # Marks a venue returned by claim_prefetches as no longer in flight
+    with _prefetch_lock:
+        _prefetching.discard(venue.get_id())
+
+def _prefetch_venue_details(venue):
+    # Fetches details of a single venue into details_cache, then marks it as no longer in flight
+    try:
+        get_details(venue, priority = PREFETCH)
+    finally:
+        release_prefetch(venue)
+
+def prefetch_details(venues_data, start, count = PREFETCH_COUNT):
+    """
+    Fetches details for venues_data[start:start + count] in background threads, so they are served
+    from details_cache when the user reaches them. Venues that already have details, are cached,
+    or are being fetched by another request are skipped, and nothing is prefetched while rate_limiter
+    is keeping its reserve for requests users are waiting on.
+
+    Parameters:
+    -----------
+    venues_data (list): A list of Venue objects in the order they are suggested.
+    start (int): Index of the first venue to prefetch.
+    count (int, optional): Number of venues to prefetch. Defaults to PREFETCH_COUNT.
+
+    Returns:
+    --------
+    None
+    """
+    if not rate_limiter.allows(PREFETCH):
+        rate_limiter.count_denied(PREFETCH)
+        return
+    for venue in claim_prefetches(venues_data, start, count):
+        _prefetch_executor.submit(_prefetch_venue_details, venue)
+
+def smooth_distribution(inverse, smoothing_coeff = 0.25):
+    # Blends inverse distances with their total along the last axis and normalizes each row to sum to 1 (numpy.ndarray)
+    smoothed = (1 - smoothing_coeff) * inverse + smoothing_coeff * np.sum(inverse, axis = -1, keepdims = True)
+    return smoothed / np.sum(smoothed, axis = -1, keepdims = True)
+
+def venue_coords(venues_data):
+    # Returns (lat, lng) coordinates of each venue as an array of shape (N, 2)
+    if isinstance(venues_data, VenueList):
+        lats, lngs = venues_data.latlngs()
+        return np.column_stack((np.frombuffer(lats, dtype = float), np.frombuffer(lngs, dtype = float)))
+    return np.array([venue.get_latlng() for venue in venues_data], dtype = float).reshape(-1, 2)
+
 def latlng_distribution(venues_data, original_location, smoothing_coeff = 0.25):
     """
     Uses each venue's distance from original location to create a probability distribution.
     Probability of selection scales inversely with distance. Optional smoothing coefficient to
-    influence how much impact distance has.
+    influence how much impact distance has. Distances are great-circle distances in meters,
+    floored at distance.MIN_DISTANCE_METERS so a venue at the original location does not divide by zero.
 
     Parameters:
     -----------
-    venues_data (list): A list of dictionaries produced by api request.
+    venues_data (list): A list of Venue objects produced by api request.
     original_location (tuple): A tuple of (lat, lng) coordinates that serves as home location. Each venue's distance
         is calculated with respect to this location.
     smoothing_coeff (float, optional): A number between 0 and 1 inclusive. If the coefficient is 0, the probability of
         selecting a venue is directly related. If the coefficient is 1, the distribution is uniform. The default
-        value is 0.2.
+        value is 0.25.
 
     Returns:
     --------
     list: A probability distribution for selecting each venue.
     """
-    # Use of euclidean_distance approximation valid for small radii.
-    euclidean_distance = lambda coord1, coord2: np.sqrt(np.sum((np.array(coord1) - np.array(coord2)) ** 2))
-    distances = np.array([])
     try:
-        for venue in venues_data:
-            distances = np.append(distances, 1 / euclidean_distance(original_location, venue.get_latlng()))
-        smoothed_distances = (1 - smoothing_coeff) * distances + smoothing_coeff * np.sum(distances)
-        smoothed_distances /= np.sum(smoothed_distances)
-        return smoothed_distances
+        distances = haversine(original_location, venue_coords(venues_data))
+        return smooth_distribution(inverse_distances(distances), smoothing_coeff)
     except Exception as e:
         print("Failed to create distribution:", e, "; returning uniform distribution.")
         return np.ones(len(venues_data)) / len(venues_data)
 
-def distance_weighted_order(venues_data, original_location, smoothing_coeff = 0.25):
+def small_latlng_distribution(venues_data, original_location, smoothing_coeff = 0.25):
+    # Returns latlng_distribution of a short list of venues, computed in pure Python (list of floats)
+    try:
+        if isinstance(venues_data, VenueList):
+            coords = zip(venues_data.lats, venues_data.lngs)
+        else:
+            coords = [venue.get_latlng() for venue in venues_data]
+        inverse = [1 / max(distance, MIN_DISTANCE_METERS) for distance in scalar_haversine(original_location, coords)]
+        total = sum(inverse)
+        smoothed = [(1 - smoothing_coeff) * weight + smoothing_coeff * total for weight in inverse]
+        normalizer = sum(smoothed)
+        return [weight / normalizer for weight in smoothed]
+    except Exception as e:
+        print("Failed to create distribution:", e, "; returning uniform distribution.")
+        return [1 / len(venues_data)] * len(venues_data)
+
+def batch_latlng_distribution(venues_data, original_locations, smoothing_coeff = 0.25):
+    """
+    Computes latlng_distribution over the same venues for many home locations at once.
+
+    Parameters:
+    -----------
+    venues_data (list): A list of N Venue objects.
+    original_locations (array-like): Array of shape (M, 2) holding (lat, lng) home locations.
+    smoothing_coeff (float, optional): Smoothing coefficient as in latlng_distribution. Defaults to 0.25.
+
+    Returns:
+    --------
+    numpy.ndarray: Array of shape (M, N) whose row i is the distribution for original_locations[i].
+    """
+    distances = pairwise_haversine(original_locations, venue_coords(venues_data))
+    return smooth_distribution(inverse_distances(distances), smoothing_coeff)
+
+@timed("distance_weighted_order")
+def distance_weighted_order(venues_data, original_location, smoothing_coeff = 0.25, rng = None):
     """
     Given a list of venues, reorders the randomly list using the latlng_distribution function as
-    an initial seed.
+    an initial seed. Venues are drawn without replacement, with each draw weighted by the distribution
+    over the venues that remain, in a single vectorized pass.
 
     Parameters:
     -----------
-    venues_data (list): A list of dictionaries produced by api request.
+    venues_data (list / VenueList): Venue objects produced by api request.
     original_location (tuple): A tuple of (lat, lng) coordinates that serves as home location. Each venue's distance
         is calculated with respect to this location.
     smoothing_coeff (float, optional): A number between 0 and 1 inclusive. If the coefficient is 0, the probability of
         selecting a venue is directly related. If the coefficient is 1, the distribution is uniform. The default
         value is 0.25.
+    rng (None / int / random.Random / numpy.random.Generator, optional): Source of randomness. Pass a seeded
+        Generator or an int for a reproducible ordering. Defaults to None, which seeds from the OS.
+
+    Lists of at most SMALL_ORDER_SIZE venues are ordered in pure Python unless rng is a NumPy Generator.
 
     Returns:
     --------
-    list: A reordered list of dictionaries corresponding to venue data.
+    list / VenueList: The venues reordered, in the same type of container as venues_data.
     """
+    if len(venues_data) == 0:
+        return venues_data
+    if len(venues_data) <= SMALL_ORDER_SIZE and is_python_rng(rng):
+        order = small_weighted_order_indices(small_latlng_distribution(venues_data, original_location, smoothing_coeff), rng)
+        if isinstance(venues_data, VenueList):
+            return venues_data.take(order)
+        return [venues_data[i] for i in order]
     p = latlng_distribution(venues_data, original_location, smoothing_coeff)
-    if len(set(p)) == 1:
-        venues_data_cpy = venues_data.copy()
-        np.random.shuffle(venues_data_cpy)
-        return venues_data_cpy
-    d = dict(zip(venues_data, p))
-    reordered = []
-    while len(reordered) < len(venues_data):
-        venue = np.random.choice(list(d.keys()), p = list(d.values()))
-        reordered.append(venue)
-        last_weight = d.pop(venue)
-        d = dict(zip(d.keys(), np.array(list(d.values())) / (1 - last_weight)))
-    return reordered
+    if isinstance(venues_data, VenueList):
+        return venues_data.take(weighted_order_indices(p, rng))
+    return weighted_order(venues_data, p, rng)
+
+@timed("batch_distance_weighted_order")
+def batch_distance_weighted_order(venue_lists, original_locations, smoothing_coeff = 0.25, rng = None):
+    """
+    Orders many venue lists at once, each as distance_weighted_order would for its own home location.
+    The venues of every list are scored together: distances over the concatenated coordinates, each
+    list's smoothing and normalization with segment sums, and one exponential-key sort for all lists.
+
+    Parameters:
+    -----------
+    venue_lists (list of VenueList): Venues of each search.
+    original_locations (list of tuples): (lat, lng) home location of each search.
+    smoothing_coeff (float, optional): Smoothing coefficient as in latlng_distribution. Defaults to 0.25.
+    rng (None / int / numpy.random.Generator, optional): Source of randomness.
+
+    Returns:
+    --------
+    list of VenueList: The venues of each search reordered, in the same order as venue_lists.
+    """
+    counts = np.array([len(venues) for venues in venue_lists], dtype = int)
+    nonempty = np.flatnonzero(counts)
+    if nonempty.size == 0:
+        return [VenueList() for _ in venue_lists]
+    coords = np.concatenate([venue_coords(venue_lists[i]) for i in nonempty])
+    origins = np.repeat(np.asarray(original_locations, dtype = float).reshape(-1, 2)[nonempty], counts[nonempty], axis = 0)
+    offsets = np.concatenate(([0], np.cumsum(counts[nonempty])))
+    inverse = inverse_distances(paired_haversine(origins, coords))
+    # Same blend as smooth_distribution, with each list's totals taken over its own segment
+    totals = np.repeat(np.add.reduceat(inverse, offsets[:-1]), counts[nonempty])
+    smoothed = (1 - smoothing_coeff) * inverse + smoothing_coeff * totals
+    p = smoothed / np.repeat(np.add.reduceat(smoothed, offsets[:-1]), counts[nonempty])
+    order = segmented_weighted_order_indices(p, offsets, rng)
+    ordered = [VenueList() for _ in venue_lists]
+    for segment, i in enumerate(nonempty):
+        ordered[i] = venue_lists[i].take(order[offsets[segment]:offsets[segment + 1]] - offsets[segment])
+    return ordered
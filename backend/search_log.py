@@ -0,0 +1,78 @@
+"""
+Log of the searches users make, one JSON object per line, read by the cache warmer to predict
+which explore requests will be made. Locations are recorded as the geohash cell explore requests
+are cached under, rather than the user's coordinates.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from .open_hours import local_time_zone
+from .search_for_venues import EXPLORE_GEOHASH_PRECISION, normalize_query
+from .utils import geohash_encode
+
+class SearchLog:
+    """
+    Appends searches to a JSON lines file. Safe to share between threads, and each search is written
+    with a single append, so worker processes can share the file.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        self._lock = threading.Lock()
+
+    def record(self, location_data, query, radius, **fields):
+        """
+        Appends a search.
+
+        Parameters:
+        -----------
+        location_data (dictionary): Contains 'latitude', 'longitude', 'city' and 'timestamp' of the user.
+        query (string): Search query, recorded normalized.
+        radius (int / float): Radius of the search in meters.
+        **fields: Further values recorded with the search, eg. reused = True.
+        """
+        now = time.time()
+        entry = dict(fields,
+            time = now,
+            local_hour = datetime.fromtimestamp(now, local_time_zone(location_data)).hour,
+            cell = geohash_encode(float(location_data["latitude"]), float(location_data["longitude"]), EXPLORE_GEOHASH_PRECISION),
+            city = location_data.get("city", None),
+            query = normalize_query(query),
+            radius = int(radius)
+        )
+        line = "".join([json.dumps(entry), "\n"])
+        try:
+            with self._lock, open(self.path, "a") as f:
+                f.write(line)
+        except OSError as e:
+            print("Failed to log search: {0}".format(e))
+
+def read_searches(path):
+    """
+    Reads the searches in a log written by SearchLog.
+
+    Parameters:
+    -----------
+    path (string): Location of the log.
+
+    Returns:
+    --------
+    list of dictionaries: Logged searches in the order they were made. Lines that are not valid, eg.
+        one being written, are skipped, and a missing log has no searches.
+    """
+    searches = []
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and all(key in entry for key in ("cell", "query", "radius")):
+                    searches.append(entry)
+    except FileNotFoundError:
+        pass
+    return searches
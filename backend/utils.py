@@ -2,36 +2,124 @@
 Utility functions and classes.
 """
 import json
+from array import array
 from urllib.parse import quote
+from .open_hours import parse_open_slots
 
 DEFAULT_METER_CNT = 8046
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Joins the lines of a formatted address into the one string VenueList keeps for it.
+ADDRESS_SEPARATOR = "\n"
+
+class VenueDetails:
+    """
+    Fields of a Foursquare venue details response that the app renders, parsed once when the
+    details are fetched. Stored and cached in place of the raw response, which is many times larger.
+    Version is the time the details were fetched, so renders of them can be cached by version.
+    Open slots is the week bitmap of open_hours.parse_open_slots, or None if the hours are unknown.
+    """
+    __slots__ = ("description", "url", "canonical_url", "rating", "contacts", "hours", "version", "open_slots")
+
+    def __init__(self, description = "", url = "", canonical_url = "", rating = -1, contacts = None,
+            hours = "Hours not listed.", version = 0, open_slots = None):
+        self.description = description
+        self.url = url
+        self.canonical_url = canonical_url
+        self.rating = rating
+        self.contacts = contacts or {}
+        self.hours = hours
+        self.version = version
+        self.open_slots = open_slots
+
+    @classmethod
+    def from_response(cls, details_dictionary, version = 0):
+        """
+        Parses the 'venue' object of a details response.
+
+        Parameters:
+        -----------
+        details_dictionary (dictionary): Venue object from the details endpoint.
+        version (int / float, optional): Version of the details, eg. the time they were fetched. Defaults to 0.
+
+        Returns:
+        --------
+        VenueDetails: The parsed details. Missing fields get the values shown when nothing is listed.
+        """
+        return cls(
+            description = details_dictionary.get("description", None) or "",
+            url = details_dictionary.get("url", None) or "",
+            canonical_url = details_dictionary.get("canonicalUrl", None) or "",
+            rating = details_dictionary.get("rating", -1),
+            contacts = parse_contacts(details_dictionary.get("contact", None)),
+            hours = parse_hours(details_dictionary.get("hours", None)),
+            version = version,
+            open_slots = parse_open_slots(details_dictionary.get("hours", None))
+        )
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        # Details pickled before open_slots was added have unknown hours
+        self.open_slots = None
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return "VenueDetails(rating = {0}, hours = {1})".format(self.rating, self.hours)
+
+def parse_hours(hours):
+    # Returns string in the form of Open "day range" for/from "time range" from the first timeframe of hours.
+    # Returns "Hours not listed." if day range or time range not found
+    try:
+        timeframe = hours["timeframes"][0]
+        days = timeframe.get("days", "")
+        rendered_time = timeframe.get("open", [{}])[0].get("renderedTime", "")
+    except (IndexError, KeyError, TypeError, AttributeError):
+        return "Hours not listed."
+    if not days or not rendered_time:
+        return "Hours not listed."
+    return "".join(["Open ", days, " for/from ", rendered_time, "."])
+
+def parse_contacts(contact):
+    # Returns dictionary of contact links and phone number (string, string) from the contact object of details.
+    # Returns empty dictionary if no contacts provided
+    contacts = {}
+    if not contact:
+        return contacts
+    media_prefixes = ["https://www.facebook.com/", "https://twitter.com/", "https://www.instagram.com/"]
+    old_media_keys = ["facebookUsername", "twitter", "instagram"]
+    new_media_keys = ["Facebook", "Twitter", "Instagram"] 
+    for i in range(3):
+        media_contact = contact.get(old_media_keys[i], "")
+        if media_contact:
+            contacts[new_media_keys[i]] = "".join([media_prefixes[i], media_contact])
+    contacts["Phone Number"] = contact.get("formattedPhone", "")
+    unformatted_number = contact.get("phone", "")
+    if len(unformatted_number) == 10:
+        contacts["Phone Number href"] = "".join([unformatted_number[0:3], "-", unformatted_number[3:6], "-", unformatted_number[6:]])
+    else:
+        contacts["Phone Number href"] = ""
+    return contacts
+
+def as_venue_details(details):
+    # Returns details as a VenueDetails, parsing them if they are a raw details dictionary (VenueDetails / None)
+    if isinstance(details, dict):
+        return VenueDetails.from_response(details)
+    return details
 
 class Venue:
     """
     Class used to store venue data.
-    Attributes include id, location, and name.
+    Attributes include id, location, and name, and details once they have been fetched.
     """
+    __slots__ = ("id", "location", "name", "details")
+
     def __init__(self, venue_dictionary):
         self.id = venue_dictionary["id"]
         self.location = venue_dictionary["location"]
         self.name = venue_dictionary["name"]
-        self.details = venue_dictionary.get("details", None) 
-        self.description = venue_dictionary.get("description", None)
-        self.url = venue_dictionary.get("url", None)
-        self.canonical_url = venue_dictionary.get("canonical_url", None)
-        self.rating = venue_dictionary.get("rating", None)
-        self.contacts = venue_dictionary.get("contacts", None)
-        self.hours = venue_dictionary.get("hours", None)
-
-    def assign_members(self):
-        # Assigns values to all attributes
-        # Calls all get functions at once to try to improve caching
-        self.description = self.get_description()
-        self.url = self.get_url()
-        self.canonical_url = self.get_canonical_url()
-        self.rating = self.get_rating()
-        self.contacts = self.get_contacts()
-        self.hours = self.get_hours()
+        self.details = as_venue_details(venue_dictionary.get("details", None))
 
     def get_name(self):
         # Returns name (string)
@@ -54,90 +142,52 @@ class Venue:
         return self.location["formattedAddress"]
 
     def get_hours(self):
-        # Returns string in the form of Open "day range" from "time range".
-        # Returns empty string if day range or time range not found 
-        if self.hours != None:
-            return self.hours
+        # Returns string in the form of Open "day range" for/from "time range".
+        # Returns "Hours not listed." if 'details' is None or no hours provided
+        if self.details == None:
+            return "Hours not listed."
+        return self.details.hours
+
+    def get_open_slots(self):
+        # Returns week bitmap of the slots the venue is open, or None if 'details' is None or hours are unknown (bytes / None)
         if self.details == None:
-            self.hours = "Hours not listed."
-            return self.hours
-        try:
-            days = self.details.get("hours", {}).get("timeframes", [{}])[0].get("days", "")
-            hours = self.details.get("hours", {}).get("timeframes", [{}])[0].get("open", [{}])[0].get("renderedTime", "")
-            if not days or not hours:
-                return "Hours not listed."
-            self.hours = "".join(["Open ", days, " for/from ", hours, "."])
-            return self.hours
-        except:
-            self.hours = "Hours not listed."
-            return self.hours
+            return None
+        return self.details.open_slots
 
     def get_description(self):
         # Returns provided description extracted from details (string)
         # Returns empty string if 'details' is None or no description provided
-        if self.description != None:
-            return self.description
-        if self.details == None or not self.details.get("description", None):
-            self.description = ""
-        else:
-            self.description = self.details["description"]
-        return self.description
+        if self.details == None:
+            return ""
+        return self.details.description
 
     def get_url(self):
         # Returns provided url extracted from details (string) 
         # Returns empty string if 'details' is None or no url provided
-        if self.url != None: 
-            return self.url 
-        if self.details == None or not self.details.get("url", None):
-            self.url = ""
-        else:
-            self.url = self.details["url"]
-        return self.url
+        if self.details == None:
+            return ""
+        return self.details.url
 
     def get_canonical_url(self):
         # Returns provided canonical url extracted from details (string) 
         # Returns empty string if 'details' is None or no canonical url provided
-        if self.canonical_url != None:
-            return self.canonical_url
-        if self.details == None or not self.details.get("canonicalUrl", None):
-            self.canonical_url = ""
-        else:
-            self.canonical_url = self.details["canonicalUrl"]
-        return self.canonical_url
+        if self.details == None:
+            return ""
+        return self.details.canonical_url
 
     def get_rating(self):
         # Returns provided rating extracted from details (int)
         # Returns -1 if 'details' is None or no rating provided
-        if self.rating != None:
-            return self.rating
         if self.details == None:
-            self.rating = -1
-        else:
-            self.rating = self.details.get("rating", -1)
-        return self.rating
+            return -1
+        return self.details.rating
 
     def get_contacts(self):
         # Returns dictionary of contact links and phone number (string, string) 
         # Returns empty dictionary if 'details' is None or no contacts provided
-        if self.contacts != None:
-            return self.contacts
-        self.contacts = {}
-        if self.details != None and self.details.get("contact", None):
-            self.contacts = {}
-            media_prefixes = ["https://www.facebook.com/", "https://twitter.com/", "https://www.instagram.com/"]
-            old_media_keys = ["facebookUsername", "twitter", "instagram"]
-            new_media_keys = ["Facebook", "Twitter", "Instagram"] 
-            for i in range(3):
-                media_contact = self.details["contact"].get(old_media_keys[i], "")
-                if media_contact:
-                    self.contacts[new_media_keys[i]] = "".join([media_prefixes[i], media_contact])
-            self.contacts["Phone Number"] = self.details["contact"].get("formattedPhone", "")
-            unformatted_number = self.details["contact"].get("phone", "")
-            if len(unformatted_number) == 10:
-                self.contacts["Phone Number href"] = "".join([unformatted_number[0:3], "-", unformatted_number[3:6], "-", unformatted_number[6:]])
-            else:
-                self.contacts["Phone Number href"] = ""
-        return self.contacts
+        if self.details == None:
+            return {}
+        return self.details.contacts
 
     def get_maps_link(self):
         # Returns google maps link (string) 
@@ -152,11 +202,8 @@ class Venue:
             "location": self.location,
             "name": self.name
         }
-        remaining_attribute_names = ["details", "description", "url", "canonical_url", "rating", "contacts", "hours"]
-        remaining_attribute_vals = [self.details, self.description, self.url, self.canonical_url, self.rating, self.contacts, self.hours]
-        for i in range(len(remaining_attribute_names)):
-            if remaining_attribute_vals[i]:
-                d[remaining_attribute_names[i]] = remaining_attribute_vals[i]
+        if self.details != None:
+            d["details"] = self.details
         return d
 
     def __str__(self):
@@ -165,6 +212,119 @@ class Venue:
     def __repr__(self):
         return "Venue(id = {0}, address = {1}, name = {2})".format(self.id, self.get_address(), self.name)
 
+class VenueList:
+    """
+    Compact, list-like container of venues stored by column. Only the fields the app renders are
+    kept: ids and names in flat lists, coordinates in float arrays, each formatted address joined
+    into one string, and details once fetched. A Venue is only built when its index is accessed,
+    with its location rebuilt from the columns, so reading one suggestion does not decode every
+    venue in a search. Built venues are kept, so details assigned to them persist, and are folded
+    back into the columns when pickled.
+    """
+    __slots__ = ("ids", "names", "lats", "lngs", "addresses", "details", "_views")
+
+    def __init__(self, venues = ()):
+        self.ids = []
+        self.names = []
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.addresses = []
+        self.details = []
+        self._views = {}
+        for venue in venues:
+            self.append(venue.to_dict() if isinstance(venue, Venue) else venue)
+
+    @classmethod
+    def from_dicts(cls, dicts_list):
+        # Returns VenueList built from a list of venue dictionaries
+        return cls(dicts_list)
+
+    def append(self, venue_dictionary):
+        # Adds a venue given its dictionary representation. Fields other than its id, name, coordinates,
+        # formatted address and details are not kept.
+        location = venue_dictionary["location"]
+        self.ids.append(venue_dictionary["id"])
+        self.names.append(venue_dictionary["name"])
+        self.lats.append(location["lat"])
+        self.lngs.append(location["lng"])
+        self.addresses.append(ADDRESS_SEPARATOR.join(location.get("formattedAddress", [])))
+        self.details.append(as_venue_details(venue_dictionary.get("details", None)))
+
+    def location(self, index):
+        # Returns location dictionary of the venue at index, with 'lat', 'lng' and 'formattedAddress' (dictionary)
+        address = self.addresses[index]
+        return {"lat": self.lats[index], "lng": self.lngs[index],
+            "formattedAddress": address.split(ADDRESS_SEPARATOR) if address else []}
+
+    def venue_details(self, index):
+        # Returns details of the venue at index, including any assigned to its built Venue (VenueDetails / None)
+        view = self._views.get(index, None)
+        return view.details if view is not None else self.details[index]
+
+    def record(self, index):
+        # Returns dictionary representation of the venue at index
+        d = {"id": self.ids[index], "location": self.location(index), "name": self.names[index]}
+        details = self.venue_details(index)
+        if details is not None:
+            d["details"] = details
+        return d
+
+    def take(self, indices):
+        # Returns new VenueList with the venues at indices, in that order
+        indices = [int(index) for index in indices]
+        taken = VenueList()
+        taken.ids = [self.ids[i] for i in indices]
+        taken.names = [self.names[i] for i in indices]
+        taken.lats = array("d", [self.lats[i] for i in indices])
+        taken.lngs = array("d", [self.lngs[i] for i in indices])
+        taken.addresses = [self.addresses[i] for i in indices]
+        taken.details = [self.venue_details(i) for i in indices]
+        return taken
+
+    def latlngs(self):
+        # Returns (lats, lngs) arrays of coordinates (array, array)
+        return self.lats, self.lngs
+
+    def to_dicts(self):
+        # Returns list of dictionaries for every venue
+        return [self.record(i) for i in range(len(self))]
+
+    def _fold_views(self):
+        # Copies details assigned to built venues back into the columns
+        for index, view in self._views.items():
+            self.details[index] = view.details
+
+    def __getstate__(self):
+        self._fold_views()
+        return (self.ids, self.names, self.lats, self.lngs, self.addresses, self.details)
+
+    def __setstate__(self, state):
+        self.ids, self.names, self.lats, self.lngs, self.addresses, self.details = state
+        self._views = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("VenueList index out of range")
+        view = self._views.get(index, None)
+        if view is None:
+            view = Venue(self.record(index))
+            self._views[index] = view
+        return view
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "VenueList(size = {0})".format(len(self))
+
 def miles_to_meters(miles):
     """
     Converts miles to meters. 
@@ -182,6 +342,71 @@ def miles_to_meters(miles):
     except:
         return DEFAULT_METER_CNT
 
+def geohash_encode(lat, lng, precision = 6):
+    """
+    Encodes coordinates as a geohash, so that nearby coordinates share the same key.
+    A precision of 6 corresponds to a cell of roughly 1.2 km by 0.6 km.
+
+    Parameters:
+    -----------
+    lat (float): Latitude in degrees.
+    lng (float): Longitude in degrees.
+    precision (int, optional): Number of characters in the geohash. Defaults to 6.
+
+    Returns:
+    --------
+    string: The geohash of the cell containing (lat, lng).
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        coord, coord_range = (lng, lng_range) if even else (lat, lat_range)
+        mid = (coord_range[0] + coord_range[1]) / 2
+        bits <<= 1
+        if coord >= mid:
+            bits |= 1
+            coord_range[0] = mid
+        else:
+            coord_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def geohash_decode(geohash):
+    """
+    Decodes a geohash into the coordinates at the center of its cell.
+
+    Parameters:
+    -----------
+    geohash (string): Geohash produced by geohash_encode.
+
+    Returns:
+    --------
+    tuple: (lat, lng) coordinates of the center of the cell.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            coord_range = lng_range if even else lat_range
+            mid = (coord_range[0] + coord_range[1]) / 2
+            if (bits >> shift) & 1:
+                coord_range[0] = mid
+            else:
+                coord_range[1] = mid
+            even = not even
+    return ((lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2)
+
 def write_to_json(data, filename):
     """
     Saves data to json file specified by filename.
@@ -254,7 +479,4 @@ def dicts_to_venues(dicts_list):
     try: 
         return [Venue(d) for d in dicts_list]
     except Exception as e:
-        try:
-            return [Venue(d["venue"]) for d in dicts_list]
-        except Exception as e:
-            return dicts_list
+        return dicts_list
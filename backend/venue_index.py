@@ -0,0 +1,203 @@
+"""
+Local index of venues seen in earlier Foursquare responses, so searches can be answered
+without calling the explore endpoint. Venues are bucketed by geohash cell for spatial lookup,
+and an inverted index maps words in venue names and categories to venue ids. Each worker process
+keeps its own index, bounded by max_entries, which can be saved to and reloaded from a JSON file.
+"""
+
+import atexit
+import os
+import re
+import threading
+import time
+from .distance import haversine
+from .lazy import lazy_import
+from .utils import VenueList, geohash_encode, read_from_json, write_to_json
+
+np = lazy_import("numpy")
+
+# Geohash precision of the spatial grid. Cells at precision 5 are about 4.9 km on each side.
+GRID_PRECISION = 5
+CELL_DEGREES = 180.0 / 2 ** 12
+METERS_PER_DEGREE = 111320.0
+# Venues kept in an index by default. Past this, the venues of the cells added to least recently are evicted.
+MAX_ENTRIES = 20000
+# Seconds between saves of an index to its autosave file while venues are being added.
+AUTOSAVE_INTERVAL = 300
+
+def tokenize(text):
+    # Returns set of lowercase words in text (set of strings)
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+class VenueIndex:
+    """
+    In-memory spatial and keyword index of at most max_entries venues. Safe to share between threads.
+    """
+    def __init__(self, max_entries = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.venues = {}
+        # Cells in the order venues were last added to them, so the first cell is evicted first
+        self.grid = {}
+        self.tokens = {}
+        self._words = {}
+        self._lock = threading.Lock()
+        self._save_path = None
+        self._save_interval = AUTOSAVE_INTERVAL
+        self._last_save = time.monotonic()
+        self._changed = False
+
+    def add(self, venue_dictionary):
+        # Adds or replaces a venue given a dictionary with 'id', 'name', 'location' and optionally 'categories'
+        venue = {key: venue_dictionary[key] for key in ("id", "name", "location", "categories") if key in venue_dictionary}
+        lat, lng = float(venue["location"]["lat"]), float(venue["location"]["lng"])
+        words = tokenize(venue["name"])
+        for category in venue.get("categories", []):
+            words |= tokenize(category.get("name", ""))
+        with self._lock:
+            if venue["id"] in self.venues:
+                self._remove(venue["id"])
+            self.venues[venue["id"]] = venue
+            self._words[venue["id"]] = words
+            cell = geohash_encode(lat, lng, GRID_PRECISION)
+            venue_ids = self.grid.pop(cell, set())
+            venue_ids.add(venue["id"])
+            self.grid[cell] = venue_ids
+            for word in words:
+                self.tokens.setdefault(word, set()).add(venue["id"])
+            self._changed = True
+            self._evict()
+
+    def _evict(self):
+        # Removes the venues of the cells added to least recently until at most max_entries remain, keeping the cell
+        # added to last. Caller must hold the lock.
+        while len(self.venues) > self.max_entries and len(self.grid) > 1:
+            for venue_id in self.grid.pop(next(iter(self.grid))):
+                self._remove(venue_id)
+
+    def _remove(self, venue_id):
+        # Removes a venue from the grid and inverted index. Caller must hold the lock.
+        venue = self.venues.pop(venue_id)
+        cell = geohash_encode(float(venue["location"]["lat"]), float(venue["location"]["lng"]), GRID_PRECISION)
+        venue_ids = self.grid.get(cell, set())
+        venue_ids.discard(venue_id)
+        if not venue_ids:
+            self.grid.pop(cell, None)
+        for word in self._words.pop(venue_id, ()):
+            venue_ids = self.tokens.get(word, set())
+            venue_ids.discard(venue_id)
+            if not venue_ids:
+                self.tokens.pop(word, None)
+
+    def add_explore_items(self, items):
+        # Adds every venue in the items of an explore response, then saves the index if an autosave is due
+        for item in items:
+            try:
+                self.add(item["venue"])
+            except (KeyError, TypeError, ValueError):
+                continue
+        if self._save_path is not None and time.monotonic() - self._last_save >= self._save_interval:
+            self.save()
+
+    def autosave(self, filename, interval = AUTOSAVE_INTERVAL):
+        """
+        Saves the index to filename when it has changed, at most every interval seconds as explore
+        responses are added and once more when the process exits. Every worker saves to the same
+        file, so the index reloaded on the next start is the last one saved.
+
+        Parameters:
+        -----------
+        filename (string): Name of file the index is saved to, usually the one it was imported from.
+        interval (int / float, optional): Seconds between saves. Defaults to AUTOSAVE_INTERVAL.
+
+        Returns:
+        --------
+        None
+        """
+        self._save_path = filename
+        self._save_interval = interval
+        atexit.register(self.save)
+
+    def save(self):
+        # Saves the index to its autosave file if venues were added since the last save
+        with self._lock:
+            if not self._changed:
+                return
+            self._changed = False
+            self._last_save = time.monotonic()
+        self.export_json(self._save_path)
+
+    def import_json(self, filename):
+        """
+        Adds venues from a JSON file written by export_json, or holding a list of venue
+        dictionaries or explore items.
+
+        Parameters:
+        -----------
+        filename (string): Name of file that venues are read from.
+
+        Returns:
+        --------
+        int: Number of venues in the index after importing.
+        """
+        data = read_from_json(filename) or []
+        for entry in data:
+            try:
+                self.add(entry["venue"] if "venue" in entry else entry)
+            except (KeyError, TypeError, ValueError):
+                continue
+        return len(self)
+
+    def export_json(self, filename):
+        # Saves every indexed venue to filename so it can be imported on the next start, oldest cells first. The file is
+        # replaced in one step, so workers saving at the same time never leave it partly written.
+        with self._lock:
+            venues = [self.venues[venue_id] for venue_ids in self.grid.values() for venue_id in venue_ids]
+        temporary = "{0}.{1}.{2}.tmp".format(filename, os.getpid(), threading.get_ident())
+        write_to_json(venues, temporary)
+        try:
+            os.replace(temporary, filename)
+        except OSError as e:
+            print("Failed to save to {0}: {1}".format(filename, e))
+
+    def _cells_within(self, lat, lng, radius):
+        # Returns geohash cells overlapping the bounding box of a circle (set of strings)
+        lat_span = radius / METERS_PER_DEGREE
+        lng_span = radius / (METERS_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+        lats = np.arange(lat - lat_span, lat + lat_span + CELL_DEGREES, CELL_DEGREES)
+        lngs = np.arange(lng - lng_span, lng + lng_span + CELL_DEGREES, CELL_DEGREES)
+        return {geohash_encode(min(max(cell_lat, -90.0), 90.0), ((cell_lng + 180.0) % 360.0) - 180.0, GRID_PRECISION)
+            for cell_lat in lats for cell_lng in lngs}
+
+    def search(self, lat, lng, query, radius, limit = 50):
+        """
+        Finds indexed venues within radius meters of (lat, lng) whose name or categories contain
+        every word of query.
+
+        Parameters:
+        -----------
+        lat (float): Latitude of the search center.
+        lng (float): Longitude of the search center.
+        query (string): Words to match against venue names and categories.
+        radius (int / float): Radius to search within in meters.
+        limit (int, optional): Maximum number of venues returned, nearest first. Defaults to 50.
+
+        Returns:
+        --------
+        VenueList: Matching venues.
+        """
+        with self._lock:
+            candidates = set()
+            for cell in self._cells_within(lat, lng, radius):
+                candidates |= self.grid.get(cell, set())
+            for word in tokenize(query):
+                candidates &= self.tokens.get(word, set())
+            venues = [self.venues[venue_id] for venue_id in candidates]
+        if not venues:
+            return VenueList()
+        coords = np.array([(venue["location"]["lat"], venue["location"]["lng"]) for venue in venues], dtype = float)
+        distances = haversine((lat, lng), coords)
+        nearest = [i for i in np.argsort(distances) if distances[i] <= radius][:limit]
+        return VenueList.from_dicts([venues[i] for i in nearest])
+
+    def __len__(self):
+        return len(self.venues)
@@ -0,0 +1,155 @@
+"""
+Suggestions for a search that are fetched page by page from the explore endpoint as the user
+clicks through them, instead of capping a search at the first 50 results.
+"""
+
+import copy
+from . import search_for_venues
+from .distance import haversine
+from .lazy import lazy_import
+from .utils import VenueList
+
+np = lazy_import("numpy")
+
+# Venues requested for the first page, kept small so the first suggestion comes back quickly,
+# and for each page after it. Foursquare returns at most 50 venues per page.
+FIRST_PAGE_SIZE = 15
+PAGE_SIZE = 50
+# The next page is fetched once the user is within this many venues of the end of what is loaded.
+PAGE_LOOKAHEAD = 3
+# A new search for the same query reuses the previous search's venues when the user has moved less
+# than this fraction of its radius, as long as at least RERANK_MIN_VENUES unseen venues are in range.
+RERANK_DRIFT_FRACTION = 0.1
+RERANK_MIN_VENUES = 5
+
+class VenueStream:
+    """
+    Ordered suggestions for one search. Stores the search parameters, the venues loaded so far,
+    and the offset of the next explore page. Pickleable, so it can be kept in the result store.
+    Streams reused by rerank only keep venues within max_distance of original_location.
+    """
+    max_distance = None
+
+    def __init__(self, location_data, query, radius, original_location, venues, page_size = FIRST_PAGE_SIZE):
+        self.location_data = location_data
+        self.query = query
+        self.radius = radius
+        self.original_location = original_location
+        self.offset = page_size
+        self.exhausted = len(venues) < page_size
+        # Explore results include closed venues, which are left out here and from every later page
+        self.venues = search_for_venues.open_venues(venues if isinstance(venues, VenueList) else VenueList(venues), location_data)
+
+    def ensure(self, index, lookahead = PAGE_LOOKAHEAD):
+        """
+        Fetches further pages until more than lookahead venues follow index, or no venues remain.
+        New venues are merged with the venues after index and that remainder is reordered with
+        distance_weighted_order, so venues up to and including index keep their positions.
+
+        Parameters:
+        -----------
+        index (int): Index of the venue the user is currently seeing.
+        lookahead (int, optional): Number of venues that should be loaded after index. Defaults to PAGE_LOOKAHEAD.
+
+        Returns:
+        --------
+        bool: Whether any venues were added.
+        """
+        added = False
+        while not self.exhausted and index + lookahead >= len(self.venues) - 1:
+            page = search_for_venues.nearby_venues(self.location_data, self.query, self.radius,
+                limit = PAGE_SIZE, offset = self.offset)
+            if page == "API Usage Exceeded":
+                # Keep what is loaded and try again on the next click
+                break
+            self.offset += PAGE_SIZE
+            self.exhausted = len(page) < PAGE_SIZE
+            if self.max_distance is not None and len(page) > 0:
+                page = page.take(np.flatnonzero(self.distances(page) <= self.max_distance))
+            page = search_for_venues.open_venues(page, self.location_data)
+            seen = set(self.venues.ids)
+            new = [page.record(i) for i in range(len(page)) if page.ids[i] not in seen]
+            if not new:
+                continue
+            split = min(index + 1, len(self.venues))
+            remainder = VenueList.from_dicts([self.venues.record(i) for i in range(split, len(self.venues))] + new)
+            remainder = search_for_venues.distance_weighted_order(remainder, self.original_location)
+            self.venues = VenueList.from_dicts([self.venues.record(i) for i in range(split)]
+                + [remainder.record(i) for i in range(len(remainder))])
+            added = True
+        return added
+
+    def distances(self, venues):
+        # Returns distance in meters from original_location to each of venues (numpy.ndarray)
+        return haversine(self.original_location, search_for_venues.venue_coords(venues))
+
+    def rerank(self, query, radius, original_location, seen, drift_fraction = RERANK_DRIFT_FRACTION, min_venues = RERANK_MIN_VENUES):
+        """
+        Reuses this search's venues for a new search of the same query from a nearby location, without
+        calling Foursquare. The first seen venues keep their positions, and the venues after them are
+        filtered to radius of original_location and reordered from there with distance_weighted_order.
+        Later pages are still fetched for this search's location and radius, and filtered the same way.
+
+        Parameters:
+        -----------
+        query (string): Query of the new search.
+        radius (int / float): Radius of the new search in meters.
+        original_location (tuple): (lat, lng) coordinates of the new search.
+        seen (int): Number of venues, from the start, that the user has already been shown.
+        drift_fraction (float, optional): Largest distance moved, as a fraction of this search's radius,
+            for the venues to be reused. Defaults to RERANK_DRIFT_FRACTION.
+        min_venues (int, optional): Fewest unseen venues within radius for the venues to be reused.
+            Defaults to RERANK_MIN_VENUES.
+
+        Returns:
+        --------
+        VenueStream: A new stream whose unseen venues start at index min(seen, len(self.venues)),
+            or None if the new search needs new results from Foursquare.
+        """
+        if search_for_venues.split_query(query) != search_for_venues.split_query(self.query) or radius > self.radius:
+            return None
+        if haversine(self.original_location, original_location)[0] > drift_fraction * self.radius:
+            return None
+        split = min(seen, len(self.venues))
+        remainder = self.venues.take(range(split, len(self.venues)))
+        stream = copy.copy(self)
+        stream.original_location = original_location
+        stream.max_distance = radius
+        if len(remainder) > 0:
+            remainder = remainder.take(np.flatnonzero(stream.distances(remainder) <= radius))
+            remainder = search_for_venues.open_venues(remainder, self.location_data)
+        if len(remainder) < min_venues:
+            return None
+        remainder = search_for_venues.distance_weighted_order(remainder, original_location)
+        stream.venues = VenueList.from_dicts([self.venues.record(i) for i in range(split)]
+            + [remainder.record(i) for i in range(len(remainder))])
+        return stream
+
+    def drop_closed(self, start, count = search_for_venues.PREFETCH_COUNT):
+        """
+        Removes venues among the count starting at start whose details show they are closed now,
+        so venues whose details were prefetched are not suggested while closed.
+
+        Parameters:
+        -----------
+        start (int): Index of the first venue to check.
+        count (int, optional): Number of venues to check. Defaults to search_for_venues.PREFETCH_COUNT.
+
+        Returns:
+        --------
+        bool: Whether any venues were removed.
+        """
+        end = min(start + count, len(self.venues))
+        if start >= end:
+            return False
+        checked = self.venues.take(range(start, end))
+        kept = search_for_venues.open_venues(checked, self.location_data)
+        if len(kept) == len(checked):
+            return False
+        self.venues = VenueList.from_dicts([self.venues.record(i) for i in range(start)]
+            + [kept.record(i) for i in range(len(kept))] + [self.venues.record(i) for i in range(end, len(self.venues))])
+        return True
+
+    def has_next(self, index):
+        # Returns whether a venue follows index, or could be loaded after it (bool)
+        return index < len(self.venues) - 1 or not self.exhausted
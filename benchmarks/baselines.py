@@ -0,0 +1,79 @@
+"""
+Saving benchmark results as baselines and comparing later runs against them.
+Baselines are JSON files in benchmarks/baselines, mapping each measurement name to a number
+where lower is better (seconds, or bytes).
+"""
+
+import json
+import os
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+# Measurements more than this fraction slower than the baseline are reported as regressions.
+REGRESSION_TOLERANCE = 0.10
+
+def baseline_path(name):
+    # Returns path of the baseline file called name (string)
+    return os.path.join(BASELINE_DIR, "{0}.json".format(name))
+
+def save_baseline(name, results):
+    # Saves results (dictionary of measurement name to number) as the baseline called name
+    os.makedirs(BASELINE_DIR, exist_ok = True)
+    with open(baseline_path(name), "w") as f:
+        json.dump(results, f, indent = 2, sort_keys = True)
+    print("Saved baseline to {0}".format(baseline_path(name)))
+
+def load_baseline(name):
+    # Returns results saved as the baseline called name, or None if there is none (dictionary / None)
+    try:
+        with open(baseline_path(name), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def compare_to_baseline(name, results, tolerance = REGRESSION_TOLERANCE):
+    """
+    Prints each measurement in results next to the saved baseline, flagging any that are
+    more than tolerance slower.
+
+    Parameters:
+    -----------
+    name (string): Name of the baseline to compare against.
+    results (dictionary): Measurement name to number, lower being better.
+    tolerance (float, optional): Allowed fractional slowdown. Defaults to REGRESSION_TOLERANCE.
+
+    Returns:
+    --------
+    list of strings: Names of measurements that regressed. Empty if there is no baseline.
+    """
+    baseline = load_baseline(name)
+    if baseline is None:
+        print("No baseline saved at {0}".format(baseline_path(name)))
+        return []
+    regressions = []
+    print("{0:<56} {1:>12} {2:>12} {3:>8}".format("measurement", "baseline", "current", "change"))
+    for key in sorted(results):
+        if key not in baseline:
+            print("{0:<56} {1:>12} {2:12.6g} {3:>8}".format(key, "-", results[key], "new"))
+            continue
+        change = (results[key] - baseline[key]) / baseline[key] if baseline[key] else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print("{0:<56} {1:12.6g} {2:12.6g} {3:+7.1%}{4}".format(key, baseline[key], results[key], change, flag))
+    return regressions
+
+def add_baseline_arguments(parser, default_name):
+    # Adds the --save-baseline and --compare options shared by the benchmark scripts to parser
+    parser.add_argument("--save-baseline", nargs = "?", const = default_name, metavar = "NAME",
+        help = "save results as a baseline (default name: {0})".format(default_name))
+    parser.add_argument("--compare", nargs = "?", const = default_name, metavar = "NAME",
+        help = "compare results with a saved baseline and exit with status 1 on regressions")
+
+def handle_baseline_arguments(args, results):
+    # Saves or compares results as requested on the command line. Returns exit status (int)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare:
+        return 1 if compare_to_baseline(args.compare, results) else 0
+    return 0
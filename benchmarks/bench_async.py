@@ -0,0 +1,80 @@
+"""
+Compares user actions per second for one worker using the sync backend and the async backend,
+against the local mock API. Each action looks up a location, searches for venues, fetches details
+for the first suggestion and starts prefetching them for the next few, as a search in the app does,
+with caching disabled so every call reaches the mock.
+
+Run from the repository root:
+    python benchmarks/bench_async.py --latency 0.05 --actions 40 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+sys.path.insert(0, "./benchmarks")
+from mock_api import MockAPI
+
+def disable_caches():
+    # Replaces the backend caches with ones whose entries expire immediately
+    from backend import get_current_location, search_for_venues
+    from backend.cache import MemoryCache
+    search_for_venues.explore_cache = MemoryCache(ttl = 0)
+    search_for_venues.details_cache = MemoryCache(ttl = 0)
+    get_current_location._location_cache = MemoryCache(ttl = 0)
+
+def sync_action(query, detail_count):
+    # One user action on a sync worker, where each call waits for the previous one and prefetches run in threads
+    from backend.get_current_location import get_location_data
+    from backend.search_for_venues import nearby_venues, get_details, distance_weighted_order, prefetch_details
+    location_data = get_location_data("8.8.8.8")
+    venues = nearby_venues(location_data, query, 8000)
+    ordered = distance_weighted_order(venues, (location_data["latitude"], location_data["longitude"]))
+    get_details(ordered[0])
+    prefetch_details(ordered, 1, detail_count - 1)
+
+async def async_action(query, detail_count):
+    # One user action on the async backend, with prefetches run on the event loop
+    from backend import async_backend
+    location_data = await async_backend.get_location_data("8.8.8.8")
+    await async_backend.search(location_data, query, 8000,
+        (location_data["latitude"], location_data["longitude"]), detail_count)
+
+async def run_async_actions(actions, concurrency, detail_count):
+    # Runs actions with at most concurrency of them in flight on one event loop
+    semaphore = asyncio.Semaphore(concurrency)
+    async def limited(i):
+        async with semaphore:
+            await async_action("coffee {0}".format(i), detail_count)
+    await asyncio.gather(*[limited(i) for i in range(actions)])
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type = float, default = 0.05, help = "seconds the mock API waits per request")
+    parser.add_argument("--actions", type = int, default = 40, help = "user actions to run per backend")
+    parser.add_argument("--concurrency", type = int, default = 8, help = "actions in flight at once on the async backend")
+    parser.add_argument("--details", type = int, default = 4, help = "suggestions to fetch or prefetch details for per action")
+    args = parser.parse_args()
+
+    api = MockAPI(latency = args.latency).start()
+    api.point_backend_at_mock()
+    disable_caches()
+    from backend import async_backend
+
+    start = time.perf_counter()
+    for i in range(args.actions):
+        sync_action("coffee {0}".format(i), args.details)
+    sync_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    async_backend.run(run_async_actions(args.actions, args.concurrency, args.details))
+    async_seconds = time.perf_counter() - start
+    api.stop()
+
+    print("mock latency: {0:.0f} ms, actions: {1}, details per action: {2}".format(args.latency * 1000, args.actions, args.details))
+    print("sync worker:  {0:8.2f} actions/s ({1:.1f} ms per action)".format(args.actions / sync_seconds, 1000 * sync_seconds / args.actions))
+    print("async worker: {0:8.2f} actions/s (concurrency {1})".format(args.actions / async_seconds, args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares memory use and per-request latency of the venue representations: a list of venue
+dictionaries decoded with dicts_to_venues (the old session format), a list of Venue objects,
+and a VenueList.
+
+Run from the repository root:
+    python benchmarks/bench_venues.py --venues 50 1000
+"""
+
+import argparse
+import pickle
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, "./benchmarks")
+from mock_api import explore_payload, install_config
+
+install_config()
+from backend.utils import Venue, VenueList, dicts_to_venues, venues_to_dicts
+
+def make_dicts(count):
+    # Returns count venue dictionaries shaped like explore results
+    items = explore_payload({"ll": ["37.87,-122.27"], "query": ["coffee"]}, count)["response"]["groups"][0]["items"]
+    return [item["venue"] for item in items]
+
+def allocated_bytes(build):
+    # Returns bytes allocated for the object that build returns
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def report(name, seconds, number):
+    print("  {0:<44} {1:10.2f} us".format(name, 1e6 * seconds / number))
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--venues", type = int, nargs = "+", default = [50, 1000], help = "list sizes to benchmark")
+    parser.add_argument("--number", type = int, default = 200, help = "repetitions per timing")
+    args = parser.parse_args()
+
+    for count in args.venues:
+        dicts = make_dicts(count)
+        venues = dicts_to_venues(dicts)
+        venue_list = VenueList.from_dicts(dicts)
+        index = count // 2
+        print("{0} venues".format(count))
+        for name, data in [("list of dicts", dicts), ("list of Venue", venues), ("VenueList", venue_list)]:
+            blob = pickle.dumps(data)
+            print("  {0:<14} memory {1:8d} bytes, pickled {2:8d} bytes".format(name, allocated_bytes(lambda: pickle.loads(blob)), len(blob)))
+        report("index one venue, dicts_to_venues(dicts)[i]", timeit.timeit(lambda: dicts_to_venues(dicts)[index], number = args.number), args.number)
+        report("index one venue, VenueList[i]", timeit.timeit(lambda: venue_list[index], number = args.number), args.number)
+        report("venues_to_dicts round trip", timeit.timeit(lambda: dicts_to_venues(venues_to_dicts(venues)), number = args.number), args.number)
+        report("VenueList pickle round trip", timeit.timeit(lambda: pickle.loads(pickle.dumps(venue_list)), number = args.number), args.number)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+End-to-end load test of the app. Starts the mock API and the app under gunicorn, then runs
+virtual users that each search, click Next a number of times and click Prev once, and reports
+p50/p95/p99 latency of each step and overall throughput.
+
+Run from the repository root:
+    python benchmarks/load.py --users 8 --searches 5 --next-clicks 10
+    python benchmarks/load.py --save-baseline
+    python benchmarks/load.py --compare
+Pass --server flask to use the development server where gunicorn is not installed, or
+--app-url to run against an app that is already running, and --fragments to click Next and Prev
+the way the page script does.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, "./benchmarks")
+from baselines import add_baseline_arguments, handle_baseline_arguments
+from mock_api import PAYLOAD_DIR, MockAPI
+
+import numpy as np
+import requests
+
+QUERIES = ["coffee", "tacos", "bookstore", "pizza", "ramen", "park"]
+CSRF_PATTERN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+DETAILS_URL_PATTERN = re.compile(r'<div class="venue-details" data-details-url="([^"]+)"')
+STEPS = ["location", "search", "next", "prev", "details"]
+
+def start_app(args, mock_url, instance_dir):
+    # Starts the app in a subprocess, with its SQLite stores and caches in instance_dir. Returns the process
+    # and the app's URL once it answers requests (tuple)
+    env = dict(os.environ, MOCK_API_URL = mock_url, PORT = str(args.port), INSTANCE_DIR = instance_dir)
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "--bind", "127.0.0.1:{0}".format(args.port),
+            "--workers", str(args.workers), "--threads", str(args.threads), "--pythonpath", "benchmarks", "load_app:app"]
+    else:
+        command = [sys.executable, "benchmarks/load_app.py"]
+    process = subprocess.Popen(command, env = env, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    url = "http://127.0.0.1:{0}".format(args.port)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("App exited with status {0}".format(process.returncode))
+        try:
+            requests.get("".join([url, "/about"]), timeout = 1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not start within 30 seconds")
+
+def csrf_token(html):
+    # Returns the CSRF token of the first form in html (string)
+    match = CSRF_PATTERN.search(html)
+    if match is None:
+        raise ValueError("No CSRF token in page")
+    return match.group(1)
+
+class VirtualUser(threading.Thread):
+    """
+    Thread that repeats the scenario (search, Next clicks, then Prev) a number of times from its
+    own IP address and session, recording (step, seconds, ok) for each request. With fragments,
+    Next and Prev request only the suggestion card, and then its details if they were not included.
+    """
+    def __init__(self, number, url, searches, next_clicks, radius, fragments = False):
+        super().__init__(daemon = True)
+        self.url = url
+        self.fragments = fragments
+        self.searches = searches
+        self.next_clicks = next_clicks
+        self.radius = radius
+        self.number = number
+        self.samples = []
+        self.http = requests.Session()
+        # Public addresses, since client_ip ignores private ones, sent as if appended by the one trusted proxy
+        self.http.headers["X-Forwarded-For"] = "8.{0}.{1}.{2}".format(number // 65536 % 256, number // 256 % 256, number % 256)
+
+    def request(self, step, data = None, path = "/"):
+        # Sends a GET, or a POST of data, to path and records how long it took. Returns response text
+        start = time.perf_counter()
+        url = "".join([self.url.rstrip("/"), path])
+        try:
+            if data is None:
+                response = self.http.get(url, timeout = 30)
+            else:
+                response = self.http.post(url, data = data, timeout = 30)
+            ok = response.status_code == 200
+            text = response.text
+        except requests.RequestException:
+            ok, text = False, ""
+        self.samples.append((step, time.perf_counter() - start, ok))
+        return text
+
+    def run(self):
+        token = None
+        for i in range(self.searches):
+            if token is None:
+                try:
+                    token = csrf_token(self.request("location"))
+                except ValueError:
+                    continue
+            query = QUERIES[(self.number + i) % len(QUERIES)]
+            self.request("search", {"csrf_token": token, "query": query, "radius": self.radius, "submit": "Give me some suggestions!"})
+            for _ in range(self.next_clicks):
+                self.click("next", {"csrf_token": token, "next_query": "Next Suggestion"})
+            self.click("prev", {"csrf_token": token, "prev_query": "Previous Suggestion"})
+
+    def click(self, step, data):
+        # Clicks Next or Prev, as a full page or as a fragment followed by its details
+        if not self.fragments:
+            self.request(step, data)
+            return
+        match = DETAILS_URL_PATTERN.search(self.request(step, data, "/suggestion"))
+        if match is not None:
+            self.request("details", path = match.group(1))
+
+def summarize(samples, elapsed):
+    """
+    Prints latency percentiles for each step and overall throughput.
+
+    Returns:
+    --------
+    dictionary: Measurement name to number, lower being better, for the baseline.
+    """
+    results = {}
+    print("{0:<10} {1:>8} {2:>8} {3:>10} {4:>10} {5:>10}".format("step", "requests", "errors", "p50 ms", "p95 ms", "p99 ms"))
+    for step in STEPS + ["all"]:
+        seconds = np.array([sample[1] for sample in samples if step in ("all", sample[0])])
+        if seconds.size == 0:
+            continue
+        errors = sum(1 for sample in samples if step in ("all", sample[0]) and not sample[2])
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        print("{0:<10} {1:8d} {2:8d} {3:10.1f} {4:10.1f} {5:10.1f}".format(step, seconds.size, errors, 1000 * p50, 1000 * p95, 1000 * p99))
+        results.update({"{0}.p50_seconds".format(step): p50, "{0}.p95_seconds".format(step): p95, "{0}.p99_seconds".format(step): p99})
+    print("Throughput: {0:.1f} requests/s over {1:.1f} s".format(len(samples) / elapsed, elapsed))
+    results["seconds_per_request"] = elapsed / max(len(samples), 1)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type = int, default = 8, help = "concurrent virtual users")
+    parser.add_argument("--searches", type = int, default = 5, help = "searches per user")
+    parser.add_argument("--next-clicks", type = int, default = 10, help = "Next clicks after each search")
+    parser.add_argument("--fragments", action = "store_true", help = "click Next and Prev like the page script, loading only the card")
+    parser.add_argument("--radius", type = float, default = 5.0, help = "search radius in miles")
+    parser.add_argument("--latency", type = float, default = 0.05, help = "mock API latency in seconds")
+    parser.add_argument("--rate-limit", type = float, default = 0.0, help = "fraction of Foursquare requests answered with 429")
+    parser.add_argument("--quota", type = int, help = "Foursquare calls the mock API allows before answering with 429")
+    parser.add_argument("--server", choices = ["gunicorn", "flask"], default = "gunicorn")
+    parser.add_argument("--workers", type = int, default = 1, help = "gunicorn worker processes")
+    parser.add_argument("--threads", type = int, default = 8, help = "gunicorn threads per worker")
+    parser.add_argument("--port", type = int, default = 8001)
+    parser.add_argument("--app-url", help = "URL of an already running app, instead of starting one")
+    add_baseline_arguments(parser, "load")
+    args = parser.parse_args()
+
+    api = MockAPI(args.latency, rate_limit = args.rate_limit, payload_dir = PAYLOAD_DIR, quota = args.quota).start()
+    process = None
+    url = args.app_url
+    # Each run starts with empty caches, so responses cached by an earlier run are not measured
+    instance_dir = tempfile.mkdtemp(prefix = "load-")
+    if url is None:
+        process, url = start_app(args, api.url, instance_dir)
+    try:
+        users = [VirtualUser(i, url, args.searches, args.next_clicks, args.radius, args.fragments) for i in range(args.users)]
+        start = time.perf_counter()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        api.stop()
+        shutil.rmtree(instance_dir, ignore_errors = True)
+    results = summarize([sample for user in users for sample in user.samples], elapsed)
+    print("Mock API requests: {0}".format(", ".join("{0} {1}".format(kind, count) for kind, count in sorted(api.counts.items()))))
+    sys.exit(handle_baseline_arguments(args, results))
+
+if __name__ == "__main__":
+    main()
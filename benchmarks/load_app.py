@@ -0,0 +1,39 @@
+"""
+WSGI entry point that serves the app with its backend pointed at the mock API named by the
+MOCK_API_URL environment variable. Used by load.py:
+    MOCK_API_URL=http://127.0.0.1:8765 gunicorn --pythonpath benchmarks load_app:app
+Set RESULT_STORE=memory to measure the per-process store, which only works with a single worker, and
+INSTANCE_DIR to keep the SQLite stores and caches in that directory, eg. an empty one for each run
+so no responses are cached from an earlier run.
+"""
+
+import os
+import sys
+
+sys.path[:0] = [".", "./benchmarks"]
+from mock_api import point_backend_at
+
+point_backend_at(os.environ.get("MOCK_API_URL", "http://127.0.0.1:8765"))
+import application
+from application import app
+from backend import search_for_venues
+from backend.cache import create_cache
+from backend.rate_limiter import create_rate_limiter
+
+if os.environ.get("INSTANCE_DIR"):
+    for setting in ("RESULT_STORE_PATH", "EXPLORE_CACHE_PATH", "DETAILS_CACHE_PATH", "RATE_LIMITER_PATH"):
+        app.config[setting] = os.path.join(os.environ["INSTANCE_DIR"], os.path.basename(app.config[setting]))
+    search_for_venues.explore_cache = create_cache(app.config["EXPLORE_CACHE"], path = app.config["EXPLORE_CACHE_PATH"],
+        max_entries = search_for_venues.EXPLORE_CACHE_SIZE, ttl = search_for_venues.EXPLORE_CACHE_TTL,
+        stale_ttl = search_for_venues.EXPLORE_CACHE_STALE_TTL, name = "explore")
+    search_for_venues.details_cache = create_cache(app.config["DETAILS_CACHE"], path = app.config["DETAILS_CACHE_PATH"],
+        max_entries = search_for_venues.DETAILS_CACHE_SIZE, ttl = search_for_venues.DETAILS_CACHE_TTL, name = "details")
+    search_for_venues.rate_limiter = create_rate_limiter(app.config["RATE_LIMITER"], path = app.config["RATE_LIMITER_PATH"],
+        name = "foursquare")
+app.config["RESULT_STORE"] = os.environ.get("RESULT_STORE", app.config["RESULT_STORE"])
+application.result_store = create_cache(app.config["RESULT_STORE"], path = app.config["RESULT_STORE_PATH"],
+    max_entries = app.config["RESULT_STORE_SIZE"], ttl = app.config["RESULT_STORE_TTL"], name = "results")
+
+if __name__ == "__main__":
+    # Development server, for machines without gunicorn
+    app.run(host = "127.0.0.1", port = int(os.environ.get("PORT", "8000")), threaded = True)
@@ -0,0 +1,104 @@
+"""
+Microbenchmarks of the backend functions on the request path: latlng_distribution,
+distance_weighted_order with NumPy and, for short lists, in pure Python, dicts_to_venues / venues_to_dicts,
+and parsing and reading venue details.
+Venues come from the recorded explore payload, repeated to reach the larger list sizes.
+
+Run from the repository root:
+    python benchmarks/micro.py --venues 15 50 1000
+    python benchmarks/micro.py --save-baseline
+    python benchmarks/micro.py --compare
+"""
+
+import argparse
+import copy
+import pickle
+import random
+import sys
+import timeit
+
+sys.path.insert(0, "./benchmarks")
+from baselines import add_baseline_arguments, handle_baseline_arguments
+from mock_api import PAYLOAD_DIR, install_config, load_payloads
+
+install_config()
+import numpy as np
+from backend.search_for_venues import SMALL_ORDER_SIZE, distance_weighted_order, latlng_distribution
+from backend.utils import Venue, VenueDetails, VenueList, dicts_to_venues, venues_to_dicts
+
+ORIGINAL_LOCATION = (37.8716, -122.2727)
+
+def make_dicts(payloads, count):
+    # Returns count venue dictionaries from the recorded explore payload, with unique ids
+    items = payloads["explore"]["response"]["groups"][0]["items"]
+    dicts = []
+    for i in range(count):
+        venue = copy.deepcopy(items[i % len(items)]["venue"])
+        venue["id"] = "{0}-{1}".format(venue["id"], i)
+        dicts.append(venue)
+    return dicts
+
+def best_time(function, number, repeat):
+    # Returns the fastest of repeat runs of function, in seconds per call (float)
+    return min(timeit.repeat(function, number = number, repeat = repeat)) / number
+
+def run_benchmarks(payloads, counts, number, repeat):
+    """
+    Times each function at each list size.
+
+    Returns:
+    --------
+    dictionary: Measurement name, eg. 'distance_weighted_order[50]', to seconds per call, or to bytes
+        for the pickled size of venue details.
+    """
+    details = payloads["details"]["response"]["venue"]
+    results = {}
+    for count in counts:
+        dicts = make_dicts(payloads, count)
+        venues = dicts_to_venues(dicts)
+        venue_list = VenueList.from_dicts(dicts)
+        rng = np.random.default_rng(0)
+        python_rng = random.Random(0)
+        timings = [
+            ("latlng_distribution", lambda: latlng_distribution(venue_list, ORIGINAL_LOCATION)),
+            ("distance_weighted_order", lambda: distance_weighted_order(venue_list, ORIGINAL_LOCATION, rng = rng)),
+            ("distance_weighted_order (list of Venue)", lambda: distance_weighted_order(venues, ORIGINAL_LOCATION, rng = rng)),
+            ("dicts_to_venues", lambda: dicts_to_venues(dicts)),
+            ("venues_to_dicts", lambda: venues_to_dicts(venues)),
+        ]
+        if count <= SMALL_ORDER_SIZE:
+            # The pure Python ordering the app uses for short lists
+            timings.append(("distance_weighted_order (pure Python)", lambda: distance_weighted_order(venue_list, ORIGINAL_LOCATION, rng = python_rng)))
+        for name, function in timings:
+            results["{0}[{1}]".format(name, count)] = best_time(function, number, repeat)
+
+    venue = Venue({"id": details["id"], "name": details["name"], "location": details["location"],
+        "details": VenueDetails.from_response(details)})
+    def read_details():
+        # Every getter the details template calls
+        return (venue.get_hours(), venue.get_description(), venue.get_url(), venue.get_canonical_url(),
+            venue.get_rating(), venue.get_contacts())
+    results["VenueDetails.from_response"] = best_time(lambda: VenueDetails.from_response(details), number * 10, repeat)
+    results["Venue details getters"] = best_time(read_details, number * 10, repeat)
+    results["details pickled bytes (raw response)"] = len(pickle.dumps(details, protocol = pickle.HIGHEST_PROTOCOL))
+    results["details pickled bytes (VenueDetails)"] = len(pickle.dumps(venue.details, protocol = pickle.HIGHEST_PROTOCOL))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--venues", type = int, nargs = "+", default = [15, 50, 1000], help = "list sizes to benchmark")
+    parser.add_argument("--number", type = int, default = 100, help = "calls per timing")
+    parser.add_argument("--repeat", type = int, default = 5, help = "timings per measurement, the fastest is kept")
+    add_baseline_arguments(parser, "micro")
+    args = parser.parse_args()
+
+    results = run_benchmarks(load_payloads(PAYLOAD_DIR), args.venues, args.number, args.repeat)
+    for name, value in results.items():
+        if "bytes" in name:
+            print("{0:<56} {1:10d} B".format(name, value))
+        else:
+            print("{0:<56} {1:10.2f} us".format(name, 1e6 * value))
+    sys.exit(handle_baseline_arguments(args, results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Local stand-in for the Foursquare and ipdata APIs, used by the benchmarks.
+Serves recorded payloads from benchmarks/payloads when given a payload directory, and otherwise
+generates responses deterministically from the request. Every response is delayed by a
+configurable latency, and a fraction of Foursquare requests can be answered with 429. Given a
+quota, Foursquare responses report the calls left in X-RateLimit headers, and calls past it get 429.
+
+Run from the repository root to serve the mock on its own:
+    python benchmarks/mock_api.py --port 8765 --latency 0.05 --rate-limit 0.01
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# The backend package is imported from the repository root, which scripts are run from.
+sys.path.insert(0, ".")
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+# Number of venues a generated search has in total, across all pages.
+MOCK_TOTAL_RESULTS = 120
+
+def install_config():
+    # Provides placeholder API keys when backend/config.py is not available, since the mock accepts any key
+    import backend
+    try:
+        from backend import config
+    except ImportError:
+        config = types.ModuleType("backend.config")
+        config.foursquare_client_id = "mock"
+        config.foursquare_client_secret = "mock"
+        config.ipdata_api_key = "mock"
+        sys.modules["backend.config"] = backend.config = config
+
+def point_backend_at(url):
+    # Redirects the backend modules' API URLs to a mock server at url
+    install_config()
+    from backend import get_current_location, search_for_venues
+    get_current_location.IP_ECHO_URL = "".join([url, "/raw"])
+    get_current_location.IPDATA_API_URL = "".join([url, "/ipdata/"])
+    search_for_venues.FOURSQUARE_API_URL = "".join([url, "/v2/venues/"])
+
+def load_payloads(payload_dir):
+    # Returns dictionary of recorded responses in payload_dir, keyed by file name without extension
+    payloads = {}
+    for filename in sorted(os.listdir(payload_dir)):
+        if filename.endswith(".json"):
+            with open(os.path.join(payload_dir, filename), "r") as f:
+                payloads[filename[:-len(".json")]] = json.load(f)
+    return payloads
+
+def page(items, params):
+    # Returns the slice of items selected by the offset and limit params
+    offset = int(params.get("offset", ["0"])[0])
+    limit = int(params.get("limit", [str(len(items))])[0])
+    return items[offset:offset + limit]
+
+def explore_payload(params, total = MOCK_TOTAL_RESULTS):
+    # Returns an explore response with a page of total venues scattered around the requested ll
+    lat, lng = [float(coord) for coord in params.get("ll", ["37.87,-122.27"])[0].split(",")]
+    query = params.get("query", ["venue"])[0]
+    rng = random.Random("|".join([params.get("ll", [""])[0], query, params.get("radius", [""])[0]]))
+    items = []
+    for i in range(total):
+        venue_lat = lat + rng.uniform(-0.05, 0.05)
+        venue_lng = lng + rng.uniform(-0.05, 0.05)
+        items.append({"venue": {
+            "id": "mock{0:08x}".format(rng.getrandbits(32)),
+            "name": "{0} #{1}".format(query.title(), i),
+            "location": {"lat": venue_lat, "lng": venue_lng, "formattedAddress": ["{0} Mock St".format(i), "Berkeley, CA", "United States"]},
+            "categories": [{"name": "Coffee Shop"}]
+        }})
+    return {"meta": {"code": 200}, "response": {"totalResults": total, "groups": [{"items": page(items, params)}]}}
+
+def details_payload(venue_id):
+    # Returns a details response for venue_id
+    return {"meta": {"code": 200}, "response": {"venue": {
+        "id": venue_id,
+        "description": "A mock venue.",
+        "url": "https://example.com/{0}".format(venue_id),
+        "canonicalUrl": "https://foursquare.com/v/{0}".format(venue_id),
+        "rating": 7.5,
+        "contact": {"phone": "5105550100", "formattedPhone": "(510) 555-0100", "twitter": "mock"},
+        "hours": {"timeframes": [{"days": "Mon–Sun", "open": [{"renderedTime": "7:00 AM–10:00 PM"}]}]}
+    }}}
+
+def ipdata_payload(ip_address):
+    # Returns an ipdata lookup response for ip_address
+    return {"ip": ip_address, "city": "Berkeley", "country_name": "United States", "latitude": 37.8716,
+        "longitude": -122.2727, "postal": "94704", "region": "California",
+        "time_zone": {"name": "America/Los_Angeles", "current_time": "2020-05-01T12:00:00.000000-07:00"}}
+
+class MockAPI:
+    """
+    Threaded HTTP server answering explore, details, ipdata and IP echo requests.
+    Every response is delayed by latency seconds to stand in for network and API time, and
+    Foursquare requests are answered with 429 with probability rate_limit, or once quota calls have been made.
+    """
+    def __init__(self, latency = 0.05, port = 0, rate_limit = 0.0, payload_dir = None, seed = 0, quota = None):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.quota = quota
+        self.payloads = load_payloads(payload_dir) if payload_dir else {}
+        self.counts = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+                status, body, headers = api.respond(parsed.path, params)
+                time.sleep(api.latency)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{0}".format(self.server.server_port)
+
+    def respond(self, path, params):
+        # Returns (status, body, headers) of the response to a GET of path
+        if path == "/raw":
+            kind, payload = "ip.42.pl", None
+        elif path == "/v2/venues/explore":
+            kind = "explore"
+            payload = copy.deepcopy(self.payloads["explore"]) if "explore" in self.payloads else explore_payload(params)
+            if "explore" in self.payloads:
+                group = payload["response"]["groups"][0]
+                group["items"] = page(group["items"], params)
+        elif path.startswith("/v2/venues/"):
+            kind = "details"
+            venue_id = path.rsplit("/", 1)[-1]
+            payload = copy.deepcopy(self.payloads["details"]) if "details" in self.payloads else details_payload(venue_id)
+            payload["response"]["venue"]["id"] = venue_id
+        elif path.startswith("/ipdata/"):
+            kind = "ipdata"
+            ip_address = path.rsplit("/", 1)[-1]
+            payload = copy.deepcopy(self.payloads["ipdata"]) if "ipdata" in self.payloads else ipdata_payload(ip_address)
+            payload["ip"] = ip_address
+        else:
+            return 404, b"{}", {"Content-Type": "application/json"}
+        headers = {"Content-Type": "application/json"}
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            foursquare = kind in ("explore", "details")
+            limited = foursquare and self._rng.random() < self.rate_limit
+            if foursquare and self.quota is not None:
+                used = self.counts.get("explore", 0) + self.counts.get("details", 0)
+                limited = limited or used > self.quota
+                headers["X-RateLimit-Limit"] = str(self.quota)
+                headers["X-RateLimit-Remaining"] = str(max(self.quota - used, 0))
+            if limited:
+                self.counts["429"] = self.counts.get("429", 0) + 1
+        if limited:
+            body = json.dumps({"meta": {"code": 429, "errorType": "quota_exceeded"}, "response": {}}).encode()
+            headers["Retry-After"] = "3600"
+            return 429, body, headers
+        if payload is None:
+            return 200, b"8.8.8.8", {"Content-Type": "text/plain"}
+        return 200, json.dumps(payload).encode(), headers
+
+    def start(self):
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def point_backend_at_mock(self):
+        # Redirects the backend modules' API URLs to this server
+        point_backend_at(self.url)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--latency", type = float, default = 0.05, help = "seconds to wait before each response")
+    parser.add_argument("--rate-limit", type = float, default = 0.0, help = "fraction of Foursquare requests answered with 429")
+    parser.add_argument("--quota", type = int, help = "Foursquare calls allowed before every request gets 429")
+    parser.add_argument("--generated", action = "store_true", help = "generate payloads instead of serving benchmarks/payloads")
+    args = parser.parse_args()
+    api = MockAPI(args.latency, args.port, args.rate_limit, None if args.generated else PAYLOAD_DIR, quota = args.quota)
+    print("Mock API listening on {0}".format(api.url))
+    api.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Cold-start benchmark of the app: time to import it, the modules the import loads, and time from
+starting a server process until it answers the first page and the first search, against the mock
+API. Every run starts fresh processes, and the median of the runs is reported.
+
+Run from the repository root:
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --importtime 15
+To compare with another layout, eg. the previous commit, check it out in its own directory and save
+its results as the baseline, then compare this tree with it:
+    git worktree add /tmp/previous HEAD~1
+    python benchmarks/startup.py --app-dir /tmp/previous --save-baseline
+    python benchmarks/startup.py --compare
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, "./benchmarks")
+from baselines import add_baseline_arguments, handle_baseline_arguments
+from load import csrf_token
+from mock_api import MockAPI
+
+import numpy as np
+import requests
+
+# Run in a fresh interpreter in the app's directory. Placeholder API keys are registered under the
+# module names of both the backend package and the older layout with backend on sys.path.
+IMPORT_SCRIPT = """
+import os, sys, time, types
+if not os.path.exists(os.path.join("backend", "config.py")):
+    config = types.ModuleType("config")
+    config.foursquare_client_id = config.foursquare_client_secret = config.ipdata_api_key = "mock"
+    sys.modules["config"] = sys.modules["backend.config"] = config
+start = time.perf_counter()
+import application
+print(time.perf_counter() - start, int("numpy" in sys.modules), int("httpx" in sys.modules), len(sys.modules))
+"""
+
+def time_import(app_dir):
+    # Imports the app in a new interpreter. Returns seconds to import it, seconds for the whole process,
+    # and whether NumPy and httpx were loaded and how many modules were (tuple)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd = app_dir, check = True,
+        stdout = subprocess.PIPE, universal_newlines = True).stdout.split()
+    process_seconds = time.perf_counter() - start
+    return float(output[0]), process_seconds, output[1] == "1", output[2] == "1", int(output[3])
+
+def largest_imports(app_dir, count):
+    # Returns the count imports with the largest cumulative time when importing the app (list of (seconds, name))
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT], cwd = app_dir, check = True,
+        stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, universal_newlines = True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]) / 1e6, fields[2].rstrip()))
+    return sorted(imports, reverse = True)[:count]
+
+def time_first_requests(app_dir, mock_url, port):
+    # Starts the development server on the app, with empty caches, and waits for it to answer. Returns seconds from
+    # starting it until the first page was served, and the time the first search then took (tuple)
+    instance_dir = tempfile.mkdtemp(prefix = "startup-")
+    env = dict(os.environ, MOCK_API_URL = mock_url, PORT = str(port), INSTANCE_DIR = instance_dir)
+    url = "http://127.0.0.1:{0}/".format(port)
+    http = requests.Session()
+    http.headers["X-Forwarded-For"] = "8.8.8.8"
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "benchmarks/load_app.py"], cwd = app_dir, env = env,
+        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("App exited with status {0}".format(process.returncode))
+            if time.perf_counter() - start > 30:
+                raise RuntimeError("App did not start within 30 seconds")
+            try:
+                response = http.get(url, timeout = 5)
+                if response.status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.005)
+        first_response = time.perf_counter() - start
+        search_start = time.perf_counter()
+        http.post(url, data = {"csrf_token": csrf_token(response.text), "query": "coffee", "radius": 5,
+            "submit": "Give me some suggestions!"}, timeout = 30).raise_for_status()
+        return first_response, time.perf_counter() - search_start
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(instance_dir, ignore_errors = True)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type = int, default = 5, help = "fresh processes measured for each step")
+    parser.add_argument("--app-dir", default = ".", help = "repository checkout whose app is measured")
+    parser.add_argument("--importtime", type = int, metavar = "N", help = "also list the N slowest imports")
+    parser.add_argument("--port", type = int, default = 8002)
+    add_baseline_arguments(parser, "startup")
+    args = parser.parse_args()
+
+    imports = [time_import(args.app_dir) for _ in range(args.runs)]
+    api = MockAPI(0.0).start()
+    try:
+        requests_timed = [time_first_requests(args.app_dir, api.url, args.port) for _ in range(args.runs)]
+    finally:
+        api.stop()
+
+    results = {
+        "import_seconds": float(np.median([run[0] for run in imports])),
+        "import_process_seconds": float(np.median([run[1] for run in imports])),
+        "first_response_seconds": float(np.median([run[0] for run in requests_timed])),
+        "first_search_seconds": float(np.median([run[1] for run in requests_timed])),
+        "modules_loaded": imports[0][4]
+    }
+    print("{0:<32} {1:10.1f} ms".format("import application", 1000 * results["import_seconds"]))
+    print("{0:<32} {1:10.1f} ms".format("python -c 'import application'", 1000 * results["import_process_seconds"]))
+    print("{0:<32} {1:10.1f} ms".format("start to first page", 1000 * results["first_response_seconds"]))
+    print("{0:<32} {1:10.1f} ms".format("first search", 1000 * results["first_search_seconds"]))
+    print("Import loads {0} modules; NumPy {1}, httpx {2}".format(results["modules_loaded"],
+        "loaded" if imports[0][2] else "not loaded", "loaded" if imports[0][3] else "not loaded"))
+    if args.importtime:
+        print("Slowest imports (cumulative):")
+        for seconds, name in largest_imports(args.app_dir, args.importtime):
+            print("  {0:8.1f} ms {1}".format(1000 * seconds, name))
+    sys.exit(handle_baseline_arguments(args, results))
+
+if __name__ == "__main__":
+    main()
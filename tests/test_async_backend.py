@@ -0,0 +1,105 @@
+"""
+Tests of the async backend: it searches the local venue index as SEARCH_MODE says, like the sync
+backend, and does not block its event loop on the rate limiter.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import pytest
+from backend import async_backend, search_for_venues
+from backend.cache import MemoryCache
+from backend.rate_limiter import INTERACTIVE, PREFETCH, SQLiteRateLimiter
+from backend.venue_index import VenueIndex
+
+PAYLOAD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "payloads", "explore.json")
+LOCATION_DATA = {"latitude": 37.8716, "longitude": -122.2727, "city": "Berkeley", "timestamp": "2020-06-01T12:00:00-07:00"}
+
+@pytest.fixture
+def explore_items():
+    with open(PAYLOAD_PATH, "r") as f:
+        return json.load(f)["response"]["groups"][0]["items"]
+
+@pytest.fixture
+def remote_calls(monkeypatch, explore_items):
+    # Replaces explore requests with a list of the queries searched, answered from the recorded payload or
+    # with "API Usage Exceeded" if the list's first element is set to fail
+    calls = [False]
+    index = VenueIndex()
+    index.add_explore_items(explore_items)
+    async def fake_nearby_venues(location_data, query, radius = 16000, limit = 50, offset = 0):
+        calls.append(query)
+        if calls[0]:
+            return "API Usage Exceeded"
+        return search_for_venues.explore_items_to_venues(explore_items[:limit])
+    monkeypatch.setattr(async_backend, "nearby_venues", fake_nearby_venues)
+    monkeypatch.setattr(search_for_venues, "venue_index", index)
+    return calls
+
+def search(query, search_mode):
+    return async_backend.run(async_backend.keyword_nearby_venues(LOCATION_DATA, query, 16000, 10, search_mode))
+
+def test_local_mode_does_not_call_foursquare(remote_calls):
+    venues = search("coffee", "local")
+    assert len(venues) > 0
+    assert remote_calls[1:] == []
+
+def test_fallback_mode_uses_index_when_foursquare_fails(remote_calls):
+    remote_calls[0] = True
+    venues = search("coffee", "fallback")
+    assert venues != "API Usage Exceeded" and len(venues) > 0
+    assert remote_calls[1:] == ["coffee"]
+
+def test_remote_mode_does_not_use_index(remote_calls):
+    remote_calls[0] = True
+    assert search("coffee", "remote") == "API Usage Exceeded"
+
+def test_merge_mode_adds_index_venues(remote_calls, explore_items, monkeypatch):
+    # Foursquare finds fewer venues than the limit, so the rest come from the index
+    async def few_nearby_venues(location_data, query, radius = 16000, limit = 50, offset = 0):
+        return search_for_venues.explore_items_to_venues(explore_items[:3])
+    monkeypatch.setattr(async_backend, "nearby_venues", few_nearby_venues)
+    venues = search("coffee", "merge")
+    assert venues.ids[:3] == [item["venue"]["id"] for item in explore_items[:3]]
+    assert len(venues) > 3
+
+def test_search_uses_search_mode(remote_calls, monkeypatch):
+    monkeypatch.setattr(search_for_venues, "SEARCH_MODE", "local")
+    venues = async_backend.run(async_backend.search(LOCATION_DATA, "coffee, tea", 16000, (37.8716, -122.2727), detail_count = 0))
+    assert len(venues) > 0
+    assert remote_calls[1:] == []
+
+def test_sqlite_limiter_runs_off_the_event_loop(tmp_path, monkeypatch):
+    limiter = SQLiteRateLimiter(str(tmp_path / "ratelimit.sqlite3"))
+    threads = []
+    try_acquire = limiter.try_acquire
+    def recording_try_acquire(priority):
+        threads.append(threading.current_thread().name)
+        return try_acquire(priority)
+    monkeypatch.setattr(limiter, "try_acquire", recording_try_acquire)
+    assert async_backend.run(async_backend.acquire(limiter, INTERACTIVE))
+    assert threads and threads[0] != "async-backend"
+
+def test_search_does_not_wait_for_prefetches(remote_calls, monkeypatch):
+    monkeypatch.setattr(search_for_venues, "SEARCH_MODE", "remote")
+    monkeypatch.setattr(search_for_venues, "details_cache", MemoryCache())
+    fetched = []
+    async def slow_get_details(venue, priority = INTERACTIVE):
+        if priority == PREFETCH:
+            await asyncio.sleep(0.5)
+        fetched.append((venue.get_id(), priority))
+    monkeypatch.setattr(async_backend, "get_details", slow_get_details)
+    start = time.perf_counter()
+    venues = async_backend.run(async_backend.search(LOCATION_DATA, "coffee", 16000, (37.8716, -122.2727), detail_count = 4))
+    assert time.perf_counter() - start < 0.4
+    assert fetched == [(venues[0].get_id(), INTERACTIVE)]
+    # Prefetched venues are in flight, so the sync backend does not fetch them again
+    assert search_for_venues.claim_prefetches(venues, 1, 3) == []
+    time.sleep(0.7)
+    assert sorted(fetched[1:]) == sorted((venue.get_id(), PREFETCH) for venue in venues[1:4])
+    claimed = search_for_venues.claim_prefetches(venues, 1, 3)
+    assert len(claimed) == 3
+    for venue in claimed:
+        search_for_venues.release_prefetch(venue)
@@ -0,0 +1,44 @@
+"""
+Tests that a suggestion batch returns by its deadline, with an error for each search whose explore
+call had not finished.
+"""
+
+import json
+import os
+import threading
+import time
+import pytest
+from backend import batch_suggest, search_for_venues
+
+PAYLOAD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "payloads", "explore.json")
+
+def search(query, latitude = 37.8716):
+    return {"latitude": latitude, "longitude": -122.2727, "query": query, "radius": 5000}
+
+@pytest.fixture
+def slow_queries(monkeypatch):
+    # Answers explore requests from the recorded payload, holding those for queries in the returned set until released
+    with open(PAYLOAD_PATH, "r") as f:
+        items = json.load(f)["response"]["groups"][0]["items"]
+    slow = set()
+    release = threading.Event()
+    def fake_nearby_venues(location_data, query, radius = 16000, limit = 50, offset = 0, priority = None):
+        if query in slow:
+            release.wait(5)
+        return search_for_venues.explore_items_to_venues(items[:limit])
+    monkeypatch.setattr(search_for_venues, "nearby_venues", fake_nearby_venues)
+    yield slow
+    release.set()
+
+def test_batch_returns_finished_searches_by_deadline(slow_queries):
+    slow_queries.add("tacos")
+    start = time.monotonic()
+    results = batch_suggest.suggest_batch([search("coffee"), search("tacos"), search("pizza")], limit = 3, rng = 0, deadline = 0.5)
+    assert time.monotonic() - start < 2
+    assert len(results[0]["venues"]) == 3
+    assert results[1] == {"error": "Batch deadline exceeded"}
+    assert len(results[2]["venues"]) == 3
+
+def test_batch_within_deadline_has_no_errors(slow_queries):
+    results = batch_suggest.suggest_batch([search("coffee"), search("coffee", latitude = 37.9)], limit = 5, rng = 0, deadline = 5)
+    assert [len(result["venues"]) for result in results] == [5, 5]
@@ -0,0 +1,125 @@
+"""
+Tests of the shared HTTP client's retries, timeouts and latency metrics against a local stub server.
+"""
+
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from backend import http_client
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Answers each request with the next scripted (status, headers, delay) for its path, repeating the last one
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        with self.server.lock:
+            self.server.hits[path] += 1
+            script = self.server.scripts[path]
+            status, headers, delay = script.pop(0) if len(script) > 1 else script[0]
+        time.sleep(delay)
+        body = b'{"ok": true}'
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = Counter()
+    server.scripts = {}
+    server.url = "http://127.0.0.1:{0}".format(server.server_address[1])
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(autouse = True)
+def fresh_client(monkeypatch):
+    # Starts every test with a full retry budget, no recorded latencies and short backoff delays
+    monkeypatch.setattr(http_client, "_retry_tokens", http_client.RETRY_BUDGET_MAX)
+    monkeypatch.setattr(http_client, "_metrics", {})
+    monkeypatch.setattr(http_client, "BACKOFF_SECONDS", 0.01)
+
+def test_retries_server_errors(stub):
+    stub.scripts["/flaky"] = [(503, {}, 0.0), (500, {}, 0.0), (200, {}, 0.0)]
+    response = http_client.get(stub.url + "/flaky", endpoint = "flaky")
+    assert response.status_code == 200
+    assert stub.hits["/flaky"] == 3
+
+def test_returns_last_response_after_max_retries(stub):
+    stub.scripts["/down"] = [(502, {}, 0.0)]
+    response = http_client.get(stub.url + "/down", endpoint = "down", max_retries = 1)
+    assert response.status_code == 502
+    assert stub.hits["/down"] == 2
+
+def test_does_not_retry_client_errors(stub):
+    stub.scripts["/missing"] = [(404, {}, 0.0)]
+    assert http_client.get(stub.url + "/missing").status_code == 404
+    assert stub.hits["/missing"] == 1
+
+def test_retries_429_with_short_retry_after(stub):
+    stub.scripts["/limited"] = [(429, {"Retry-After": "0.1"}, 0.0), (200, {}, 0.0)]
+    start = time.perf_counter()
+    response = http_client.get(stub.url + "/limited")
+    assert response.status_code == 200
+    assert stub.hits["/limited"] == 2
+    assert time.perf_counter() - start >= 0.1
+
+def test_returns_429_with_long_retry_after(stub):
+    stub.scripts["/limited"] = [(429, {"Retry-After": str(http_client.MAX_RETRY_AFTER + 60)}, 0.0), (200, {}, 0.0)]
+    start = time.perf_counter()
+    response = http_client.get(stub.url + "/limited")
+    assert response.status_code == 429
+    assert stub.hits["/limited"] == 1
+    assert time.perf_counter() - start < 1.0
+
+def test_stops_retrying_when_budget_is_spent(stub, monkeypatch):
+    stub.scripts["/down"] = [(503, {}, 0.0)]
+    monkeypatch.setattr(http_client, "_retry_tokens", 0.0)
+    monkeypatch.setattr(http_client, "RETRY_BUDGET_RATIO", 0.5)
+    # The first request deposits half a token, which is not enough for a retry, and the second completes one
+    assert http_client.get(stub.url + "/down").status_code == 503
+    assert stub.hits["/down"] == 1
+    assert http_client.get(stub.url + "/down").status_code == 503
+    assert stub.hits["/down"] == 3
+
+def test_raises_timeout_after_retries(stub):
+    stub.scripts["/slow"] = [(200, {}, 0.5)]
+    with pytest.raises(requests.Timeout):
+        http_client.get(stub.url + "/slow", endpoint = "slow", timeout = (1.0, 0.1), max_retries = 1)
+    assert stub.hits["/slow"] == 2
+    assert http_client.latency_metrics()["slow"]["errors"] == 2
+
+def test_retries_timeout(stub):
+    stub.scripts["/slow"] = [(200, {}, 0.5), (200, {}, 0.0)]
+    response = http_client.get(stub.url + "/slow", timeout = (1.0, 0.1))
+    assert response.status_code == 200
+    assert stub.hits["/slow"] == 2
+
+def test_latency_metrics(stub):
+    stub.scripts["/ok"] = [(200, {}, 0.05)]
+    stub.scripts["/flaky"] = [(500, {}, 0.0), (200, {}, 0.0)]
+    for _ in range(3):
+        http_client.get(stub.url + "/ok", endpoint = "ok")
+    http_client.get(stub.url + "/flaky", endpoint = "flaky")
+    metrics = http_client.latency_metrics()
+    assert metrics["ok"]["count"] == 3
+    assert metrics["ok"]["errors"] == 0
+    assert metrics["ok"]["max_seconds"] >= 0.05
+    assert metrics["ok"]["mean_seconds"] == pytest.approx(metrics["ok"]["total_seconds"] / 3)
+    assert metrics["flaky"]["count"] == 2
+    assert metrics["flaky"]["errors"] == 1
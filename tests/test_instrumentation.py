@@ -0,0 +1,33 @@
+"""
+Tests of the metric registry.
+"""
+
+import threading
+from backend import instrumentation
+from backend.instrumentation import counter, histogram, increment
+
+def test_metrics_are_created_once(monkeypatch):
+    created = []
+    original = instrumentation.Counter
+    def counting_counter(*args):
+        created.append(args)
+        return original(*args)
+    monkeypatch.setattr(instrumentation, "Counter", counting_counter)
+    monkeypatch.setattr(instrumentation, "_metrics", {})
+    for _ in range(100):
+        increment("test_total", {"result": "hit"})
+    assert len(created) == 1
+    assert counter("test_total") is counter("test_total")
+    assert histogram("test_seconds") is histogram("test_seconds")
+
+def test_concurrent_increments_share_one_counter(monkeypatch):
+    monkeypatch.setattr(instrumentation, "_metrics", {})
+    def work():
+        for _ in range(1000):
+            increment("test_concurrent_total")
+    threads = [threading.Thread(target = work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "venue_suggester_test_concurrent_total 8000" in counter("test_concurrent_total").render()
@@ -0,0 +1,102 @@
+"""
+Tests of the weighted orderings, compared with the np.random.choice loop distance_weighted_order
+used before it drew exponential keys.
+"""
+
+import itertools
+import random
+from collections import Counter
+import numpy as np
+from backend.ordering import segmented_weighted_order_indices, small_weighted_order_indices, weighted_order_indices
+
+WEIGHTS = [0.4, 0.3, 0.2, 0.1]
+SAMPLES = 20000
+# Critical value of the chi-square distribution with 23 degrees of freedom (24 orderings of 4
+# indices) at a significance level of 0.001.
+CHI_SQUARE_CRITICAL = 49.73
+
+def choice_order_indices(p, rng):
+    # Returns an ordering drawn like the original distance_weighted_order: one np.random.choice per
+    # position, renormalizing the remaining weights after every pick (list)
+    remaining = dict(enumerate(p))
+    order = []
+    while remaining:
+        index = rng.choice(list(remaining.keys()), p = list(remaining.values()))
+        order.append(int(index))
+        last_weight = remaining.pop(index)
+        remaining = dict(zip(remaining.keys(), np.array(list(remaining.values())) / (1 - last_weight)))
+    return order
+
+def chi_square(counts, expected_counts):
+    # Returns the two-sample chi-square statistic of two Counters of orderings with the same number of samples (float)
+    statistic = 0.0
+    for ordering in itertools.permutations(range(len(WEIGHTS))):
+        observed, expected = counts[ordering], expected_counts[ordering]
+        if observed + expected:
+            statistic += (observed - expected) ** 2 / float(observed + expected)
+    return statistic
+
+def ordering_probability(p, ordering):
+    # Returns the exact probability of drawing ordering by weighted selection without replacement (float)
+    probability, left = 1.0, float(sum(p))
+    for i in ordering:
+        probability *= p[i] / left
+        left -= p[i]
+    return probability
+
+def test_matches_choice_loop():
+    rng = np.random.default_rng(0)
+    counts = Counter(tuple(weighted_order_indices(WEIGHTS, rng)) for _ in range(SAMPLES))
+    choice_counts = Counter(tuple(choice_order_indices(WEIGHTS, rng)) for _ in range(SAMPLES))
+    assert chi_square(counts, choice_counts) < CHI_SQUARE_CRITICAL
+
+def test_matches_exact_probabilities():
+    rng = np.random.default_rng(1)
+    counts = Counter(tuple(weighted_order_indices(WEIGHTS, rng)) for _ in range(SAMPLES))
+    for ordering in itertools.permutations(range(len(WEIGHTS))):
+        assert abs(counts[ordering] / SAMPLES - ordering_probability(WEIGHTS, ordering)) < 0.01
+
+def test_small_matches_choice_loop():
+    python_rng = random.Random(2)
+    counts = Counter(tuple(small_weighted_order_indices(WEIGHTS, python_rng)) for _ in range(SAMPLES))
+    rng = np.random.default_rng(2)
+    choice_counts = Counter(tuple(choice_order_indices(WEIGHTS, rng)) for _ in range(SAMPLES))
+    assert chi_square(counts, choice_counts) < CHI_SQUARE_CRITICAL
+
+def test_segments_are_ordered_independently():
+    rng = np.random.default_rng(3)
+    offsets = [0, len(WEIGHTS), 2 * len(WEIGHTS)]
+    counts = Counter()
+    for _ in range(SAMPLES):
+        order = segmented_weighted_order_indices(WEIGHTS + WEIGHTS, offsets, rng)
+        assert sorted(order[len(WEIGHTS):]) == list(range(len(WEIGHTS), 2 * len(WEIGHTS)))
+        counts[tuple(order[:len(WEIGHTS)])] += 1
+    choice_counts = Counter(tuple(choice_order_indices(WEIGHTS, rng)) for _ in range(SAMPLES))
+    assert chi_square(counts, choice_counts) < CHI_SQUARE_CRITICAL
+
+def test_zero_weights_are_last():
+    rng = np.random.default_rng(4)
+    python_rng = random.Random(4)
+    p = [0.0, 0.5, 0.0, 0.5, 0.0]
+    first_zero = Counter()
+    for _ in range(1000):
+        for order in (list(weighted_order_indices(p, rng)), small_weighted_order_indices(p, python_rng)):
+            assert sorted(order[:2]) == [1, 3]
+            assert sorted(order[2:]) == [0, 2, 4]
+            first_zero[order[2]] += 1
+    # Zero-weight indices are shuffled rather than left in index order
+    assert set(first_zero) == {0, 2, 4}
+
+def test_all_zero_weights():
+    order = weighted_order_indices([0.0, 0.0, 0.0], np.random.default_rng(5))
+    assert sorted(order) == [0, 1, 2]
+    assert sorted(small_weighted_order_indices([0.0, 0.0, 0.0], 5)) == [0, 1, 2]
+
+def test_empty():
+    assert len(weighted_order_indices([], np.random.default_rng(6))) == 0
+    assert small_weighted_order_indices([], 6) == []
+    assert len(segmented_weighted_order_indices([], [0], np.random.default_rng(6))) == 0
+
+def test_seeded_orderings_are_reproducible():
+    assert list(weighted_order_indices(WEIGHTS, 7)) == list(weighted_order_indices(WEIGHTS, 7))
+    assert small_weighted_order_indices(WEIGHTS, 7) == small_weighted_order_indices(WEIGHTS, 7)
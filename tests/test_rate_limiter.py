@@ -0,0 +1,67 @@
+"""
+Tests of the rate limiter's daily quota and its pacing of batch and prefetch calls.
+"""
+
+import pytest
+from backend.rate_limiter import BATCH, INTERACTIVE, PREFETCH, MemoryRateLimiter, SQLiteRateLimiter
+
+@pytest.fixture(params = ["memory", "sqlite"])
+def make_limiter(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "sqlite":
+            return SQLiteRateLimiter(str(tmp_path / "ratelimit.sqlite3"), **kwargs)
+        return MemoryRateLimiter(**kwargs)
+    return make
+
+def test_interactive_calls_are_not_paced(make_limiter):
+    limiter = make_limiter(daily_quota = 2000, capacity = 10)
+    for _ in range(1000):
+        assert limiter.try_acquire(INTERACTIVE) == (True, 0.0)
+
+def test_background_calls_are_paced(make_limiter):
+    limiter = make_limiter(daily_quota = 2000, capacity = 10)
+    admitted = sum(limiter.try_acquire(PREFETCH)[0] for _ in range(20))
+    # Prefetches leave a quarter of the bucket for interactive and batch calls
+    assert 0 < admitted < 10
+    granted, wait = limiter.try_acquire(PREFETCH)
+    assert not granted and wait > 0
+    assert limiter.try_acquire(BATCH)[0]
+    assert limiter.try_acquire(INTERACTIVE)[0]
+
+def test_background_calls_yield_to_interactive_calls(make_limiter):
+    limiter = make_limiter(daily_quota = 2000, capacity = 10)
+    for _ in range(10):
+        limiter.try_acquire(INTERACTIVE)
+    assert not limiter.try_acquire(BATCH)[0]
+    assert not limiter.try_acquire(PREFETCH)[0]
+
+def test_daily_quota_is_the_hard_limit(make_limiter):
+    limiter = make_limiter(daily_quota = 100, capacity = 1000)
+    assert sum(limiter.try_acquire(BATCH)[0] for _ in range(100)) == 90
+    assert sum(limiter.try_acquire(INTERACTIVE)[0] for _ in range(100)) == 10
+    assert limiter.try_acquire(INTERACTIVE) == (False, None)
+    assert not limiter.acquire(INTERACTIVE)
+
+def test_reported_quota(make_limiter):
+    limiter = make_limiter(daily_quota = 1000, capacity = 1000)
+    limiter.observe(200, {"X-RateLimit-Remaining": "20", "X-RateLimit-Limit": "100"})
+    # Prefetches leave 25 calls of the reported limit, and batch calls 10
+    assert not limiter.allows(PREFETCH)
+    assert sum(limiter.try_acquire(BATCH)[0] for _ in range(20)) == 10
+    assert sum(limiter.try_acquire(INTERACTIVE)[0] for _ in range(20)) == 10
+    assert limiter.try_acquire(INTERACTIVE) == (False, None)
+
+def test_429_blocks_every_priority(make_limiter):
+    limiter = make_limiter()
+    limiter.observe(429, {"Retry-After": "60"})
+    for priority in (INTERACTIVE, BATCH, PREFETCH):
+        assert limiter.try_acquire(priority) == (False, None)
+
+def test_quota_count_starts_again_each_day(make_limiter, monkeypatch):
+    now = [86400.0 * 20000 + 100]
+    monkeypatch.setattr("backend.rate_limiter.time.time", lambda: now[0])
+    limiter = make_limiter(daily_quota = 10)
+    assert sum(limiter.try_acquire(INTERACTIVE)[0] for _ in range(20)) == 10
+    now[0] += 86400
+    assert limiter.try_acquire(INTERACTIVE)[0]
+    assert limiter.status()["used"] == 1
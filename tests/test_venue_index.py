@@ -0,0 +1,54 @@
+"""
+Tests that the venue index stays within max_entries by evicting its oldest cells, and that a saved
+index is reloaded in the same state.
+"""
+
+from backend.utils import geohash_encode
+from backend.venue_index import GRID_PRECISION, VenueIndex
+
+def venue(venue_id, lat, lng, name = "Cafe"):
+    return {"id": venue_id, "name": name, "location": {"lat": lat, "lng": lng}, "categories": [{"name": "Coffee Shop"}]}
+
+# Centers of three cells far enough apart to never share one
+CELLS = [(37.87, -122.27), (40.71, -74.0), (51.5, -0.12)]
+
+def test_oldest_cells_are_evicted_first():
+    index = VenueIndex(max_entries = 4)
+    for cell, (lat, lng) in enumerate(CELLS):
+        index.add(venue("{0}a".format(cell), lat, lng))
+        index.add(venue("{0}b".format(cell), lat + 0.001, lng))
+    assert len(index) == 4
+    assert set(index.venues) == {"1a", "1b", "2a", "2b"}
+    assert geohash_encode(CELLS[0][0], CELLS[0][1], GRID_PRECISION) not in index.grid
+    assert "0a" not in index.tokens["cafe"]
+    assert len(index.search(CELLS[0][0], CELLS[0][1], "coffee", 1000)) == 0
+    assert len(index.search(CELLS[2][0], CELLS[2][1], "coffee", 1000)) == 2
+
+def test_adding_to_a_cell_keeps_it():
+    index = VenueIndex(max_entries = 4)
+    index.add(venue("0a", *CELLS[0]))
+    index.add(venue("1a", *CELLS[1]))
+    index.add(venue("0b", CELLS[0][0] + 0.001, CELLS[0][1]))
+    index.add(venue("2a", *CELLS[2]))
+    index.add(venue("2b", CELLS[2][0] + 0.001, CELLS[2][1]))
+    assert set(index.venues) == {"0a", "0b", "2a", "2b"}
+
+def test_saved_index_is_reloaded(tmp_path):
+    filename = str(tmp_path / "venues.json")
+    index = VenueIndex()
+    index.autosave(filename)
+    for cell, (lat, lng) in enumerate(CELLS):
+        index.add(venue(str(cell), lat, lng, name = "Taqueria {0}".format(cell)))
+    index.save()
+    reloaded = VenueIndex(max_entries = 2)
+    assert reloaded.import_json(filename) == 2
+    # Cells are saved oldest first, so the reloaded index evicts the same cells the saved one would have
+    assert set(reloaded.venues) == {"1", "2"}
+    assert [venue.name for venue in reloaded.search(CELLS[1][0], CELLS[1][1], "taqueria", 1000)] == ["Taqueria 1"]
+
+def test_save_skips_unchanged_index(tmp_path):
+    filename = tmp_path / "venues.json"
+    index = VenueIndex()
+    index.autosave(str(filename))
+    index.save()
+    assert not filename.exists()
@@ -0,0 +1,41 @@
+"""
+Tests of the columnar VenueList.
+"""
+
+import pickle
+from backend.utils import Venue, VenueDetails, VenueList
+
+def venue_dictionary(i):
+    return {"id": "v{0}".format(i), "name": "Venue {0}".format(i), "categories": [{"name": "Cafe"}],
+        "location": {"lat": 37.0 + i, "lng": -122.0 - i, "city": "Berkeley",
+            "formattedAddress": ["{0} Main St".format(i), "Berkeley, CA", "United States"]}}
+
+def test_keeps_rendered_fields():
+    venues = VenueList.from_dicts([venue_dictionary(i) for i in range(3)])
+    venue = venues[1]
+    assert (venue.get_id(), venue.get_name(), venue.get_latlng()) == ("v1", "Venue 1", (38.0, -123.0))
+    assert venue.get_address() == ["1 Main St", "Berkeley, CA", "United States"]
+    assert venues.record(1) == {"id": "v1", "name": "Venue 1",
+        "location": {"lat": 38.0, "lng": -123.0, "formattedAddress": ["1 Main St", "Berkeley, CA", "United States"]}}
+
+def test_missing_address():
+    venues = VenueList.from_dicts([{"id": "v", "name": "Venue", "location": {"lat": 1.0, "lng": 2.0}}])
+    assert venues[0].get_address() == []
+
+def test_details_persist_through_take_and_pickle():
+    venues = VenueList.from_dicts([venue_dictionary(i) for i in range(3)])
+    venues[2].details = VenueDetails(description = "Coffee")
+    taken = venues.take([2, 0])
+    assert taken.ids == ["v2", "v0"]
+    assert taken[0].get_description() == "Coffee"
+    assert taken[1].details is None
+    loaded = pickle.loads(pickle.dumps(venues))
+    assert loaded[2].get_description() == "Coffee"
+    assert loaded.record(0) == venues.record(0)
+
+def test_built_from_venues():
+    venue = Venue(venue_dictionary(0))
+    venue.details = VenueDetails(rating = 9.0)
+    venues = VenueList([venue])
+    assert venues[0].get_rating() == 9.0
+    assert venues[0].get_address() == venue.get_address()
@@ -0,0 +1,52 @@
+"""
+Warms the app's explore and details caches with the searches users make most often, according to
+the search log the app writes when SEARCH_LOG is enabled, and reports the explore cache hit ratio
+of logged searches before and after warming. Warming only reaches the app when its caches are
+shared, ie. EXPLORE_CACHE and DETAILS_CACHE are "sqlite" as they are by default, so the warmer
+exits with an error otherwise. With RATE_LIMITER "sqlite" it draws from the same quota as the app.
+
+Run from the repository root, eg. every few hours for the hours ahead:
+    python warm_cache.py --budget 500 --ahead 3
+Searches in the last --holdout fraction of the log are not used for ranking, so the hit ratio
+on them estimates the ratio users will see.
+"""
+
+import argparse
+import sys
+from application import app
+from backend.cache_warmer import DEFAULT_BUDGET, DETAILS_PER_SEARCH, hit_ratio, rank_searches, warm
+from backend.search_log import read_searches
+
+def format_ratio(ratio):
+    # Returns ratio as a percentage, or 'n/a' if there were no searches (string)
+    return "n/a" if ratio is None else "{0:.1%}".format(ratio)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default = app.config["SEARCH_LOG_PATH"], help = "search log to read")
+    parser.add_argument("--budget", type = int, default = DEFAULT_BUDGET, help = "most Foursquare calls to make")
+    parser.add_argument("--ahead", type = int, help = "only warm searches made at local hours within this many hours from now")
+    parser.add_argument("--details", type = int, default = DETAILS_PER_SEARCH, help = "venues of each search to fetch details for")
+    parser.add_argument("--holdout", type = float, default = 0.2, help = "fraction of the most recent searches used only to measure the hit ratio")
+    args = parser.parse_args()
+
+    if app.config["EXPLORE_CACHE"] != "sqlite" or app.config["DETAILS_CACHE"] != "sqlite":
+        print("The app's caches are per process, so warming them here would not reach the app. "
+            "Set EXPLORE_CACHE and DETAILS_CACHE to \"sqlite\".", file = sys.stderr)
+        sys.exit(1)
+    entries = read_searches(args.log)
+    split = len(entries) - int(len(entries) * args.holdout)
+    evaluated = entries[split:] if split < len(entries) else entries
+    ranked = rank_searches(entries[:split], args.ahead)
+    print("Read {0} searches from {1}, {2} distinct explore searches ranked".format(len(entries), args.log, len(ranked)))
+
+    before = hit_ratio(evaluated)
+    stats = warm(ranked, args.budget, args.details)
+    after = hit_ratio(evaluated)
+    print("Warmed {0} searches with {1} explore and {2} details calls{3}".format(stats["searches"], stats["explore_calls"],
+        stats["details_calls"], ", stopped early by the rate limit" if stats["stopped"] else ""))
+    print("Hit ratio on {0} {1}searches: {2} before warming, {3} after".format(len(evaluated),
+        "held-out " if evaluated is not entries else "", format_ratio(before), format_ratio(after)))
+
+if __name__ == "__main__":
+    main()